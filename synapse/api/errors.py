@@ -133,6 +133,8 @@ class Codes(str, Enum):
     NEXTCLOUD_CAN_NOT_ADD_MEMBERS_TO_GROUP = "W_NEXTCLOUD_CAN_NOT_ADD_MEMBERS_TO_GROUP"
     NEXTCLOUD_CAN_NOT_CREATE_GROUP = "W_NEXTCLOUD_CAN_NOT_CREATE_GROUP"
     NEXTCLOUD_CAN_NOT_SHARE = "W_NEXTCLOUD_CAN_NOT_SHARE"
+    # MSC3575: the position of a sliding sync request has expired
+    UNKNOWN_POS = "M_UNKNOWN_POS"
 
     # +watcha
 
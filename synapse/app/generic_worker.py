@@ -104,6 +104,10 @@ from synapse.storage.databases.main.transactions import TransactionWorkerStore
 from synapse.storage.databases.main.ui_auth import UIAuthWorkerStore
 from synapse.storage.databases.main.user_directory import UserDirectoryStore
 from synapse.storage.databases.main.user_erasure_store import UserErasureWorkerStore
+from synapse.storage.databases.main.watcha_mail import MailQueueStore  # watcha+
+from synapse.storage.databases.main.watcha_media import MediaUsageStore  # watcha+
+from synapse.storage.databases.main.watcha_nextcloud import NextcloudStore  # watcha+
+from synapse.storage.databases.main.watcha_sliding_sync import SlidingSyncStore  # watcha+
 from synapse.util import SYNAPSE_VERSION
 from synapse.util.httpresourcetree import create_resource_tree
 
@@ -155,6 +159,10 @@ class GenericWorkerStore(
     LockStore,
     SessionStore,
     TaskSchedulerWorkerStore,
+    MailQueueStore,  # watcha+
+    MediaUsageStore,  # watcha+
+    NextcloudStore,  # watcha+
+    SlidingSyncStore,  # watcha+
 ):
     # Properties that multiple storage classes define. Tell mypy what the
     # expected type is.
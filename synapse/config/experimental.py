@@ -421,3 +421,8 @@ class ExperimentalConfig(Config):
         self.msc4069_profile_inhibit_propagation = experimental.get(
             "msc4069_profile_inhibit_propagation", False
         )
+
+        # watcha+
+        # MSC3575: sliding sync
+        self.msc3575_enabled: bool = experimental.get("msc3575_enabled", False)
+        # +watcha
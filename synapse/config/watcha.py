@@ -5,6 +5,9 @@ from synapse.util.watcha import build_log_message
 
 from ._base import Config, ConfigError
 
+# The maximum length of the chains of state group deltas, as in the state store
+MAX_STATE_DELTA_HOPS = 100
+
 
 class WatchaConfig(Config):
 
@@ -23,6 +26,9 @@ class WatchaConfig(Config):
         self.nextcloud_service_account_password = None
         self.nextcloud_url = None
         self.external_authentication_for_partners = False
+        self.sync_timings_header = False
+        self.state_compressor_enabled = False
+        self.state_compressor_levels = [50, 25, 20]
 
     def read_config(self, config, **kwargs):
         watcha_config = config.get("watcha")
@@ -88,6 +94,36 @@ class WatchaConfig(Config):
                 nextcloud_url = urljoin(client_base_url, "nextcloud")
             self.nextcloud_url = nextcloud_url
 
+        sync_timings_header = watcha_config.get("sync_timings_header")
+        if isinstance(sync_timings_header, bool):
+            self.sync_timings_header = sync_timings_header
+
+        state_compressor_enabled = watcha_config.get("state_compressor_enabled")
+        if isinstance(state_compressor_enabled, bool):
+            self.state_compressor_enabled = state_compressor_enabled
+
+        state_compressor_levels = watcha_config.get("state_compressor_levels")
+        if state_compressor_levels is not None:
+            if (
+                not isinstance(state_compressor_levels, list)
+                or not state_compressor_levels
+                or not all(
+                    isinstance(level, int) and level > 0
+                    for level in state_compressor_levels
+                )
+                or sum(state_compressor_levels) > MAX_STATE_DELTA_HOPS
+            ):
+                raise ConfigError(
+                    build_log_message(
+                        action="get `state_compressor_levels` from config",
+                        log_vars={
+                            "state_compressor_levels": state_compressor_levels,
+                            "max_state_delta_hops": MAX_STATE_DELTA_HOPS,
+                        },
+                    )
+                )
+            self.state_compressor_levels = state_compressor_levels
+
     def generate_config_section(self, config_dir_path, server_name, **kwargs):
         return """\
         # Specific configuration for Watcha
@@ -130,4 +166,23 @@ class WatchaConfig(Config):
           # Note: The value is ignored when managed_idp is false
           #
           #external_authentication_for_partners: true
+
+          # Whether to send the time spent in each phase of the computation of /sync
+          # responses to server admins, in a Server-Timing header.
+          # Optional, defaults to false.
+          #
+          #sync_timings_header: true
+
+          # Whether to periodically compress the state groups, by rewriting their
+          # chains of deltas toward the structure of levels below.
+          # Optional, defaults to false.
+          #
+          #state_compressor_enabled: true
+
+          # The maximum lengths of the levels of the compressed chains, from the
+          # smallest deltas to the full snapshots. Their sum is the maximum number of
+          # deltas to read to get the state of a state group, and is at most 100.
+          # Optional, defaults to [50, 25, 20].
+          #
+          #state_compressor_levels: [50, 25, 20]
         """
@@ -20,10 +20,13 @@
 #
 import itertools
 import logging
+from functools import wraps  # watcha+
 from typing import (
     TYPE_CHECKING,
     AbstractSet,
     Any,
+    Awaitable,  # watcha+
+    Callable,  # watcha+
     Dict,
     FrozenSet,
     List,
@@ -32,10 +35,12 @@ from typing import (
     Sequence,
     Set,
     Tuple,
+    TypeVar,  # watcha+
 )
 
 import attr
 from prometheus_client import Counter
+from prometheus_client import Histogram  # watcha+
 
 from synapse.api.constants import (
     AccountDataTypes,
@@ -76,6 +81,7 @@ from synapse.types import (
 )
 from synapse.types.state import StateFilter
 from synapse.util.async_helpers import concurrently_execute
+from synapse.util.iterutils import batch_iter  # watcha+
 from synapse.util.caches.expiringcache import ExpiringCache
 from synapse.util.caches.lrucache import LruCache
 from synapse.util.caches.response_cache import ResponseCache, ResponseCacheContext
@@ -99,6 +105,35 @@ non_empty_sync_counter = Counter(
     ["type", "lazy_loaded"],
 )
 
+# watcha+
+# The time spent in each phase of the computation of sync responses. `type` is one of
+# "initial" (including full state syncs), "incremental" or "gappy" (incremental syncs
+# with a limited timeline in some room).
+sync_phase_histogram = Histogram(
+    "synapse_handlers_sync_phase_seconds",
+    "Time spent in each phase of the computation of sync responses. type is "
+    "initial/incremental/gappy. The time of phases computed for each room is summed "
+    "over the rooms, which are computed concurrently.",
+    ["phase", "type"],
+    buckets=(
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+        30.0,
+        60.0,
+        "+Inf",
+    ),
+)
+# +watcha
+
 # Store the cache that tracks which lazy-loaded members have been sent to a given
 # client for no more than 30 minutes.
 LAZY_LOADED_MEMBERS_CACHE_MAX_AGE = 30 * 60 * 1000
@@ -107,6 +142,44 @@ LAZY_LOADED_MEMBERS_CACHE_MAX_AGE = 30 * 60 * 1000
 # avoiding redundantly sending the same lazy-loaded members to the client
 LAZY_LOADED_MEMBERS_CACHE_MAX_SIZE = 100
 
+# watcha+
+# The maximum number of room entries generated at the same time by a sync
+ROOM_ENTRY_CONCURRENCY = 10
+
+# The maximum number of rooms whose unread counts are fetched in one transaction
+UNREAD_NOTIFS_BATCH_SIZE = 100
+
+R = TypeVar("R")
+
+
+def measure_sync_phase(
+    phase: str,
+) -> Callable[[Callable[..., Awaitable[R]]], Callable[..., Awaitable[R]]]:
+    """Decorate a method of the `SyncHandler` taking the `SyncResultBuilder` as first
+    argument, to add the time spent in it to the timings of a phase of the sync.
+    """
+
+    def wrapper(func: Callable[..., Awaitable[R]]) -> Callable[..., Awaitable[R]]:
+        @wraps(func)
+        async def measured_func(
+            self: "SyncHandler",
+            sync_result_builder: "SyncResultBuilder",
+            *args: Any,
+            **kwargs: Any,
+        ) -> R:
+            start = self.clock.time()
+            try:
+                return await func(self, sync_result_builder, *args, **kwargs)
+            finally:
+                sync_result_builder.add_phase_timing(phase, self.clock.time() - start)
+
+        return measured_func
+
+    return wrapper
+
+
+# +watcha
+
 
 SyncRequestKey = Tuple[Any, ...]
 
@@ -231,6 +304,8 @@ class SyncResult:
             for this device
         device_unused_fallback_key_types: List of key types that have an unused fallback
             key
+        sync_type: initial, incremental or gappy, as labelled in the sync metrics
+        phase_timings: Dict of phase to the seconds spent computing it
     """
 
     next_batch: StreamToken
@@ -244,6 +319,10 @@ class SyncResult:
     device_lists: DeviceListUpdates
     device_one_time_keys_count: JsonMapping
     device_unused_fallback_key_types: List[str]
+    # watcha+
+    sync_type: str = "initial"
+    phase_timings: Mapping[str, float] = attr.Factory(dict)
+    # +watcha
 
     def __bool__(self) -> bool:
         """Make the result appear empty if there are no updates. This is used
@@ -1056,6 +1135,19 @@ class SyncHandler:
             # We need to know whether the state we fetch may be partial, so check
             # whether the room is partial stated *before* fetching it.
             is_partial_state_room = await self.store.is_partial_state_room(room_id)
+            # watcha+
+            state_ids_from_groups: Optional[StateMap[str]] = None
+            if not full_state and batch.limited and batch and not is_partial_state_room:
+                assert since_token is not None
+                state_ids_from_groups = await self._compute_gappy_state_from_groups(
+                    room_id,
+                    batch,
+                    since_token,
+                    timeline_state,
+                    state_filter,
+                    lazy_load_members,
+                )
+            # +watcha
             if full_state:
                 if batch:
                     state_at_timeline_end = (
@@ -1091,6 +1183,10 @@ class SyncHandler:
                     previous_timeline_end={},
                     lazy_load_members=lazy_load_members,
                 )
+            # watcha+
+            elif state_ids_from_groups is not None:
+                state_ids = state_ids_from_groups
+            # +watcha
             elif batch.limited:
                 if batch:
                     state_at_timeline_start = (
@@ -1245,6 +1341,111 @@ class SyncHandler:
             if e.type != EventTypes.Aliases  # until MSC2261 or alternative solution
         }
 
+    # watcha+
+    async def _compute_gappy_state_from_groups(
+        self,
+        room_id: str,
+        batch: TimelineBatch,
+        since_token: StreamToken,
+        timeline_state: StateMap[str],
+        state_filter: StateFilter,
+        lazy_load_members: bool,
+    ) -> Optional[StateMap[str]]:
+        """Works out the state to return for a gappy sync from the changes of state
+        since the previous sync.
+
+        This gives the same result as the computation of `compute_state_delta`, but
+        walks the delta chains from the state group at the previous sync to the state
+        groups of the timeline, rather than loading and diffing the full state at each
+        point. The cost is then proportional to the number of state changes rather
+        than to the size of the room.
+
+        Args:
+            room_id: The room to compute the state of.
+            batch: The timeline batch for the room, which must not be empty.
+            since_token: Token of the end of the previous batch.
+            timeline_state: The contribution of the timeline to the room state.
+            state_filter: The state filter of the state at the start of the timeline,
+                when lazy loading members.
+            lazy_load_members: Whether members are lazy loaded.
+
+        Returns:
+            The state to return in the sync response for the room, or None if the
+            state groups are not linked by a short enough chain of deltas. The full
+            state must then be loaded.
+        """
+        previous_event_id = (
+            await self.store.get_last_event_in_room_before_stream_ordering(
+                room_id, end_token=since_token.room_key
+            )
+        )
+        if previous_event_id is None:
+            return None
+
+        first_event_id = batch.events[0].event_id
+        last_event_id = batch.events[-1].event_id
+        state_groups = await self._state_storage_controller.get_state_group_for_events(
+            (previous_event_id, first_event_id, last_event_id)
+        )
+        previous_group = state_groups[previous_event_id]
+        to_groups = {state_groups[last_event_id]}
+        if not lazy_load_members:
+            to_groups.add(state_groups[first_event_id])
+        deltas = await self._state_storage_controller.get_state_deltas_from_group(
+            previous_group, to_groups
+        )
+        if deltas is None:
+            return None
+
+        end_delta = deltas[state_groups[last_event_id]]
+        if lazy_load_members:
+            # As when loading the full state, the state at the start of the timeline
+            # only contains the members needed to display the timeline.
+            timeline_start = (
+                await self._state_storage_controller.get_state_ids_for_event(
+                    first_event_id, state_filter=state_filter, await_full_state=False
+                )
+            )
+        else:
+            timeline_start = deltas[state_groups[first_event_id]]
+
+        # Only the state entries which changed since the previous sync can differ
+        # from the state at the previous sync.
+        changed_keys = set(end_delta).union(timeline_start)
+        if not changed_keys:
+            return {}
+        previous_state = dict(
+            await self._state_storage_controller.get_state_ids_for_group(
+                previous_group, StateFilter.from_types(changed_keys)
+            )
+        )
+        # As in `get_state_after_event`
+        m = (await self.store.get_metadata_for_events([previous_event_id]))[
+            previous_event_id
+        ]
+        if (
+            m.state_key is not None
+            and m.rejection_reason is None
+            and (m.event_type, m.state_key) in changed_keys
+        ):
+            previous_state[(m.event_type, m.state_key)] = previous_event_id
+
+        # The state at the start and at the end of the timeline, restricted as the
+        # state at the previous sync to the entries which changed.
+        if not lazy_load_members:
+            timeline_start = {**previous_state, **timeline_start}
+        end_state = {**previous_state, **end_delta}
+
+        return _calculate_state(
+            timeline_contains=timeline_state,
+            timeline_start=timeline_start,
+            timeline_end=end_state,
+            previous_timeline_end=previous_state,
+            lazy_load_members=lazy_load_members,
+        )
+
+    # +watcha
+
     async def _find_missing_partial_state_memberships(
         self,
         room_id: str,
@@ -1374,6 +1575,38 @@ class SyncHandler:
                 sync_config.user.to_string(),
             )
 
+    # watcha+
+    async def unread_notifs_for_room_ids(
+        self, room_ids: StrCollection, sync_config: SyncConfig
+    ) -> Dict[str, RoomNotifCounts]:
+        """Get the unread counts of the syncing user in several rooms.
+
+        The rooms are fetched in batches, each in a single transaction, and the
+        batches are fetched concurrently. The counts are still computed with a few
+        queries per room within the transaction of its batch.
+        """
+        if not self.should_calculate_push_rules:
+            return {room_id: RoomNotifCounts.empty() for room_id in room_ids}
+
+        notifs: Dict[str, RoomNotifCounts] = {}
+
+        async def fetch_batch(batch: Tuple[str, ...]) -> None:
+            notifs.update(
+                await self.store.get_unread_event_push_actions_by_rooms_for_user(
+                    batch, sync_config.user.to_string()
+                )
+            )
+
+        with Measure(self.clock, "unread_notifs_for_room_ids"):
+            await concurrently_execute(
+                fetch_batch,
+                batch_iter(room_ids, UNREAD_NOTIFS_BATCH_SIZE),
+                ROOM_ENTRY_CONCURRENCY,
+            )
+        return notifs
+
+    # +watcha
+
     async def generate_sync_result(
         self,
         sync_config: SyncConfig,
@@ -1618,6 +1851,23 @@ class SyncHandler:
             }
         )
 
+        # watcha+
+        if since_token is None or full_state:
+            sync_type = "initial"
+        elif any(
+            room.timeline.limited
+            for room in itertools.chain(
+                sync_result_builder.joined, sync_result_builder.archived
+            )
+        ):
+            sync_type = "gappy"
+        else:
+            sync_type = "incremental"
+        for phase, duration in sync_result_builder.phase_timings.items():
+            sync_phase_histogram.labels(phase, sync_type).observe(duration)
+        log_kv({"sync_type": sync_type, **sync_result_builder.phase_timings})
+        # +watcha
+
         logger.debug("Sync response calculation complete")
         return SyncResult(
             presence=sync_result_builder.presence,
@@ -1631,9 +1881,14 @@ class SyncHandler:
             device_one_time_keys_count=one_time_keys_count,
             device_unused_fallback_key_types=unused_fallback_key_types,
             next_batch=sync_result_builder.now_token,
+            # watcha+
+            sync_type=sync_type,
+            phase_timings=sync_result_builder.phase_timings,
+            # +watcha
         )
 
     @measure_func("_generate_sync_entry_for_device_list")
+    @measure_sync_phase("device_list")  # watcha+
     async def _generate_sync_entry_for_device_list(
         self,
         sync_result_builder: "SyncResultBuilder",
@@ -1746,6 +2001,7 @@ class SyncHandler:
         return DeviceListUpdates(changed=users_that_have_changed, left=newly_left_users)
 
     @trace
+    @measure_sync_phase("to_device")  # watcha+
     async def _generate_sync_entry_for_to_device(
         self, sync_result_builder: "SyncResultBuilder"
     ) -> None:
@@ -1795,6 +2051,7 @@ class SyncHandler:
         else:
             sync_result_builder.to_device = []
 
+    @measure_sync_phase("account_data")  # watcha+
     async def _generate_sync_entry_for_account_data(
         self, sync_result_builder: "SyncResultBuilder"
     ) -> None:
@@ -1856,6 +2113,7 @@ class SyncHandler:
 
         sync_result_builder.account_data = account_data_for_user
 
+    @measure_sync_phase("presence")  # watcha+
     async def _generate_sync_entry_for_presence(
         self,
         sync_result_builder: "SyncResultBuilder",
@@ -1914,6 +2172,7 @@ class SyncHandler:
 
         sync_result_builder.presence = presence
 
+    @measure_sync_phase("rooms")  # watcha+
     async def _generate_sync_entry_for_rooms(
         self, sync_result_builder: "SyncResultBuilder"
     ) -> Tuple[AbstractSet[str], AbstractSet[str]]:
@@ -2011,6 +2270,39 @@ class SyncHandler:
         newly_joined_rooms = room_changes.newly_joined_rooms
         newly_left_rooms = room_changes.newly_left_rooms
 
+        # watcha+
+        def may_generate_room_entry(room_entry: "RoomSyncResultBuilder") -> bool:
+            """Whether `_generate_room_entry` goes past its shortcut for the room, as
+            most of the joined rooms of an incremental sync have no changes."""
+            room_id = room_entry.room_id
+            return bool(
+                sync_result_builder.full_state
+                or room_entry.full_state
+                or room_entry.newly_joined
+                or room_entry.events != []
+                or tags_by_room.get(room_id) is not None
+                or account_data_by_room.get(room_id)
+                or ephemeral_by_room.get(room_id)
+            )
+
+        # Fetch the unread counts of the joined rooms which entries may be generated at
+        # once, rather than a room at a time while generating their entries.
+        with start_active_span("sync.unread_notifs"):
+            start = self.clock.time()
+            notifs_by_room = await self.unread_notifs_for_room_ids(
+                [
+                    room_entry.room_id
+                    for room_entry in room_entries
+                    if room_entry.rtype == "joined"
+                    and may_generate_room_entry(room_entry)
+                ],
+                sync_result_builder.sync_config,
+            )
+            sync_result_builder.add_phase_timing(
+                "unread_notifs", self.clock.time() - start
+            )
+        # +watcha
+
         # 4. We need to apply further processing to `room_entries` (rooms considered
         # joined or archived).
         async def handle_room_entries(room_entry: "RoomSyncResultBuilder") -> None:
@@ -2023,11 +2315,19 @@ class SyncHandler:
                 tags=tags_by_room.get(room_entry.room_id),
                 account_data=account_data_by_room.get(room_entry.room_id, {}),
                 always_include=sync_result_builder.full_state,
+                notifs=notifs_by_room.get(room_entry.room_id),  # watcha+
             )
             logger.debug("Generated room entry for %s", room_entry.room_id)
 
         with start_active_span("sync.generate_room_entries"):
+            """ watcha!
             await concurrently_execute(handle_room_entries, room_entries, 10)
+            !watcha """
+            # watcha+
+            await concurrently_execute(
+                handle_room_entries, room_entries, ROOM_ENTRY_CONCURRENCY
+            )
+            # +watcha
 
         sync_result_builder.invited.extend(invited)
         sync_result_builder.knocked.extend(knocked)
@@ -2390,6 +2690,7 @@ class SyncHandler:
         tags: Optional[Mapping[str, JsonMapping]],
         account_data: Mapping[str, JsonMapping],
         always_include: bool = False,
+        notifs: Optional[RoomNotifCounts] = None,  # watcha+
     ) -> None:
         """Populates the `joined` and `archived` section of `sync_result_builder`
         based on the `room_builder`.
@@ -2420,6 +2721,7 @@ class SyncHandler:
             account_data: List of new account data for room
             always_include: Always include this room in the sync response,
                 even if empty.
+            notifs: The unread counts of the user in the room, if already fetched.
         """
         newly_joined = room_builder.newly_joined
         full_state = (
@@ -2515,6 +2817,7 @@ class SyncHandler:
                 return
 
             if not room_builder.out_of_band:
+                start = self.clock.time()  # watcha+
                 state = await self.compute_state_delta(
                     room_id,
                     batch,
@@ -2523,6 +2826,11 @@ class SyncHandler:
                     now_token,
                     full_state=full_state,
                 )
+                # watcha+
+                sync_result_builder.add_phase_timing(
+                    "state_delta", self.clock.time() - start
+                )
+                # +watcha
             else:
                 # An out of band room won't have any state changes.
                 state = {}
@@ -2569,7 +2877,15 @@ class SyncHandler:
                 )
 
                 if room_sync or always_include:
+                    """ watcha!
                     notifs = await self.unread_notifs_for_room_id(room_id, sync_config)
+                    !watcha """
+                    # watcha+
+                    if notifs is None:
+                        notifs = await self.unread_notifs_for_room_id(
+                            room_id, sync_config
+                        )
+                    # +watcha
 
                     # Notifications for the main timeline.
                     notify_count = notifs.main_timeline.notify_count
@@ -2733,6 +3049,14 @@ class SyncResultBuilder:
     knocked: List[KnockedSyncResult] = attr.Factory(list)
     archived: List[ArchivedSyncResult] = attr.Factory(list)
     to_device: List[JsonDict] = attr.Factory(list)
+    # watcha+
+    phase_timings: Dict[str, float] = attr.Factory(dict)
+
+    def add_phase_timing(self, phase: str, duration: float) -> None:
+        """Add some seconds spent computing a phase of the sync."""
+        self.phase_timings[phase] = self.phase_timings.get(phase, 0) + duration
+
+    # +watcha
 
     def calculate_user_changes(self) -> Tuple[AbstractSet[str], AbstractSet[str]]:
         """Work out which other users have joined or left rooms we are joined to.
@@ -1,7 +1,7 @@
 import logging
+from typing import Union
 
 from synapse.api.errors import SynapseError
-from synapse.types import UserID
 from synapse.types import Requester # watcha+
 from synapse.util.watcha import build_log_message
 
@@ -14,25 +14,33 @@ class AdministrationHandler:
         self.auth = hs.get_auth()
         self.auth_handler = hs.get_auth_handler()
 
-    async def watcha_user_list(self):
-        users = await self.store.watcha_user_list()
-
-        result = []
-        for user in users:
-            role = await self.get_user_role(user["user_id"])
-
-            result.append(
-                {
-                    "user_id": user["user_id"],
-                    "email_address": user["email_address"],
-                    "display_name": user["display_name"],
-                    "role": role,
-                    "last_seen": user["last_seen"],
-                    "creation_ts": user["creation_ts"],
-                }
-            )
+    async def watcha_user_list(self, search_term=None, from_user_id=None, limit=None):
+        """Retrieve the active users for the Watcha admin console, sorted by user_id.
+
+        Args:
+            search_term: if set, only list the users matching this string.
+            from_user_id: if set, only list the users after this one.
+            limit: the maximum number of users to list, all of them if None.
 
-        return result
+        Raises:
+            SynapseError if a user is both an administrator and a partner, as in the
+            per-user role checks.
+        """
+        users = await self.store.watcha_user_list(search_term, from_user_id, limit)
+
+        return [
+            {
+                "user_id": user["user_id"],
+                "email_address": user["email_address"],
+                "display_name": user["display_name"],
+                "role": _get_role(
+                    user["user_id"], user["is_admin"], user["is_partner"]
+                ),
+                "last_seen": user["last_seen"],
+                "creation_ts": user["creation_ts"],
+            }
+            for user in users
+        ]
 
     async def update_user_role(self, user_id, target_role):
         """Update the user role
@@ -63,35 +71,38 @@ class AdministrationHandler:
     async def get_user_role(self, user_id):
     !watcha"""
 
-    async def get_user_role(self, requester: Requester): # watcha+
+    async def get_user_role(self, requester: Union[Requester, str]): # watcha+
         """Retrieve user role [administrator|collaborator|partner]
 
         Returns:
             The user role.
         """
-        user_id = requester.user.to_string() # watcha+
-        is_partner = await self.auth_handler.is_partner(user_id)
-        """ watcha!
-        is_admin = await self.auth.is_server_admin(UserID.from_string(user_id))
-        !watcha"""
-        is_admin = await self.auth.is_server_admin(requester) # watcha+
-
-        if is_partner and is_admin:
-            raise SynapseError(
-                400,
-                build_log_message(
-                    log_vars={
-                        "user_id": user_id,
-                        "is_admin": is_admin,
-                        "is_partner": is_partner,
-                    }
-                ),
-            )
-        elif is_partner:
-            role = "partner"
-        elif is_admin:
-            role = "administrator"
-        else:
-            role = "collaborator"
-
-        return role
+        # watcha+
+        user_id = (
+            requester.user.to_string()
+            if isinstance(requester, Requester)
+            else requester
+        )
+        # +watcha
+        is_admin, is_partner = await self.store.get_user_role_flags(user_id)
+        return _get_role(user_id, is_admin, is_partner)
+
+
+def _get_role(user_id: str, is_admin: bool, is_partner: bool) -> str:
+    if is_partner and is_admin:
+        raise SynapseError(
+            400,
+            build_log_message(
+                log_vars={
+                    "user_id": user_id,
+                    "is_admin": is_admin,
+                    "is_partner": is_partner,
+                }
+            ),
+        )
+    elif is_partner:
+        return "partner"
+    elif is_admin:
+        return "administrator"
+    else:
+        return "collaborator"
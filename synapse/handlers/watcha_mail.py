@@ -0,0 +1,271 @@
+import logging
+from typing import TYPE_CHECKING, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from synapse.metrics.background_process_metrics import wrap_as_background_process
+from synapse.storage.databases.main.watcha_mail import QueuedMail
+from synapse.util.async_helpers import Linearizer, concurrently_execute
+from synapse.util.stringutils import random_string
+from synapse.util.watcha import ActionStatus, build_log_message
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+# The interval between two checks of the queue for mails to deliver
+MAIL_QUEUE_POLL_INTERVAL_MS = 5 * 1000
+# The maximum number of mails fetched from the queue at once
+MAIL_DELIVERY_BATCH_SIZE = 50
+# The maximum number of SMTP connections open at the same time
+MAIL_DELIVERY_CONCURRENCY = 5
+# The number of attempts after which a mail is dropped
+MAIL_MAX_ATTEMPTS = 6
+# The delay before retrying to send a mail, doubled after each failed attempt
+MAIL_RETRY_MIN_DELAY_MS = 60 * 1000
+MAIL_RETRY_MAX_DELAY_MS = 60 * 60 * 1000
+# The number of attempts to deliver a mail which is sent before returning, and the
+# delay before retrying, doubled after each failed attempt
+MAIL_DIRECT_MAX_ATTEMPTS = 3
+MAIL_DIRECT_RETRY_DELAY_MS = 1000
+
+queue_depth_gauge = Gauge(
+    "synapse_watcha_mail_queue_depth",
+    "Number of mails waiting to be delivered",
+)
+
+delivery_latency_histogram = Histogram(
+    "synapse_watcha_mail_delivery_latency_seconds",
+    "Time between the queueing and the delivery of mails",
+    buckets=(1, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600, "+Inf"),
+)
+
+delivery_counter = Counter(
+    "synapse_watcha_mail_deliveries",
+    "Number of attempts to deliver queued mails",
+    ["result"],
+)
+
+
+class MailQueueHandler:
+    """Deliver outbound mails in the background.
+
+    Mails are rendered by the caller and persisted in a queue, so that callers do not
+    wait for the SMTP server and mails survive restarts. The queue is delivered by the
+    worker running background tasks, a few mails at a time, and failed deliveries are
+    retried with an exponential backoff.
+
+    The mails holding secrets, such as temporary passwords, must not be persisted:
+    they are delivered before returning with `deliver_mail`, with a few quick
+    retries, so that the caller knows whether they were delivered.
+    """
+
+    def __init__(self, hs: "HomeServer"):
+        self.clock = hs.get_clock()
+        self.store = hs.get_datastores().main
+        self.send_email_handler = hs.get_send_email_handler()
+
+        self._run_background_tasks = hs.config.worker.run_background_tasks
+        self._delivering = False
+        self._redeliver = False
+        # Whether the queue depth gauge must be updated after the next check of the
+        # queue, which is otherwise only counted once mails were delivered
+        self._count_queue = True
+        self._direct_limiter = Linearizer(
+            name="watcha_direct_mails", max_count=MAIL_DELIVERY_CONCURRENCY
+        )
+
+        if self._run_background_tasks:
+            self.clock.looping_call(self._deliver_mails, MAIL_QUEUE_POLL_INTERVAL_MS)
+
+    async def enqueue_mail(
+        self,
+        email_address: str,
+        subject: str,
+        app_name: str,
+        html: str,
+        text: str,
+        additional_headers: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """Queue a mail for delivery.
+
+        Args:
+            email_address: the address to send the mail to
+            subject: the subject of the mail
+            app_name: the app name to include in the From header
+            html: the HTML content of the mail
+            text: the plain text content of the mail
+            additional_headers: the additional headers of the mail
+
+        Returns:
+            the id of the queued mail
+        """
+        mail_id = random_string(20)
+        await self.store.enqueue_mail(
+            mail_id,
+            email_address,
+            subject,
+            app_name,
+            html,
+            text,
+            additional_headers,
+            self.clock.time_msec(),
+        )
+
+        # Do not wait for the next check of the queue
+        if self._run_background_tasks:
+            self._count_queue = True
+            self._deliver_mails()
+
+        return mail_id
+
+    async def deliver_mail(
+        self,
+        email_address: str,
+        subject: str,
+        app_name: str,
+        html: str,
+        text: str,
+        additional_headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Deliver a mail before returning, without persisting it, for the mails
+        holding secrets.
+
+        Failed deliveries are retried up to `MAIL_DIRECT_MAX_ATTEMPTS` times, and the
+        error of the last attempt is raised.
+
+        Args:
+            email_address: the address to send the mail to
+            subject: the subject of the mail
+            app_name: the app name to include in the From header
+            html: the HTML content of the mail
+            text: the plain text content of the mail
+            additional_headers: the additional headers of the mail
+        """
+        mail = QueuedMail(
+            id=random_string(20),
+            email_address=email_address,
+            subject=subject,
+            app_name=app_name,
+            html=html,
+            text=text,
+            additional_headers=additional_headers,
+            queued_ts=self.clock.time_msec(),
+            attempts=0,
+        )
+        for attempts in range(1, MAIL_DIRECT_MAX_ATTEMPTS + 1):
+            try:
+                async with self._direct_limiter.queue(None):
+                    await self._send_mail(mail)
+            except Exception as error:
+                if attempts >= MAIL_DIRECT_MAX_ATTEMPTS:
+                    self._on_delivery_failure(mail, attempts, error, dropped=True)
+                    raise
+
+                delay_ms = MAIL_DIRECT_RETRY_DELAY_MS * 2 ** (attempts - 1)
+                self._on_delivery_failure(mail, attempts, error, delay_ms=delay_ms)
+                await self.clock.sleep(delay_ms / 1000)
+            else:
+                self._on_delivery(mail)
+                return
+
+    @wrap_as_background_process("deliver_watcha_mails")
+    async def _deliver_mails(self):
+        self._redeliver = True
+        if self._delivering:
+            return
+
+        self._delivering = True
+        try:
+            while self._redeliver:
+                self._redeliver = False
+                while True:
+                    mails = await self.store.get_mails_to_send(
+                        self.clock.time_msec(), MAIL_DELIVERY_BATCH_SIZE
+                    )
+                    if not mails:
+                        break
+                    self._count_queue = True
+                    await concurrently_execute(
+                        self._deliver_mail, mails, MAIL_DELIVERY_CONCURRENCY
+                    )
+        finally:
+            self._delivering = False
+            if self._count_queue:
+                self._count_queue = False
+                queue_depth_gauge.set(await self.store.count_queued_mails())
+
+    async def _deliver_mail(self, mail: QueuedMail):
+        try:
+            await self._send_mail(mail)
+        except Exception as error:
+            attempts = mail.attempts + 1
+            if attempts >= MAIL_MAX_ATTEMPTS:
+                self._on_delivery_failure(mail, attempts, error, dropped=True)
+                await self.store.delete_mail(mail.id)
+                return
+
+            delay_ms = min(
+                MAIL_RETRY_MIN_DELAY_MS * 2 ** (attempts - 1), MAIL_RETRY_MAX_DELAY_MS
+            )
+            self._on_delivery_failure(mail, attempts, error, delay_ms=delay_ms)
+            await self.store.reschedule_mail(
+                mail.id, attempts, self.clock.time_msec() + delay_ms
+            )
+            return
+
+        self._on_delivery(mail)
+        await self.store.delete_mail(mail.id)
+
+    async def _send_mail(self, mail: QueuedMail):
+        await self.send_email_handler.send_email(
+            email_address=mail.email_address,
+            subject=mail.subject,
+            app_name=mail.app_name,
+            html=mail.html,
+            text=mail.text,
+            additional_headers=mail.additional_headers,
+        )
+
+    def _on_delivery(self, mail: QueuedMail):
+        delivery_counter.labels("delivered").inc()
+        delivery_latency_histogram.observe(
+            (self.clock.time_msec() - mail.queued_ts) / 1000
+        )
+
+    def _on_delivery_failure(
+        self,
+        mail: QueuedMail,
+        attempts: int,
+        error: Exception,
+        delay_ms: Optional[int] = None,
+        dropped: bool = False,
+    ):
+        """Record a failed attempt to deliver a mail, which is either retried after
+        `delay_ms` milliseconds or dropped."""
+        if dropped:
+            delivery_counter.labels("dropped").inc()
+            logger.error(
+                build_log_message(
+                    status=ActionStatus.FAILED,
+                    log_vars={
+                        "email_address": mail.email_address,
+                        "attempts": attempts,
+                        "error": error,
+                    },
+                )
+            )
+            return
+
+        delivery_counter.labels("retried").inc()
+        logger.warn(
+            build_log_message(
+                log_vars={
+                    "email_address": mail.email_address,
+                    "attempts": attempts,
+                    "delay_ms": delay_ms,
+                    "error": error,
+                }
+            )
+        )
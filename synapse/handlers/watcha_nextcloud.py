@@ -1,5 +1,5 @@
 import logging
-from typing import Iterable, List, Optional, Set
+from typing import Awaitable, Callable, Iterable, List, Optional, Set, Tuple
 from urllib import parse as urlparse
 
 from jsonschema.exceptions import SchemaError, ValidationError
@@ -12,9 +12,17 @@ from synapse.api.errors import (
     SynapseError,
 )
 from synapse.events import EventBase
+from synapse.logging.context import make_deferred_yieldable, run_in_background
+from synapse.metrics.background_process_metrics import (
+    run_as_background_process,
+    wrap_as_background_process,
+)
 from synapse.push.presentable_names import calculate_room_name
-from synapse.types import Requester
-from synapse.util.watcha import build_log_message
+from synapse.types import JsonMapping, Requester, ScheduledTask, TaskStatus
+from synapse.util import unwrapFirstError
+from synapse.util.async_helpers import gather_results
+from synapse.util.caches.lrucache import LruCache
+from synapse.util.watcha import ActionStatus, build_log_message
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +36,34 @@ NEXTCLOUD_CLIENT_ERRORS = (
     ValidationError,
     HttpResponseException,
 )
+# Errors which are a definitive answer of Nextcloud, and are not worth a retry
+NEXTCLOUD_DEFINITIVE_ERRORS = (NextcloudError, SchemaError, ValidationError)
+
+SYNC_MEMBERSHIP_ACTION_NAME = "nextcloud_sync_membership"
+SYNC_ROOM_NAME_ACTION_NAME = "nextcloud_sync_room_name"
+POPULATE_GROUP_ACTION_NAME = "nextcloud_populate_group"
+# Synchronization jobs are delayed so that successive changes of the same
+# membership or room name are coalesced into a single job
+SYNC_COALESCING_DELAY_MS = 10 * 1000
+SYNC_MAX_ATTEMPTS = 8
+SYNC_RETRY_MIN_DELAY_MS = 30 * 1000
+SYNC_RETRY_MAX_DELAY_MS = 60 * 60 * 1000
+# The maximum number of synchronization jobs calling Nextcloud at the same time. It
+# is below the number of tasks the task scheduler runs at the same time, so that
+# Nextcloud jobs can not starve the other tasks.
+SYNC_MAX_CONCURRENT_JOBS = 3
+# The delay before running again a job which could not be run yet, because too many
+# jobs or a job of the same resource were running
+SYNC_BUSY_DELAY_MS = 5 * 1000
+# A room name is propagated once it has not changed for this long
+RENAME_QUIET_PERIOD_MS = 30 * 1000
+
+# Every `RECONCILE_INTERVAL_MS`, the Nextcloud groups of at most
+# `RECONCILE_BATCH_SIZE` rooms are reconciled with the room members, each group
+# being reconciled at most once every `RECONCILE_PERIOD_MS`.
+RECONCILE_INTERVAL_MS = 60 * 1000
+RECONCILE_BATCH_SIZE = 10
+RECONCILE_PERIOD_MS = 60 * 60 * 1000
 
 
 class NextcloudHandler:
@@ -41,6 +77,31 @@ class NextcloudHandler:
         self.keycloak_client = hs.get_keycloak_client()
         self.nextcloud_client = hs.get_nextcloud_client()
 
+        self.clock = hs.get_clock()
+        self._run_background_tasks = hs.config.worker.run_background_tasks
+        self._task_scheduler = hs.get_task_scheduler()
+        # The resources of the synchronization jobs running on this worker. Jobs of
+        # the same resource are run one at a time.
+        self._running_syncs: Set[Tuple[str, str]] = set()
+        # The display name last propagated to the Nextcloud group and calendars of
+        # each room, to skip the renames which do not change it
+        self._propagated_displaynames: LruCache[str, str] = LruCache(
+            10000, "nextcloud_propagated_displaynames"
+        )
+
+        self._task_scheduler.register_action(
+            self._sync_membership, SYNC_MEMBERSHIP_ACTION_NAME
+        )
+        self._task_scheduler.register_action(
+            self._sync_room_name, SYNC_ROOM_NAME_ACTION_NAME
+        )
+        self._task_scheduler.register_action(
+            self._populate_group, POPULATE_GROUP_ACTION_NAME
+        )
+
+        if self._run_background_tasks and self.config.watcha.nextcloud_integration:
+            self.clock.looping_call(self._reconcile_groups, RECONCILE_INTERVAL_MS)
+
     async def handle_room_member_event(
         self, requester: Requester, room_id: str, user_id: str, membership: str
     ):
@@ -58,15 +119,25 @@ class NextcloudHandler:
         # +watcha
             return
 
-        if await self.store.get_share_id(room_id):
-            await self.update_group(user_id, room_id, membership)
-
-        events = await self._get_calendar_events(room_id)
-        if events:
-            await self.update_calendar_access(
-                requester, room_id, user_id, membership, events
+        own_calendar_ids = []
+        if membership != Membership.JOIN:
+            # The personal calendars of a leaving user are unshared from the room
+            # while they can still send state events into it.
+            own_calendar_ids = await self.remove_own_calendar_events(
+                requester, room_id, user_id
             )
 
+        await self.schedule_sync(
+            SYNC_MEMBERSHIP_ACTION_NAME,
+            f"{room_id}|{user_id}",
+            {
+                "room_id": room_id,
+                "user_id": user_id,
+                "previously_joined": membership != Membership.JOIN,
+                "own_calendar_ids": own_calendar_ids,
+            },
+        )
+
     async def handle_room_name_event(
         self, requester: Requester, event_dict: dict, txn_id: Optional[str] = None
     ):
@@ -75,19 +146,314 @@ class NextcloudHandler:
         )
 
         room_id = event_dict["room_id"]
-        displayname = await self.build_group_displayname(room_id)
+        await self.schedule_sync(
+            SYNC_ROOM_NAME_ACTION_NAME,
+            room_id,
+            {"room_id": room_id},
+            delay_ms=RENAME_QUIET_PERIOD_MS,
+            debounce=True,
+        )
 
-        if await self.store.get_share_id(room_id):
-            group_id = await self.build_group_id(room_id)
-            await self.set_group_displayname(group_id, displayname)
+        return event.event_id
+
+    # synchronization queue
+    # =====================
+
+    async def schedule_sync(
+        self,
+        action: str,
+        resource_id: str,
+        params: JsonMapping,
+        delay_ms: int = SYNC_COALESCING_DELAY_MS,
+        debounce: bool = False,
+    ):
+        """Schedule a job synchronizing Nextcloud with a room.
+
+        Jobs are persisted by the task scheduler, so that they survive restarts. A job
+        is coalesced with the job of the same resource which is still pending, if any,
+        by updating the parameters of the pending job in place. The update is a
+        compare-and-set, so that a job launched or coalesced in the meantime is
+        neither run twice nor lost.
+
+        Args:
+            action: the name of the job
+            resource_id: the resource synchronized by the job
+            params: the parameters of the job
+            delay_ms: the delay before running the job
+            debounce: whether to postpone the pending job the new job is coalesced
+                with, so that it runs once there has been no change for `delay_ms`
+        """
+        params = {"attempts": 0, **params}
+        timestamp = self.clock.time_msec() + delay_ms
+
+        while True:
+            tasks = await self._task_scheduler.get_tasks(
+                actions=[action],
+                resource_id=resource_id,
+                statuses=[TaskStatus.SCHEDULED],
+            )
+            if not tasks:
+                break
+
+            task = tasks[0]
+            merged_params = _merge_sync_params(task.params, params)
+            if merged_params == task.params and not debounce:
+                return
+            if await self._task_scheduler.update_pending_task(
+                task.id,
+                timestamp=timestamp if debounce else task.timestamp,
+                params=merged_params,
+                expected_params=task.params,
+            ):
+                if debounce:
+                    self._call_launch_sync_task(task.id, delay_ms)
+                return
+            # The pending job has been launched or coalesced in the meantime
+
+        task_id = await self._task_scheduler.schedule_task(
+            action,
+            resource_id=resource_id,
+            timestamp=timestamp,
+            params=params,
+        )
+        self._call_launch_sync_task(task_id, delay_ms)
+
+    def _call_launch_sync_task(self, task_id: str, delay_ms: int):
+        """Launch a job when it is due, rather than at the next run of the task
+        scheduler."""
+        if self._run_background_tasks:
+            self.clock.call_later(delay_ms / 1000, self._launch_sync_task, task_id)
+
+    def _launch_sync_task(self, task_id: str):
+        async def launch():
+            task = await self._task_scheduler.get_task(task_id)
+            if (
+                task is not None
+                and task.status == TaskStatus.SCHEDULED
+                and task.timestamp <= self.clock.time_msec()
+            ):
+                self._task_scheduler.launch_task_by_id(task_id)
+
+        return run_as_background_process("nextcloud_launch_sync_task", launch)
+
+    async def _run_sync_task(
+        self,
+        task: ScheduledTask,
+        sync: Callable[[JsonMapping], Awaitable[None]],
+    ) -> Tuple[TaskStatus, Optional[JsonMapping], Optional[str]]:
+        """Run a synchronization job, and schedule a retry with an exponential
+        backoff if Nextcloud can not be reached.
+
+        A job which can not be run yet, because `SYNC_MAX_CONCURRENT_JOBS` jobs or a
+        job of the same resource are running, is scheduled again rather than waited
+        for, not to hold a slot of the task scheduler.
+        """
+        # The parameters may have been coalesced before the job was marked as active
+        task = await self._task_scheduler.get_task(task.id) or task
+
+        key = (task.action, task.resource_id)
+        if key in self._running_syncs or (
+            len(self._running_syncs) >= SYNC_MAX_CONCURRENT_JOBS
+        ):
+            await self.schedule_sync(
+                task.action, task.resource_id, task.params, delay_ms=SYNC_BUSY_DELAY_MS
+            )
+            return TaskStatus.COMPLETE, {"deferred": True}, None
+
+        self._running_syncs.add(key)
+        try:
+            await sync(task.params)
+        except Exception as error:
+            attempts = task.params["attempts"] + 1
+            log_vars = {
+                "action": task.action,
+                "resource_id": task.resource_id,
+                "attempts": attempts,
+                "error": error,
+            }
+            if (
+                isinstance(error, NEXTCLOUD_DEFINITIVE_ERRORS)
+                or attempts >= SYNC_MAX_ATTEMPTS
+            ):
+                logger.error(build_log_message(log_vars=log_vars))
+                return TaskStatus.FAILED, None, str(error)
+
+            logger.warn(build_log_message(log_vars=log_vars))
+            await self.schedule_sync(
+                task.action,
+                task.resource_id,
+                {**task.params, "attempts": attempts},
+                delay_ms=min(
+                    SYNC_RETRY_MIN_DELAY_MS * 2 ** (attempts - 1),
+                    SYNC_RETRY_MAX_DELAY_MS,
+                ),
+            )
+            return TaskStatus.COMPLETE, {"retried": True}, None
+        finally:
+            self._running_syncs.discard(key)
+
+        return TaskStatus.COMPLETE, None, None
+
+    async def _sync_membership(
+        self, task: ScheduledTask
+    ) -> Tuple[TaskStatus, Optional[JsonMapping], Optional[str]]:
+        return await self._run_sync_task(task, self._apply_membership)
+
+    async def _sync_room_name(
+        self, task: ScheduledTask
+    ) -> Tuple[TaskStatus, Optional[JsonMapping], Optional[str]]:
+        return await self._run_sync_task(task, self._apply_room_name)
+
+    async def _populate_group(
+        self, task: ScheduledTask
+    ) -> Tuple[TaskStatus, Optional[JsonMapping], Optional[str]]:
+        return await self._run_sync_task(
+            task, lambda params: self.add_room_members_to_group(params["room_id"])
+        )
+
+    async def _apply_membership(self, params: JsonMapping):
+        """Apply the current membership of a user to the Nextcloud group and calendars
+        of a room.
 
+        The membership is read when the job is run, so that a membership reverted
+        in the meantime (e.g. a join followed by a leave) cancels out. It is applied
+        anyway when retrying, as the previous attempt may have been partially applied.
+        """
+        room_id = params["room_id"]
+        user_id = params["user_id"]
+
+        membership, _ = await self.store.get_local_current_membership_for_user_in_room(
+            user_id, room_id
+        )
+        joined = membership == Membership.JOIN
         calendar_ids = await self._get_calendar_ids(room_id)
-        if calendar_ids:
-            await self.nextcloud_client.rename_calendars(
-                calendar_ids, room_id, displayname
+
+        own_calendar_ids = params["own_calendar_ids"]
+        if own_calendar_ids:
+            # FIXME: infer delete_group also from share_state
+            await self.nextcloud_client.unshare_calendar(
+                own_calendar_ids, room_id, not calendar_ids
             )
 
-        return event.event_id
+        if joined == params["previously_joined"] and not params["attempts"]:
+            return
+
+        if await self.store.get_share_id(room_id):
+            await self.update_group(user_id, room_id, membership or Membership.LEAVE)
+
+        if not calendar_ids:
+            return
+
+        nextcloud_username = await self.store.get_username(user_id)
+        if joined:
+            displayname = await self.build_group_displayname(room_id)
+            await self.nextcloud_client.add_user_access_to_calendars(
+                nextcloud_username, room_id, calendar_ids, displayname
+            )
+        else:
+            await self.nextcloud_client.remove_user_access_to_calendars(
+                nextcloud_username, room_id
+            )
+
+    async def _apply_room_name(self, params: JsonMapping):
+        """Apply the current name of a room to its Nextcloud group and calendars."""
+        room_id = params["room_id"]
+        displayname = await self.build_group_displayname(room_id)
+        if self._propagated_displaynames.get(room_id) == displayname:
+            return
+
+        async def rename_group():
+            if await self.store.get_share_id(room_id):
+                group_id = await self.build_group_id(room_id)
+                await self.set_group_displayname(group_id, displayname)
+
+        async def rename_calendars():
+            calendar_ids = await self._get_calendar_ids(room_id)
+            if calendar_ids:
+                await self.nextcloud_client.rename_calendars(
+                    calendar_ids, room_id, displayname
+                )
+
+        await make_deferred_yieldable(
+            gather_results(
+                (run_in_background(rename_group), run_in_background(rename_calendars)),
+                consumeErrors=True,
+            )
+        ).addErrback(unwrapFirstError)
+
+        # Only reached once both the group and the calendars are renamed, so that a
+        # retried job is not skipped as unchanged
+        self._propagated_displaynames.set(room_id, displayname)
+
+    # reconciliation
+    # ==============
+
+    @wrap_as_background_process("nextcloud_reconcile_groups")
+    async def _reconcile_groups(self):
+        """Reconcile the Nextcloud groups which were least recently reconciled."""
+        now = self.clock.time_msec()
+        room_ids = await self.store.get_shares_to_reconcile(
+            now - RECONCILE_PERIOD_MS, RECONCILE_BATCH_SIZE
+        )
+        for room_id in room_ids:
+            try:
+                await self.reconcile_group(room_id)
+            except Exception as error:
+                logger.error(
+                    build_log_message(log_vars={"room_id": room_id, "error": error})
+                )
+            # The group is reconciled again later even if it failed, not to hold
+            # the other groups back.
+            await self.store.set_share_reconciled(room_id, now)
+
+    async def reconcile_group(self, room_id: str):
+        """Add the missing room members to the Nextcloud group of a room, and remove
+        the users who are no longer room members from it.
+
+        Args:
+            room_id: the id of the room which the Nextcloud group name is infered from.
+
+        Returns:
+            the usernames of the users added to the group, and of the users removed
+            from it
+        """
+        group_id = await self.build_group_id(room_id)
+        group_members = set(await self.nextcloud_client.get_group_members(group_id))
+
+        user_ids = await self.store.get_users_in_room(room_id)
+        nextcloud_usernames = await self.store.get_usernames(user_ids)
+        room_members = {
+            username for username in nextcloud_usernames.values() if username
+        }
+
+        to_add = room_members - group_members
+        to_remove = group_members - room_members
+        errors = {}
+        if to_add:
+            errors.update(
+                await self.nextcloud_client.add_users_to_group(to_add, group_id)
+            )
+        if to_remove:
+            errors.update(
+                await self.nextcloud_client.remove_users_from_group(
+                    to_remove, group_id
+                )
+            )
+
+        log_vars = {
+            "room_id": room_id,
+            "group_id": group_id,
+            "added": len(to_add),
+            "removed": len(to_remove),
+        }
+        if errors:
+            logger.warn(build_log_message(log_vars={**log_vars, "errors": errors}))
+        elif to_add or to_remove:
+            logger.info(
+                build_log_message(status=ActionStatus.SUCCESS, log_vars=log_vars)
+            )
+
+        return to_add, to_remove
 
     # file sharing
     # ============
@@ -128,8 +494,8 @@ class NextcloudHandler:
     async def bind(self, requester_id: str, room_id: str, path: str):
         """Bind a Nextcloud folder with a room in three steps :
             1 - create a new Nextcloud group
-            2 - add all room members in the new group
-            3 - create a share on folder for the new group
+            2 - create a share on folder for the new group
+            3 - schedule the addition of all room members in the new group
 
         Args :
            requester_id: the mxid of the requester.
@@ -137,8 +503,10 @@ class NextcloudHandler:
            path: the path of the Nextcloud folder to bind.
         """
         await self.create_group(room_id)
-        await self.add_room_members_to_group(room_id)
         await self.create_share(requester_id, room_id, path)
+        await self.schedule_sync(
+            POPULATE_GROUP_ACTION_NAME, room_id, {"room_id": room_id}, delay_ms=0
+        )
 
     async def create_group(self, room_id: str):
         """Create a Nextcloud group with specific id and displayname.
@@ -198,6 +566,9 @@ class NextcloudHandler:
                 group_id, group_displayname
             )
         except NEXTCLOUD_CLIENT_ERRORS as error:
+            # Let the synchronization job retry if Nextcloud can not be reached
+            if not isinstance(error, NEXTCLOUD_DEFINITIVE_ERRORS):
+                raise
             logger.warn(
                 build_log_message(
                     log_vars={
@@ -216,32 +587,36 @@ class NextcloudHandler:
         """
         group_id = await self.build_group_id(room_id)
         user_ids = await self.store.get_users_in_room(room_id)
+        nextcloud_usernames = await self.store.get_usernames(user_ids)
 
-        for user_id in user_ids:
-            nextcloud_username = await self.store.get_username(user_id)
-            try:
-                await self.nextcloud_client.add_user_to_group(
-                    nextcloud_username, group_id
-                )
-            except NEXTCLOUD_CLIENT_ERRORS as error:
-                log_message = build_log_message(
-                    log_vars={
-                        "user_id": user_id,
-                        "nextcloud_username": nextcloud_username,
-                        "group_id": group_id,
-                        "room_id": room_id,
-                        "error": error,
-                    }
+        errors = await self.nextcloud_client.add_users_to_group(
+            list(nextcloud_usernames.values()), group_id
+        )
+        for user_id, nextcloud_username in nextcloud_usernames.items():
+            error = errors.get(nextcloud_username)
+            if error is None:
+                continue
+
+            log_message = build_log_message(
+                log_vars={
+                    "user_id": user_id,
+                    "nextcloud_username": nextcloud_username,
+                    "group_id": group_id,
+                    "room_id": room_id,
+                    "error": error,
+                }
+            )
+            # Do not raise error if some users can not be added to group
+            if isinstance(error, NextcloudError) and (error.code in (103, 105)):
+                logger.error(log_message)
+            elif isinstance(error, NEXTCLOUD_CLIENT_ERRORS):
+                raise SynapseError(
+                    500,
+                    log_message,
+                    Codes.NEXTCLOUD_CAN_NOT_ADD_MEMBERS_TO_GROUP,
                 )
-                # Do not raise error if some users can not be added to group
-                if isinstance(error, NextcloudError) and (error.code in (103, 105)):
-                    logger.error(log_message)
-                else:
-                    raise SynapseError(
-                        500,
-                        log_message,
-                        Codes.NEXTCLOUD_CAN_NOT_ADD_MEMBERS_TO_GROUP,
-                    )
+            else:
+                raise error
 
     async def create_share(self, requester_id: str, room_id: str, path: str):
         """Create a new share on folder for a specific Nextcloud group.
@@ -351,6 +726,9 @@ class NextcloudHandler:
                     nextcloud_username, group_id
                 )
         except NEXTCLOUD_CLIENT_ERRORS as error:
+            # Let the synchronization job retry if Nextcloud can not be reached
+            if not isinstance(error, NEXTCLOUD_DEFINITIVE_ERRORS):
+                raise
             log_vars = {
                 "user_id": user_id,
                 "room_id": room_id,
@@ -429,9 +807,9 @@ class NextcloudHandler:
             await self._validate_calendar(room_id, fake_calendar)
             displayname = await self.build_group_displayname(room_id)
             user_ids = await self.store.get_users_in_room(room_id)
-            nextcloud_usernames = [
-                await self.store.get_username(user_id) for user_id in user_ids
-            ]
+            nextcloud_usernames = list(
+                (await self.store.get_usernames(user_ids)).values()
+            )
             calendar = await self.nextcloud_client.create_and_share_calendar(
                 room_id, displayname, nextcloud_usernames
             )
@@ -449,9 +827,9 @@ class NextcloudHandler:
             event_dict["state_key"] = CalendarComponentTypes.serialize(components)
             displayname = await self.build_group_displayname(room_id)
             user_ids = await self.store.get_users_in_room(room_id)
-            nextcloud_usernames = [
-                await self.store.get_username(user_id) for user_id in user_ids
-            ]
+            nextcloud_usernames = list(
+                (await self.store.get_usernames(user_ids)).values()
+            )
             calendar = await self.nextcloud_client.share_calendar(
                 nextcloud_username,
                 calendar_id,
@@ -466,26 +844,18 @@ class NextcloudHandler:
         )
         return event.event_id
 
-    async def update_calendar_access(
-        self,
-        requester: Requester,
-        room_id: str,
-        user_id: str,
-        membership: str,
-        calendar_events: List[EventBase],
-    ):
-        if membership == Membership.JOIN:
-            nextcloud_username = await self.store.get_username(user_id)
-            calendar_ids = [event["content"]["id"] for event in calendar_events]
-            displayname = await self.build_group_displayname(room_id)
-            await self.nextcloud_client.add_user_access_to_calendars(
-                nextcloud_username, room_id, calendar_ids, displayname
-            )
-            return
+    async def remove_own_calendar_events(
+        self, requester: Requester, room_id: str, user_id: str
+    ) -> List[int]:
+        """Empty the calendar state events of the personal calendars a user shared
+        with a room.
 
+        Returns:
+            the ids of the personal calendars, to unshare from Nextcloud
+        """
         own_calendar_ids = []
 
-        for event in calendar_events:
+        for event in await self._get_calendar_events(room_id):
             if self._is_own_calendar(user_id, event):
                 own_calendar_ids.append(event["content"]["id"])
                 event_dict = {
@@ -499,21 +869,7 @@ class NextcloudHandler:
                     requester, event_dict
                 )
 
-        # FIXME: infer delete_group also from share_state
-        delete_group = all(
-            self._is_own_calendar(user_id, event) for event in calendar_events
-        )
-
-        if own_calendar_ids:
-            await self.nextcloud_client.unshare_calendar(
-                own_calendar_ids, room_id, delete_group
-            )
-
-        if not delete_group:
-            nextcloud_username = await self.store.get_username(user_id)
-            await self.nextcloud_client.remove_user_access_to_calendars(
-                nextcloud_username, room_id
-            )
+        return own_calendar_ids
 
     def _is_own_calendar(self, user_id: str, calendar_event: EventBase):
         return (
@@ -537,10 +893,12 @@ class NextcloudHandler:
             )
 
     async def _get_calendar_events(self, room_id: str) -> List[EventBase]:
+        calendar_event_ids = await self.store.get_room_calendar_event_ids(room_id)
+        events = await self.store.get_events(calendar_event_ids.values())
+
         calendar_events = []
-        room_state = await self._storage_controllers.state.get_current_state(room_id)
         for state_key in CalendarComponentTypes.ALL:
-            event = room_state.get((EventTypes.NextcloudCalendar, state_key))
+            event = events.get(calendar_event_ids.get(state_key))
             if event is not None and event["content"]:
                 calendar_events.append(event)
         return calendar_events
@@ -558,6 +916,22 @@ class NextcloudHandler:
         }
 
 
+def _merge_sync_params(pending: JsonMapping, params: JsonMapping) -> JsonMapping:
+    """Merge the parameters of a synchronization job into those of the pending job
+    of the same resource.
+
+    The state the resource had before the pending job is kept, as the jobs apply the
+    state the resource has when they are run.
+    """
+    merged = {**params, **pending}
+    merged["attempts"] = max(pending["attempts"], params["attempts"])
+    if "own_calendar_ids" in params:
+        merged["own_calendar_ids"] = sorted(
+            set(pending["own_calendar_ids"]) | set(params["own_calendar_ids"])
+        )
+    return merged
+
+
 class CalendarComponentTypes:
     VEVENT_VTODO = "VEVENT_VTODO"
     VEVENT = "VEVENT"
@@ -1,12 +1,14 @@
 import logging
 import uuid
-from typing import Optional, TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-from synapse.api.errors import HttpResponseException
+from synapse.api.errors import HttpResponseException, SynapseError
 """ watcha!
 from synapse.config.emailconfig import ThreepidBehaviour
 !watcha"""
 from synapse.push.mailer import Mailer
+from synapse.types import JsonDict, JsonMapping, ScheduledTask, TaskStatus
+from synapse.util.async_helpers import concurrently_execute
 from synapse.util.watcha import ActionStatus, Secrets, build_log_message
 from synapse.types import UserID # watcha+
 
@@ -15,10 +17,42 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+BULK_REGISTER_ACTION_NAME = "watcha_bulk_register"
+# The maximum number of users provisioned at the same time by a bulk registration
+BULK_REGISTER_CONCURRENCY = 10
+# The progress of a bulk registration is saved every so many rows, or seconds
+BULK_REGISTER_PROGRESS_ROWS = 100
+BULK_REGISTER_PROGRESS_INTERVAL_MS = 5 * 1000
+# The invitee parameters accepted by a bulk registration
+INVITEE_PARAMS = (
+    "email",
+    "displayname",
+    "admin",
+    "keycloak_username",
+    "keycloak_as_broker",
+)
+
+
+class RegistrationMailError(SynapseError):
+    """Raised when a user is registered but their registration mail, which holds
+    their only copy of their password, could not be delivered."""
+
+    def __init__(self, user_id: str, error: Exception):
+        super().__init__(
+            500,
+            build_log_message(
+                action="send registration mail",
+                log_vars={"user_id": user_id, "error": error},
+            ),
+            additional_fields={"user_id": user_id},
+        )
+        self.user_id = user_id
+
 
 class RegistrationHandler:
     def __init__(self, hs: "HomeServer"):
         self.hs = hs
+        self.clock = hs.get_clock()
         self.config = hs.config
         self.auth_handler = hs.get_auth_handler()
         self.registration_handler = hs.get_registration_handler()
@@ -27,6 +61,10 @@ class RegistrationHandler:
         self.keycloak_client = hs.get_keycloak_client()
         self.nextcloud_client = hs.get_nextcloud_client()
         self.secrets = Secrets()
+        self._task_scheduler = hs.get_task_scheduler()
+        self._task_scheduler.register_action(
+            self._bulk_register, BULK_REGISTER_ACTION_NAME
+        )
 
         """ watcha!
         if hs.config.email.threepid_behaviour_email == ThreepidBehaviour.LOCAL:
@@ -60,6 +98,10 @@ class RegistrationHandler:
 
         Returns:
             user_id: the mxid of the new user
+
+        Raises:
+            RegistrationMailError if the user is registered but their registration
+            mail could not be delivered.
         """
 
         password = self.secrets.gen_password()
@@ -148,13 +190,172 @@ class RegistrationHandler:
             )
 
         if send_registration_mail:
-            await self.mailer.send_watcha_registration_mail(
-                sender_id=sender_id,
-                email_address=email_address,
-                password=password,
-                is_partner=is_partner,
-            )
+            try:
+                await self.mailer.send_watcha_registration_mail(
+                    sender_id=sender_id,
+                    email_address=email_address,
+                    password=password,
+                    is_partner=is_partner,
+                )
+            except Exception as error:
+                raise RegistrationMailError(user_id, error) from error
 
         logger.info(build_log_message(status=ActionStatus.SUCCESS))
 
         return user_id
+
+    async def start_bulk_registration(
+        self, sender_id: str, invitees: List[JsonDict]
+    ) -> str:
+        """Schedule the registration of many users.
+
+        The users are provisioned in the background by a task, which is resumed
+        after a restart.
+
+        Args:
+            sender_id: The mxid of the user who invite.
+            invitees: The parameters of each invitee, as accepted by
+                `/watcha_register`: 'email', and optionally 'displayname', 'admin',
+                'keycloak_username' and 'keycloak_as_broker'.
+
+        Returns:
+            the id of the bulk registration
+        """
+        rows = []
+        email_addresses = set()
+        for invitee in invitees:
+            email_address = str(invitee.get("email") or "").lower().strip()
+            if not email_address or email_address in email_addresses:
+                raise SynapseError(
+                    400,
+                    build_log_message(
+                        action="check if email addresses are set and unique",
+                        log_vars={"invitee": invitee},
+                    ),
+                )
+            email_addresses.add(email_address)
+            rows.append(
+                {
+                    **{key: invitee[key] for key in INVITEE_PARAMS if key in invitee},
+                    "email": email_address,
+                }
+            )
+
+        return await self._task_scheduler.schedule_task(
+            BULK_REGISTER_ACTION_NAME,
+            resource_id=sender_id,
+            params={"sender_id": sender_id, "invitees": rows},
+        )
+
+    async def get_bulk_registration(self, task_id: str) -> Optional[JsonDict]:
+        """Get the progress of a bulk registration.
+
+        Returns:
+            the status of the registration and of each of its rows, or None if there
+            is no such bulk registration. The registered rows which registration mail
+            could not be delivered have a 'mail' of 'failed'.
+        """
+        task = await self._task_scheduler.get_task(task_id)
+        if task is None or task.action != BULK_REGISTER_ACTION_NAME:
+            return None
+
+        results = (task.result or {}).get("rows", {})
+        rows = []
+        for index, invitee in enumerate(task.params["invitees"]):
+            row = {"email": invitee["email"], "status": "pending"}
+            row.update(results.get(str(index), {}))
+            rows.append(row)
+
+        return {
+            "sender_id": task.params["sender_id"],
+            "status": task.status.value,
+            "rows": rows,
+        }
+
+    async def _bulk_register(
+        self, task: ScheduledTask
+    ) -> Tuple[TaskStatus, Optional[JsonMapping], Optional[str]]:
+        """Register the invitees of a bulk registration with a bounded concurrency.
+
+        The status of the rows is saved in the result of the task every
+        `BULK_REGISTER_PROGRESS_ROWS` rows or `BULK_REGISTER_PROGRESS_INTERVAL_MS`,
+        rather than after each row as the whole result is rewritten each time, so
+        that the progress can be followed and a resumed task skips most of the rows
+        already processed.
+
+        As `register` is not idempotent, the rows which email address is already
+        bound to a user, such as those registered since the last save of a resumed
+        task, are reported as registered to this user instead of being registered
+        again.
+        """
+        sender_id = task.params["sender_id"]
+        results: Dict[str, JsonDict] = dict((task.result or {}).get("rows", {}))
+        unsaved_rows = 0
+        last_saved_ms = self.clock.time_msec()
+
+        async def register_row(index: int):
+            invitee = task.params["invitees"][index]
+            try:
+                user_id = await self.store.get_user_id_by_threepid(
+                    "email", invitee["email"]
+                )
+                if user_id is None:
+                    user_id = await self.register(
+                        sender_id=sender_id,
+                        email_address=invitee["email"],
+                        is_admin=bool(invitee.get("admin", False)),
+                        default_display_name=(
+                            invitee.get("displayname") or ""
+                        ).strip()
+                        or None,
+                        keycloak_username=invitee.get("keycloak_username"),
+                        keycloak_as_broker=bool(
+                            invitee.get("keycloak_as_broker", False)
+                        ),
+                    )
+                results[str(index)] = {"status": "registered", "user_id": user_id}
+            except RegistrationMailError as error:
+                logger.error(
+                    build_log_message(
+                        log_vars={"email_address": invitee["email"], "error": error}
+                    )
+                )
+                results[str(index)] = {
+                    "status": "registered",
+                    "user_id": error.user_id,
+                    "mail": "failed",
+                    "error": str(error),
+                }
+            except Exception as error:
+                logger.error(
+                    build_log_message(
+                        log_vars={"email_address": invitee["email"], "error": error}
+                    )
+                )
+                results[str(index)] = {"status": "failed", "error": str(error)}
+
+            nonlocal unsaved_rows, last_saved_ms
+            unsaved_rows += 1
+            now_ms = self.clock.time_msec()
+            if (
+                unsaved_rows >= BULK_REGISTER_PROGRESS_ROWS
+                or now_ms - last_saved_ms >= BULK_REGISTER_PROGRESS_INTERVAL_MS
+            ):
+                unsaved_rows = 0
+                last_saved_ms = now_ms
+                # The rows still being registered keep updating the results while
+                # they are saved
+                await self._task_scheduler.update_task(
+                    task.id, result={"rows": dict(results)}
+                )
+
+        pending_indexes = [
+            index
+            for index in range(len(task.params["invitees"]))
+            if str(index) not in results
+        ]
+        await concurrently_execute(
+            register_row, pending_indexes, BULK_REGISTER_CONCURRENCY
+        )
+
+        return TaskStatus.COMPLETE, {"rows": results}, None
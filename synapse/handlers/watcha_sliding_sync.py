@@ -0,0 +1,637 @@
+"""Sliding sync, in the spirit of MSC3575.
+
+Rather than every room which changed, a sliding sync returns the rooms in some
+windows (ranges) of lists of rooms ordered by recency, and the rooms the client
+subscribed to. The state of each connection remembers what was sent of the rooms in
+the windows, so that only their changes are returned afterwards. A room which leaves
+the windows is forgotten, and sent in full again if it comes back.
+"""
+import logging
+from collections import OrderedDict
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Mapping,
+    Optional,
+    Tuple,
+)
+
+import attr
+from sortedcontainers import SortedList
+
+from synapse.api.constants import Membership
+from synapse.api.errors import Codes, SynapseError
+from synapse.events.utils import SerializeEventConfig
+from synapse.push.presentable_names import calculate_room_name
+from synapse.types import JsonDict, Requester, StreamKeyType, StreamToken
+from synapse.types.state import StateFilter
+from synapse.util.async_helpers import concurrently_execute
+from synapse.util.caches.expiringcache import ExpiringCache
+from synapse.visibility import filter_events_for_client
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+# The maximum number of events in the timeline of a room
+MAX_TIMELINE_LIMIT = 100
+# The number of positions of a connection the client can resume from
+MAX_POSITIONS_PER_CONNECTION = 10
+# The time after which an unused connection is forgotten
+CONNECTION_EXPIRY_MS = 30 * 60 * 1000
+# The maximum number of connections remembered
+MAX_CONNECTIONS = 10000
+# The maximum number of rooms computed at the same time by a request
+ROOM_CONCURRENCY = 10
+
+WILDCARD = "*"
+STATE_KEY_ME = "$ME"
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class RoomSyncConfig:
+    timeline_limit: int
+    required_state: FrozenSet[Tuple[str, str]]
+
+    def combine(self, other: "RoomSyncConfig") -> "RoomSyncConfig":
+        return RoomSyncConfig(
+            max(self.timeline_limit, other.timeline_limit),
+            self.required_state | other.required_state,
+        )
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class ListConfig:
+    ranges: Tuple[Tuple[int, int], ...]
+    room_config: RoomSyncConfig
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class SlidingSyncRequest:
+    conn_id: Optional[str]
+    lists: Mapping[str, ListConfig]
+    room_subscriptions: Mapping[str, RoomSyncConfig]
+
+
+def _parse_room_config(body: JsonDict, name: str) -> RoomSyncConfig:
+    timeline_limit = body.get("timeline_limit", 0)
+    if not isinstance(timeline_limit, int) or timeline_limit < 0:
+        raise SynapseError(
+            400, f"Invalid timeline_limit of {name}", Codes.INVALID_PARAM
+        )
+
+    required_state = body.get("required_state", [])
+    if not isinstance(required_state, list) or not all(
+        isinstance(pair, list)
+        and len(pair) == 2
+        and all(isinstance(value, str) for value in pair)
+        for pair in required_state
+    ):
+        raise SynapseError(
+            400, f"Invalid required_state of {name}", Codes.INVALID_PARAM
+        )
+
+    return RoomSyncConfig(
+        min(timeline_limit, MAX_TIMELINE_LIMIT),
+        frozenset((event_type, state_key) for event_type, state_key in required_state),
+    )
+
+
+def parse_sliding_sync_request(body: JsonDict) -> SlidingSyncRequest:
+    """Parse and validate the body of a sliding sync request."""
+    conn_id = body.get("conn_id")
+    if conn_id is not None and not isinstance(conn_id, str):
+        raise SynapseError(400, "Invalid conn_id", Codes.INVALID_PARAM)
+
+    lists = body.get("lists", {})
+    room_subscriptions = body.get("room_subscriptions", {})
+    if not isinstance(lists, dict) or not isinstance(room_subscriptions, dict):
+        raise SynapseError(
+            400, "Invalid lists or room_subscriptions", Codes.INVALID_PARAM
+        )
+
+    list_configs = {}
+    for name, list_body in lists.items():
+        if not isinstance(list_body, dict):
+            raise SynapseError(400, f"Invalid list {name}", Codes.INVALID_PARAM)
+        ranges = list_body.get("ranges", [])
+        if not isinstance(ranges, list) or not all(
+            isinstance(range_, list)
+            and len(range_) == 2
+            and all(isinstance(bound, int) for bound in range_)
+            and 0 <= range_[0] <= range_[1]
+            for range_ in ranges
+        ):
+            raise SynapseError(
+                400, f"Invalid ranges of list {name}", Codes.INVALID_PARAM
+            )
+        list_configs[name] = ListConfig(
+            tuple((start, end) for start, end in ranges),
+            _parse_room_config(list_body, f"list {name}"),
+        )
+
+    subscription_configs = {}
+    for room_id, subscription_body in room_subscriptions.items():
+        if not isinstance(subscription_body, dict):
+            raise SynapseError(
+                400, f"Invalid subscription to {room_id}", Codes.INVALID_PARAM
+            )
+        subscription_configs[room_id] = _parse_room_config(
+            subscription_body, f"subscription to {room_id}"
+        )
+
+    return SlidingSyncRequest(conn_id, list_configs, subscription_configs)
+
+
+class RoomListIndex:
+    """The rooms a user is joined or invited to, the most recent first."""
+
+    def __init__(self, rooms: Iterable[Tuple[str, str, int]], token: StreamToken):
+        self.token = token
+        self.memberships: Dict[str, str] = {}
+        self._recency: Dict[str, int] = {}
+        self._sorted: SortedList = SortedList()
+        for room_id, membership, recency in rooms:
+            self.memberships[room_id] = membership
+            self._recency[room_id] = recency
+            self._sorted.add((-recency, room_id))
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    def update_recency(self, recency: Mapping[str, int]) -> None:
+        for room_id, room_recency in recency.items():
+            previous = self._recency.get(room_id)
+            if previous is None or previous == room_recency:
+                continue
+            self._sorted.remove((-previous, room_id))
+            self._sorted.add((-room_recency, room_id))
+            self._recency[room_id] = room_recency
+
+    def get_range(self, start: int, end: int) -> Tuple[str, ...]:
+        """Get the rooms from the `start` to the `end` position, both included."""
+        return tuple(room_id for _, room_id in self._sorted.islice(start, end + 1))
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class _SentRoom:
+    """What a client received of a room, to only send the fields which changed."""
+
+    membership: str
+    name: Optional[str] = None
+    joined_count: int = 0
+    notification_count: int = 0
+    highlight_count: int = 0
+    required_state_ids: FrozenSet[str] = frozenset()
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class _Position:
+    """What a client received up to a position of its connection."""
+
+    token: StreamToken
+    # The rooms in the windows or subscribed to
+    sent_rooms: Mapping[str, _SentRoom]
+    # The rooms in each range of each list
+    windows: Mapping[str, Tuple[Tuple[str, ...], ...]]
+    count: int
+
+
+@attr.s(slots=True, auto_attribs=True)
+class _Connection:
+    positions: "OrderedDict[str, _Position]" = attr.Factory(OrderedDict)
+    next_pos: int = 1
+    index: Optional[RoomListIndex] = None
+
+    def add_position(self, position: _Position) -> str:
+        pos = str(self.next_pos)
+        self.next_pos += 1
+        self.positions[pos] = position
+        while len(self.positions) > MAX_POSITIONS_PER_CONNECTION:
+            self.positions.popitem(last=False)
+        return pos
+
+
+@attr.s(slots=True, auto_attribs=True)
+class _SlidingSyncResult:
+    position: _Position
+    lists: JsonDict
+    rooms: JsonDict
+    has_changes: bool
+
+    def __bool__(self) -> bool:
+        return self.has_changes
+
+
+class SlidingSyncHandler:
+    def __init__(self, hs: "HomeServer"):
+        self.clock = hs.get_clock()
+        self.store = hs.get_datastores().main
+        self.notifier = hs.get_notifier()
+        self.event_sources = hs.get_event_sources()
+        self._storage_controllers = hs.get_storage_controllers()
+        self._event_serializer = hs.get_event_client_serializer()
+
+        # The connections by user, device and connection id
+        self._connections: ExpiringCache[
+            Tuple[str, Optional[str], Optional[str]], _Connection
+        ] = ExpiringCache(
+            "sliding_sync_connections",
+            self.clock,
+            max_len=MAX_CONNECTIONS,
+            expiry_ms=CONNECTION_EXPIRY_MS,
+            reset_expiry_on_get=True,
+        )
+
+    async def sliding_sync(
+        self,
+        requester: Requester,
+        request: SlidingSyncRequest,
+        pos: Optional[str],
+        timeout: int,
+    ) -> JsonDict:
+        """Compute the response to a sliding sync request.
+
+        Args:
+            requester: the user syncing
+            request: the lists and the room subscriptions requested
+            pos: the position returned by the previous request of the connection, if
+                any. The connection is reset if not set.
+            timeout: how long to wait for changes, in milliseconds
+
+        Returns:
+            the response, with the new position of the connection as 'pos'
+        """
+        user_id = requester.user.to_string()
+        key = (user_id, requester.device_id, request.conn_id)
+
+        from_position = None
+        connection = self._connections.get(key)
+        if pos is None or connection is None:
+            if pos is not None:
+                raise SynapseError(400, "Unknown position", Codes.UNKNOWN_POS)
+            connection = _Connection()
+            self._connections[key] = connection
+        else:
+            from_position = connection.positions.get(pos)
+            if from_position is None:
+                raise SynapseError(400, "Unknown position", Codes.UNKNOWN_POS)
+
+        async def compute(
+            before_token: StreamToken, after_token: StreamToken
+        ) -> _SlidingSyncResult:
+            return await self._compute(
+                requester, connection, request, from_position, after_token
+            )
+
+        now_token = self.event_sources.get_current_token()
+        result = await compute(now_token, now_token)
+        if not result and timeout:
+            result = await self.notifier.wait_for_events(
+                user_id, timeout, compute, from_token=now_token
+            )
+
+        return {
+            "pos": connection.add_position(result.position),
+            "lists": result.lists,
+            "rooms": result.rooms,
+            "extensions": {},
+        }
+
+    async def _get_index(
+        self, user_id: str, connection: _Connection, to_token: StreamToken
+    ) -> RoomListIndex:
+        """Bring the room list index of a connection up to date.
+
+        The index is rebuilt when the memberships of the user changed, otherwise only
+        the recency of the rooms which changed is refreshed.
+        """
+        index = connection.index
+        if index is not None:
+            from_key = index.token.room_key
+            if from_key == to_token.room_key:
+                return index
+            if not await self.store.get_membership_changes_for_user(
+                user_id, from_key, to_token.room_key
+            ):
+                changed = self.store.get_rooms_that_changed(
+                    index.memberships, from_key
+                )
+                index.update_recency(await self.store.get_rooms_recency(changed))
+                index.token = to_token
+                return index
+
+        rooms = await self.store.get_sliding_sync_rooms(user_id)
+        index = RoomListIndex(rooms, to_token)
+        connection.index = index
+        return index
+
+    async def _compute(
+        self,
+        requester: Requester,
+        connection: _Connection,
+        request: SlidingSyncRequest,
+        from_position: Optional[_Position],
+        to_token: StreamToken,
+    ) -> _SlidingSyncResult:
+        user_id = requester.user.to_string()
+        index = await self._get_index(user_id, connection, to_token)
+
+        room_configs: Dict[str, RoomSyncConfig] = {}
+        windows = {}
+        lists = {}
+        for name, list_config in request.lists.items():
+            window = tuple(
+                index.get_range(start, end) for start, end in list_config.ranges
+            )
+            windows[name] = window
+            for room_ids in window:
+                for room_id in room_ids:
+                    config = room_configs.get(room_id)
+                    room_configs[room_id] = (
+                        list_config.room_config
+                        if config is None
+                        else config.combine(list_config.room_config)
+                    )
+
+            list_result: JsonDict = {"count": len(index)}
+            if from_position is None or from_position.windows.get(name) != window:
+                list_result["ops"] = [
+                    {"op": "SYNC", "range": list(range_), "room_ids": list(room_ids)}
+                    for range_, room_ids in zip(list_config.ranges, window)
+                ]
+            lists[name] = list_result
+
+        for room_id, subscription_config in request.room_subscriptions.items():
+            # The client can not subscribe to the rooms it can not see
+            if room_id not in index.memberships:
+                continue
+            config = room_configs.get(room_id)
+            room_configs[room_id] = (
+                subscription_config
+                if config is None
+                else config.combine(subscription_config)
+            )
+
+        if from_position is None:
+            previously_sent_rooms: Mapping[str, _SentRoom] = {}
+            changed_room_ids = set(room_configs)
+        else:
+            previously_sent_rooms = from_position.sent_rooms
+            changed_room_ids = self.store.get_rooms_that_changed(
+                room_configs, from_position.token.room_key
+            )
+
+        rooms: JsonDict = {}
+        sent_rooms: Dict[str, _SentRoom] = {}
+
+        async def compute_room(room_id: str) -> None:
+            config = room_configs[room_id]
+            membership = index.memberships[room_id]
+            sent = previously_sent_rooms.get(room_id)
+            # A room is sent in full again when it comes back into the windows, as
+            # its events in the meantime were not sent, or when the user joined it
+            if sent is None or sent.membership != membership:
+                rooms[room_id], sent_rooms[room_id] = await self._compute_initial_room(
+                    requester, room_id, membership, config, to_token
+                )
+            else:
+                assert from_position is not None
+                room, sent_rooms[room_id] = await self._compute_room_changes(
+                    requester,
+                    room_id,
+                    config,
+                    sent,
+                    room_id in changed_room_ids,
+                    from_position.token,
+                    to_token,
+                )
+                if room:
+                    rooms[room_id] = room
+
+        await concurrently_execute(compute_room, room_configs, ROOM_CONCURRENCY)
+
+        return _SlidingSyncResult(
+            position=_Position(
+                token=to_token,
+                sent_rooms=sent_rooms,
+                windows=windows,
+                count=len(index),
+            ),
+            lists=lists,
+            rooms=rooms,
+            has_changes=(
+                from_position is None
+                or bool(rooms)
+                or from_position.count != len(index)
+                or any("ops" in list_result for list_result in lists.values())
+            ),
+        )
+
+    async def _compute_initial_room(
+        self,
+        requester: Requester,
+        room_id: str,
+        membership: str,
+        config: RoomSyncConfig,
+        to_token: StreamToken,
+    ) -> Tuple[JsonDict, _SentRoom]:
+        user_id = requester.user.to_string()
+        time_now = self.clock.time_msec()
+
+        if membership == Membership.INVITE:
+            (
+                _,
+                event_id,
+            ) = await self.store.get_local_current_membership_for_user_in_room(
+                user_id, room_id
+            )
+            invite = await self.store.get_event(event_id, allow_none=True)
+            return {
+                "initial": True,
+                "invite_state": (
+                    invite.unsigned.get("invite_room_state", []) if invite else []
+                ),
+            }, _SentRoom(membership)
+
+        state_ids = await self._storage_controllers.state.get_current_state_ids(
+            room_id
+        )
+        room: JsonDict = {
+            "initial": True,
+            "name": await calculate_room_name(self.store, state_ids, user_id),
+            "joined_count": await self.store.get_number_joined_users_in_room(room_id),
+            **await self._get_notification_counts(room_id, user_id),
+        }
+
+        required_state = await self._get_required_state(
+            room_id, user_id, config.required_state
+        )
+        room["required_state"] = await self._event_serializer.serialize_events(
+            required_state,
+            time_now,
+            config=SerializeEventConfig(requester=requester),
+        )
+
+        if config.timeline_limit:
+            events, start_key = await self.store.get_recent_events_for_room(
+                room_id, config.timeline_limit, to_token.room_key
+            )
+            room["limited"] = len(events) >= config.timeline_limit
+            room["prev_batch"] = await to_token.copy_and_replace(
+                StreamKeyType.ROOM, start_key
+            ).to_string(self.store)
+            room["timeline"] = await self._serialize_timeline(requester, events)
+
+        return room, _SentRoom(
+            membership,
+            name=room["name"],
+            joined_count=room["joined_count"],
+            notification_count=room["notification_count"],
+            highlight_count=room["highlight_count"],
+            required_state_ids=frozenset(event.event_id for event in required_state),
+        )
+
+    async def _compute_room_changes(
+        self,
+        requester: Requester,
+        room_id: str,
+        config: RoomSyncConfig,
+        sent: _SentRoom,
+        changed: bool,
+        from_token: StreamToken,
+        to_token: StreamToken,
+    ) -> Tuple[Optional[JsonDict], _SentRoom]:
+        """Compute the changes of a room since what was sent of it.
+
+        Args:
+            changed: whether there are new events in the room since `from_token`.
+                Otherwise only its notification counts, which are cleared by the read
+                receipts, are checked.
+        """
+        # The invitee can not see the events of the room
+        if sent.membership == Membership.INVITE:
+            return None, sent
+
+        user_id = requester.user.to_string()
+        room: JsonDict = {}
+
+        counts = await self._get_notification_counts(room_id, user_id)
+        if (counts["notification_count"], counts["highlight_count"]) != (
+            sent.notification_count,
+            sent.highlight_count,
+        ):
+            room.update(counts)
+        sent = attr.evolve(
+            sent,
+            notification_count=counts["notification_count"],
+            highlight_count=counts["highlight_count"],
+        )
+
+        if not changed:
+            return room or None, sent
+
+        if config.timeline_limit:
+            events, start_key = await self.store.get_room_events_stream_for_room(
+                room_id,
+                from_key=from_token.room_key,
+                to_key=to_token.room_key,
+                limit=config.timeline_limit,
+            )
+            if events:
+                room["timeline"] = await self._serialize_timeline(requester, events)
+                room["limited"] = len(events) >= config.timeline_limit
+                if room["limited"]:
+                    room["prev_batch"] = await to_token.copy_and_replace(
+                        StreamKeyType.ROOM, start_key
+                    ).to_string(self.store)
+
+        # The name, the members and the required state are compared with what was
+        # sent, as they can change without any event in the timeline sent
+        state_ids = await self._storage_controllers.state.get_current_state_ids(
+            room_id
+        )
+        name = await calculate_room_name(self.store, state_ids, user_id)
+        if name != sent.name:
+            room["name"] = name
+        joined_count = await self.store.get_number_joined_users_in_room(room_id)
+        if joined_count != sent.joined_count:
+            room["joined_count"] = joined_count
+
+        required_state = await self._get_required_state(
+            room_id, user_id, config.required_state
+        )
+        changed_state = [
+            event
+            for event in required_state
+            if event.event_id not in sent.required_state_ids
+        ]
+        if changed_state:
+            room["required_state"] = await self._event_serializer.serialize_events(
+                changed_state,
+                self.clock.time_msec(),
+                config=SerializeEventConfig(requester=requester),
+            )
+
+        return room or None, attr.evolve(
+            sent,
+            name=name,
+            joined_count=joined_count,
+            required_state_ids=frozenset(event.event_id for event in required_state),
+        )
+
+    async def _get_required_state(
+        self,
+        room_id: str,
+        user_id: str,
+        required_state: FrozenSet[Tuple[str, str]],
+    ) -> list:
+        if not required_state:
+            return []
+
+        pairs = {
+            (event_type, user_id if state_key == STATE_KEY_ME else state_key)
+            for event_type, state_key in required_state
+        }
+        if any(event_type == WILDCARD for event_type, _ in pairs):
+            state_filter = StateFilter.all()
+        else:
+            state_filter = StateFilter.from_types(
+                (event_type, None if state_key == WILDCARD else state_key)
+                for event_type, state_key in pairs
+            )
+
+        state = await self._storage_controllers.state.get_current_state(
+            room_id, state_filter
+        )
+        return [
+            event
+            for (event_type, state_key), event in state.items()
+            if any(
+                required_type in (WILDCARD, event_type)
+                and required_state_key in (WILDCARD, state_key)
+                for required_type, required_state_key in pairs
+            )
+        ]
+
+    async def _serialize_timeline(self, requester: Requester, events: list) -> list:
+        events = await filter_events_for_client(
+            self._storage_controllers, requester.user.to_string(), events
+        )
+        return await self._event_serializer.serialize_events(
+            events,
+            self.clock.time_msec(),
+            config=SerializeEventConfig(requester=requester),
+        )
+
+    async def _get_notification_counts(self, room_id: str, user_id: str) -> JsonDict:
+        counts = await self.store.get_unread_event_push_actions_by_room_for_user(
+            room_id, user_id
+        )
+        return {
+            "notification_count": counts.main_timeline.notify_count,
+            "highlight_count": counts.main_timeline.highlight_count,
+        }
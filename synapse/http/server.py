@@ -37,6 +37,7 @@ from typing import (
     Iterable,
     Iterator,
     List,
+    Mapping,  # watcha+
     Optional,
     Pattern,
     Tuple,
@@ -73,6 +74,10 @@ from synapse.api.errors import (
 )
 from synapse.config.homeserver import HomeServerConfig
 from synapse.logging.context import defer_to_thread, preserve_fn, run_in_background
+from synapse.logging.context import (  # watcha+
+    PreserveLoggingContext,
+    current_context,
+)
 from synapse.logging.opentracing import active_span, start_active_span, trace_servlet
 from synapse.util import json_encoder
 from synapse.util.caches import intern_dict
@@ -801,6 +806,186 @@ def respond_with_json(
     return NOT_DONE_YET
 
 
+# watcha+
+def respond_with_json_iterator(
+    request: "SynapseRequest",
+    code: int,
+    json_iterator: Iterator[bytes],
+    send_cors: bool = False,
+) -> Optional[int]:
+    """Sends JSON in response to the given request, as it is produced by an
+    iterator of encoded chunks.
+
+    This is useful for large responses, which would otherwise be held in memory
+    both as objects and as encoded bytes. The iterator is consumed on a thread, so
+    that the encoding doesn't block the reactor: it must not touch the reactor or
+    the database.
+
+    Args:
+        request: The http request to respond to.
+        code: The HTTP response code.
+        json_iterator: Iterator of the encoded JSON chunks.
+        send_cors: Whether to send Cross-Origin Resource Sharing headers
+            https://fetch.spec.whatwg.org/#http-cors-protocol
+
+    Returns:
+        twisted.web.server.NOT_DONE_YET if the request is still active.
+    """
+    request.setResponseCode(code)
+
+    if request._disconnected:
+        logger.warning(
+            "Not sending response to request %s, already disconnected.", request
+        )
+        return None
+
+    request.setHeader(b"Content-Type", b"application/json")
+    request.setHeader(b"Cache-Control", b"no-cache, no-store, must-revalidate")
+
+    if send_cors:
+        set_cors_headers(request)
+
+    _ThreadedByteProducer(request, json_iterator)
+    return NOT_DONE_YET
+
+
+@implementer(interfaces.IPushProducer)
+class _ThreadedByteProducer:
+    """
+    Iteratively write bytes to the request, pulling them from the iterator on a
+    thread.
+
+    This is done so that the encoding of large responses, which the iterator does
+    as it is consumed, doesn't block the reactor thread.
+    """
+
+    # The minimum number of bytes pulled from the iterator on each trip to the
+    # threadpool. Note that the last batch will usually be smaller than this.
+    min_batch_size = 64 * 1024
+
+    def __init__(
+        self,
+        request: Request,
+        iterator: Iterator[bytes],
+    ):
+        self._request: Optional[Request] = request
+        self._iterator = iterator
+        self._paused = False
+        # Whether a batch is being pulled from the iterator, as it is not thread
+        # safe and the batches must be written in order.
+        self._producing = False
+        self._logcontext = current_context()
+
+        try:
+            self._request.registerProducer(self, True)
+        except AttributeError as e:
+            # The channel of the request is None if the connection was lost.
+            logger.info("Connection disconnected before response was written: %r", e)
+
+            self._request = None
+            self._iterator = iter(())
+        else:
+            self.resumeProducing()
+
+    def pauseProducing(self) -> None:
+        self._paused = True
+
+    def resumeProducing(self) -> None:
+        if not self._request:
+            return
+
+        self._paused = False
+        if not self._producing:
+            self._producing = True
+            # Twisted calls us from the sentinel context
+            with PreserveLoggingContext(self._logcontext):
+                run_in_background(self._produce)
+
+    def stopProducing(self) -> None:
+        # Clear a circular reference.
+        self._request = None
+
+    async def _produce(self) -> None:
+        try:
+            # Write until there's backpressure telling us to stop.
+            while self._request and not self._paused:
+                data, done = await defer_to_thread(
+                    self._request.reactor, self._next_batch
+                )
+                # The connection may have been lost in the meantime.
+                if not self._request:
+                    return
+
+                if data:
+                    self._request.write(data)
+                if done:
+                    self._request.unregisterProducer()
+                    self._request.finish()
+                    self.stopProducing()
+                    return
+        except Exception:
+            logger.exception("Failed to produce the response")
+            if self._request:
+                self._request.unregisterProducer()
+                self._request.loseConnection()
+                self.stopProducing()
+        finally:
+            self._producing = False
+
+    def _next_batch(self) -> Tuple[bytes, bool]:
+        """Pull the next batch of bytes from the iterator, and whether it is done.
+
+        The output of the iterator is coalesced, as each call to `Request.write`
+        becomes a separate chunk of the response.
+        """
+        buffer = []
+        buffered_bytes = 0
+        while buffered_bytes < self.min_batch_size:
+            try:
+                data = next(self._iterator)
+            except StopIteration:
+                return b"".join(buffer), True
+            buffer.append(data)
+            buffered_bytes += len(data)
+        return b"".join(buffer), False
+
+
+def iterencode_json(
+    json_object: Any, split_depth: int, consume: bool = False
+) -> Iterator[bytes]:
+    """Encode an object into JSON piece by piece.
+
+    The mappings nested up to `split_depth` levels are walked, and the values below
+    them are encoded one at a time. Unlike `JSONEncoder.iterencode`, which falls
+    back to the Python implementation, every piece is encoded by the C backend, and
+    the encoded response is never held in memory as a whole.
+
+    Args:
+        json_object: The object to serialize to JSON.
+        split_depth: The number of levels of mappings to walk.
+        consume: Whether to remove the values of the mappings of the last walked
+            level once they are encoded, so that the memory of the object is freed
+            as the response is produced. These mappings must not be shared.
+
+    Returns:
+        An iterator of the encoded JSON chunks.
+    """
+    if split_depth <= 0 or not isinstance(json_object, Mapping) or not json_object:
+        yield json_encoder.encode(json_object).encode("utf-8")
+        return
+
+    consume_values = consume and split_depth == 1
+    separator = b"{"
+    for key in list(json_object) if consume_values else json_object:
+        value = json_object.pop(key) if consume_values else json_object[key]
+        yield separator + json_encoder.encode(key).encode("utf-8") + b":"
+        yield from iterencode_json(value, split_depth - 1, consume)
+        del value
+        separator = b","
+    yield b"}"
+
+
+# +watcha
 def respond_with_json_bytes(
     request: "SynapseRequest",
     code: int,
@@ -0,0 +1,205 @@
+import functools
+import logging
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram
+from twisted.internet.error import ConnectError, DNSLookupError
+from twisted.web.client import HTTPConnectionPool, ResponseNeverReceived
+
+from synapse.api.errors import HttpResponseException, RequestTimedOutError, SynapseError
+from synapse.http.client import SimpleHttpClient
+from synapse.http.proxyagent import ProxyAgent
+from synapse.util.watcha import build_log_message
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+operation_counter = Counter(
+    "synapse_watcha_http_client_operations",
+    "Number of operations of the clients of the services Watcha integrates with",
+    ["service", "operation", "result"],
+)
+
+operation_timer = Histogram(
+    "synapse_watcha_http_client_operation_time_seconds",
+    "Time spent on operations of the clients of the services Watcha integrates with",
+    ["service", "operation"],
+)
+
+circuit_open_gauge = Gauge(
+    "synapse_watcha_http_client_circuit_open",
+    "Whether requests to a service fail fast as the service looks down",
+    ["service"],
+)
+
+# Errors showing that a service is down or overloaded, as opposed to the
+# errors of requests the service answered.
+SERVICE_FAILURES = (
+    ConnectError,
+    DNSLookupError,
+    RequestTimedOutError,
+    ResponseNeverReceived,
+)
+
+
+class ServiceUnavailableError(SynapseError):
+    """Raised without sending a request when a service looks down."""
+
+    def __init__(self, service: str):
+        super().__init__(503, f"[Watcha] {service} is unavailable")
+        self.service = service
+
+
+def is_service_failure(error: Exception) -> bool:
+    if isinstance(error, HttpResponseException):
+        return error.code >= 500
+    return isinstance(error, SERVICE_FAILURES)
+
+
+class CircuitBreaker:
+    """Fails fast while a service looks down.
+
+    The circuit opens after `failure_threshold` consecutive failures. While it is
+    open, calls are refused until `reset_timeout_ms` is elapsed, after which a
+    single call is let through to probe the service: the circuit closes if it
+    succeeds, and opens again otherwise.
+    """
+
+    def __init__(
+        self, clock, service: str, failure_threshold: int, reset_timeout_ms: int
+    ):
+        self.clock = clock
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_ms = reset_timeout_ms
+
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_call(self) -> bool:
+        """Raise `ServiceUnavailableError` if the call must not be sent.
+
+        Returns:
+            whether the call is the one probing the service.
+        """
+        if self._opened_at is None:
+            return False
+        if (
+            self._probing
+            or self.clock.time_msec() < self._opened_at + self.reset_timeout_ms
+        ):
+            raise ServiceUnavailableError(self.service)
+        self._probing = True
+        return True
+
+    def cancel_probe(self):
+        """Let another call probe the service, as the probing call ended without
+        reaching it."""
+        self._probing = False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info(build_log_message(log_vars={"service": self.service}))
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        circuit_open_gauge.labels(self.service).set(0)
+
+    def record_failure(self):
+        self._failures += 1
+        self._probing = False
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warn(
+                    build_log_message(
+                        log_vars={"service": self.service, "failures": self._failures}
+                    )
+                )
+            self._opened_at = self.clock.time_msec()
+            circuit_open_gauge.labels(self.service).set(1)
+
+
+class ServiceHttpClient(SimpleHttpClient):
+    """An HTTP client dedicated to one of the services Watcha integrates with.
+
+    It keeps its own pool of persistent connections, reports metrics per operation
+    and stops sending requests for a while when the service looks down, so that
+    callers fail fast instead of waiting for timeouts. Operations are the methods
+    decorated with `operation`.
+    """
+
+    SERVICE_NAME = "service"
+    MAX_PERSISTENT_CONNECTIONS = 20
+    CACHED_CONNECTION_TIMEOUT_S = 2 * 60
+    CONNECT_TIMEOUT_S = 5
+    CIRCUIT_FAILURE_THRESHOLD = 5
+    CIRCUIT_RESET_TIMEOUT_MS = 30 * 1000
+
+    def __init__(self, hs: "HomeServer"):
+        super().__init__(hs)
+
+        pool = HTTPConnectionPool(self.reactor)
+        pool.maxPersistentPerHost = self.MAX_PERSISTENT_CONNECTIONS
+        pool.cachedConnectionTimeout = self.CACHED_CONNECTION_TIMEOUT_S
+        self.agent = ProxyAgent(
+            self.reactor,
+            hs.get_reactor(),
+            connectTimeout=self.CONNECT_TIMEOUT_S,
+            contextFactory=hs.get_http_client_context_factory(),
+            pool=pool,
+        )
+
+        self.circuit_breaker = CircuitBreaker(
+            self.clock,
+            self.SERVICE_NAME,
+            self.CIRCUIT_FAILURE_THRESHOLD,
+            self.CIRCUIT_RESET_TIMEOUT_MS,
+        )
+
+
+def operation(func: F) -> F:
+    """Decorate a method of a `ServiceHttpClient` sending requests to its service."""
+    name = func.__name__.lstrip("_")
+
+    @functools.wraps(func)
+    async def wrapper(self: ServiceHttpClient, *args: Any, **kwargs: Any) -> Any:
+        service = self.SERVICE_NAME
+        try:
+            probing = self.circuit_breaker.before_call()
+        except ServiceUnavailableError:
+            operation_counter.labels(service, name, "rejected").inc()
+            raise
+
+        with operation_timer.labels(service, name).time():
+            try:
+                result = await func(self, *args, **kwargs)
+            except ServiceUnavailableError:
+                # Raised by a nested operation without any request reaching the
+                # service, which tells nothing about it.
+                if probing:
+                    self.circuit_breaker.cancel_probe()
+                operation_counter.labels(service, name, "rejected").inc()
+                raise
+            except Exception as error:
+                if is_service_failure(error):
+                    self.circuit_breaker.record_failure()
+                    operation_counter.labels(service, name, "failure").inc()
+                else:
+                    self.circuit_breaker.record_success()
+                    operation_counter.labels(service, name, "error").inc()
+                raise
+
+        self.circuit_breaker.record_success()
+        operation_counter.labels(service, name, "success").inc()
+        return result
+
+    return wrapper  # type: ignore[return-value]
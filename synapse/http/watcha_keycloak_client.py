@@ -2,13 +2,31 @@ import logging
 from typing import List, Optional
 
 from jsonschema import validate
+from prometheus_client import Counter, Histogram
 
 from synapse.api.errors import HttpResponseException
-from synapse.http.client import SimpleHttpClient
+from synapse.http.watcha_client import ServiceHttpClient, operation
+from synapse.util.caches.response_cache import ResponseCache
 from synapse.util.watcha import ActionStatus, build_log_message
 
 logger = logging.getLogger(__name__)
 
+# The access token is renewed this long before it expires, to cover the latency
+# of the requests which use it.
+TOKEN_EXPIRY_MARGIN_MS = 30 * 1000
+
+token_cache_counter = Counter(
+    "synapse_watcha_keycloak_token_cache",
+    "Number of Keycloak admin access token lookups, by whether the cached token was used",
+    ["result"],
+)
+
+token_refresh_timer = Histogram(
+    "synapse_watcha_keycloak_token_refresh_time_seconds",
+    "Time spent getting a new Keycloak admin access token",
+    ["grant_type"],
+)
+
 TOKEN_SCHEMA = {
     "$schema": "http://json-schema.org/draft-04/schema#",
     "description": "Keycloak token schema",
@@ -17,6 +35,15 @@ TOKEN_SCHEMA = {
         "access_token": {
             "type": "string",
         },
+        "expires_in": {
+            "type": "number",
+        },
+        "refresh_token": {
+            "type": "string",
+        },
+        "refresh_expires_in": {
+            "type": "number",
+        },
     },
     "required": ["access_token"],
 }
@@ -37,9 +64,11 @@ USER_SCHEMA = {
 }
 
 
-class KeycloakClient(SimpleHttpClient):
+class KeycloakClient(ServiceHttpClient):
     """Interface for talking with Keycloak APIs"""
 
+    SERVICE_NAME = "keycloak"
+
     def __init__(self, hs):
         super().__init__(hs)
 
@@ -50,6 +79,15 @@ class KeycloakClient(SimpleHttpClient):
             hs.config.watcha.keycloak_service_account_password
         )
 
+        self.clock = hs.get_clock()
+        self._access_token = None
+        self._access_token_expires_at = 0
+        self._refresh_token = None
+        self._refresh_token_expires_at = 0
+        # Concurrent requests share the same token renewal.
+        self._token_renewals = ResponseCache(self.clock, "keycloak_access_token")
+
+    @operation
     async def add_user(
         self,
         password_hash: str,
@@ -106,6 +144,7 @@ class KeycloakClient(SimpleHttpClient):
         logger.info(build_log_message(status=ActionStatus.SUCCESS))
         return response
 
+    @operation
     async def delete_user(self, user_id):
         """Delete an existing user
 
@@ -120,6 +159,7 @@ class KeycloakClient(SimpleHttpClient):
             headers=await self._get_header(),
         )
 
+    @operation
     async def get_user_by_email(self, email) -> dict:
         """Get a specific Keycloak user.
 
@@ -138,6 +178,7 @@ class KeycloakClient(SimpleHttpClient):
 
         return response[0]
 
+    @operation
     async def get_users(self) -> List[dict]:
         """Get a list of Keycloak users.
 
@@ -154,6 +195,7 @@ class KeycloakClient(SimpleHttpClient):
 
         return response
 
+    @operation
     async def update_user(self, user_id, attributes):
         """Update specific attribute of a Keycloak user
 
@@ -176,25 +218,85 @@ class KeycloakClient(SimpleHttpClient):
     async def _get_access_token(self):
         """Get the realm Keycloak access token in order to use Keycloak Admin API.
 
+        The token is cached until shortly before it expires.
+
         Returns:
             The realm Keycloak access token.
         """
+        if (
+            self._access_token is not None
+            and self.clock.time_msec() < self._access_token_expires_at
+        ):
+            token_cache_counter.labels("hit").inc()
+            return self._access_token
+
+        token_cache_counter.labels("miss").inc()
+        return await self._token_renewals.wrap(
+            "access_token", self._renew_access_token
+        )
 
-        response = await self.post_urlencoded_get_json(
-            uri=self._get_endpoint(
-                "realms/{}/protocol/openid-connect/token", self.realm_name
-            ),
-            args={
-                "client_id": "admin-cli",
-                "grant_type": "password",
-                "username": self.service_account_name,
-                "password": self.service_account_password,
-            },
+    async def _renew_access_token(self):
+        """Get a new access token, using the refresh token if it is still valid.
+
+        Returns:
+            The realm Keycloak access token.
+        """
+        now = self.clock.time_msec()
+        response = None
+
+        if self._refresh_token is not None and now < self._refresh_token_expires_at:
+            try:
+                response = await self._request_token(
+                    grant_type="refresh_token", refresh_token=self._refresh_token
+                )
+            except HttpResponseException as error:
+                # The session may have ended on Keycloak side, log in again.
+                logger.warn(build_log_message(log_vars={"error": error}))
+
+        if response is None:
+            response = await self._request_token(
+                grant_type="password",
+                username=self.service_account_name,
+                password=self.service_account_password,
+            )
+
+        # Expiry delays are relative to the time of the request.
+        expires_in_ms = response.get("expires_in", 0) * 1000
+        self._access_token = response["access_token"]
+        self._access_token_expires_at = now + expires_in_ms - TOKEN_EXPIRY_MARGIN_MS
+
+        refresh_expires_in_ms = response.get("refresh_expires_in", 0) * 1000
+        self._refresh_token = response.get("refresh_token")
+        self._refresh_token_expires_at = (
+            now + refresh_expires_in_ms - TOKEN_EXPIRY_MARGIN_MS
         )
 
+        return self._access_token
+
+    async def _request_token(self, grant_type, **args):
+        """Request a token to the Keycloak token endpoint.
+
+        It is not an `operation` of its own: it is requested by the operations
+        needing the token, which account for its failures once.
+
+        Args:
+            grant_type: the OAuth2 grant type, e.g. 'password' or 'refresh_token'
+            args: the parameters of the grant
+
+        Returns:
+            The token response.
+        """
+        with token_refresh_timer.labels(grant_type).time():
+            response = await self.post_urlencoded_get_json(
+                uri=self._get_endpoint(
+                    "realms/{}/protocol/openid-connect/token", self.realm_name
+                ),
+                args={"client_id": "admin-cli", "grant_type": grant_type, **args},
+            )
+
         validate(response, TOKEN_SCHEMA)
 
-        return response["access_token"]
+        return response
 
     def _get_endpoint(self, path, *args):
         if args:
@@ -1,12 +1,23 @@
 import logging
 import secrets
 from base64 import b64encode
-from typing import List, Optional, TYPE_CHECKING
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    TypeVar,
+)
 
 from jsonschema import validate
+from prometheus_client import Counter, Histogram
 
 from synapse.api.errors import NextcloudError
-from synapse.http.client import SimpleHttpClient
+from synapse.http.watcha_client import ServiceHttpClient, operation
+from synapse.util.async_helpers import concurrently_execute
 from synapse.util.watcha import ActionStatus, build_log_message
 
 if TYPE_CHECKING:
@@ -14,6 +25,23 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# The maximum number of concurrent requests sent to Nextcloud by a fan-out
+FAN_OUT_CONCURRENCY = 10
+
+fan_out_timer = Histogram(
+    "synapse_watcha_nextcloud_fan_out_time_seconds",
+    "Time spent sending a Nextcloud request for each of many users",
+    ["operation"],
+)
+
+fan_out_error_counter = Counter(
+    "synapse_watcha_nextcloud_fan_out_errors",
+    "Number of failed Nextcloud requests of fan-outs",
+    ["operation"],
+)
+
 META_SCHEMA = {
     "type": "object",
     "properties": {
@@ -62,13 +90,37 @@ WITH_DATA_SCHEMA = {
     "required": ["ocs"],
 }
 
+GROUP_MEMBERS_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "description": "Nextcloud API schema of the members of a group",
+    "definitions": {"meta": META_SCHEMA},
+    "type": "object",
+    "properties": {
+        "ocs": {
+            "type": "object",
+            "properties": {
+                "meta": {"$ref": "#/definitions/meta"},
+                "data": {
+                    "type": "object",
+                    "properties": {
+                        "users": {"type": "array", "items": {"type": "string"}}
+                    },
+                },
+            },
+            "required": ["meta"],
+        },
+    },
+    "required": ["ocs"],
+}
+
 
-class NextcloudClient(SimpleHttpClient):
+class NextcloudClient(ServiceHttpClient):
     """Interface for talking with Nextcloud APIs
     https://docs.nextcloud.com/server/latest/developer_manual/client_apis/index.html
     """
 
     NEXTCLOUD_APP_NAME = "watcha"
+    SERVICE_NAME = "nextcloud"
 
     def __init__(self, hs: "HomeServer"):
         super().__init__(hs)
@@ -105,6 +157,75 @@ class NextcloudClient(SimpleHttpClient):
                 meta["message"],
             )
 
+    async def fan_out(
+        self,
+        operation: str,
+        func: Callable[[T], Awaitable[object]],
+        args: Iterable[T],
+    ) -> Dict[T, Exception]:
+        """Call a Nextcloud API for each of the given arguments, with a bounded
+        number of concurrent requests.
+
+        Args:
+            operation: the name of the operation, used in metrics
+            func: the function sending the request for one argument
+            args: the arguments to call the function with
+
+        Returns:
+            the error raised by each failed call, by argument
+        """
+        errors: Dict[T, Exception] = {}
+
+        async def call(arg: T):
+            try:
+                await func(arg)
+            except Exception as error:
+                errors[arg] = error
+
+        with fan_out_timer.labels(operation).time():
+            await concurrently_execute(call, args, FAN_OUT_CONCURRENCY)
+
+        if errors:
+            fan_out_error_counter.labels(operation).inc(len(errors))
+        return errors
+
+    async def add_users_to_group(
+        self, usernames: Iterable[str], group_id: str
+    ) -> Dict[str, Exception]:
+        """Add many users to the Nextcloud group.
+
+        Args:
+            usernames: the usernames of the users to add to the group
+            group_id: id of the Nextcloud group
+
+        Returns:
+            the error raised for each user who could not be added, by username
+        """
+        return await self.fan_out(
+            "add_user_to_group",
+            lambda username: self.add_user_to_group(username, group_id),
+            usernames,
+        )
+
+    async def remove_users_from_group(
+        self, usernames: Iterable[str], group_id: str
+    ) -> Dict[str, Exception]:
+        """Remove many users from the Nextcloud group.
+
+        Args:
+            usernames: the usernames of the users to remove from the group
+            group_id: id of the Nextcloud group
+
+        Returns:
+            the error raised for each user who could not be removed, by username
+        """
+        return await self.fan_out(
+            "remove_user_from_group",
+            lambda username: self.remove_user_from_group(username, group_id),
+            usernames,
+        )
+
+    @operation
     async def add_user(
         self,
         username: str,
@@ -155,6 +276,7 @@ class NextcloudClient(SimpleHttpClient):
             self._raise_for_status(meta)
             logger.info(build_log_message(status=ActionStatus.SUCCESS))
 
+    @operation
     async def delete_user(self, username: str):
         """Delete an existing user.
 
@@ -173,6 +295,7 @@ class NextcloudClient(SimpleHttpClient):
         validate(response, WITHOUT_DATA_SCHEMA)
         self._raise_for_status(response["ocs"]["meta"])
 
+    @operation
     async def add_group(self, group_id: str):
         """Adds a new Nextcloud group.
 
@@ -194,6 +317,7 @@ class NextcloudClient(SimpleHttpClient):
         validate(response, WITHOUT_DATA_SCHEMA)
         self._raise_for_status(response["ocs"]["meta"])
 
+    @operation
     async def set_group_displayname(self, group_id: str, displayname: str):
         """Set the displayname of a Nextcloud group
 
@@ -215,6 +339,7 @@ class NextcloudClient(SimpleHttpClient):
         validate(response, WITHOUT_DATA_SCHEMA)
         self._raise_for_status(response["ocs"]["meta"])
 
+    @operation
     async def delete_group(self, group_id: str):
         """Removes a existing Nextcloud group.
 
@@ -234,6 +359,27 @@ class NextcloudClient(SimpleHttpClient):
         validate(response, WITHOUT_DATA_SCHEMA)
         self._raise_for_status(response["ocs"]["meta"])
 
+    @operation
+    async def get_group_members(self, group_id: str) -> List[str]:
+        """Get the usernames of the members of a Nextcloud group.
+
+        Args:
+            group_id: id of the Nextcloud group
+
+        Status codes:
+            100: successful
+            404: group does not exist
+        """
+        response = await self.get_json(
+            uri=f"{self.nextcloud_url}/ocs/v1.php/cloud/groups/{group_id}",
+            headers=self._headers_for_ocs_api,
+        )
+
+        validate(response, GROUP_MEMBERS_SCHEMA)
+        self._raise_for_status(response["ocs"]["meta"])
+        return response["ocs"]["data"]["users"]
+
+    @operation
     async def add_user_to_group(self, username: str, group_id: str):
         """Add user to the Nextcloud group.
 
@@ -258,6 +404,7 @@ class NextcloudClient(SimpleHttpClient):
         validate(response, WITHOUT_DATA_SCHEMA)
         self._raise_for_status(response["ocs"]["meta"])
 
+    @operation
     async def remove_user_from_group(self, username: str, group_id: str) -> None:
         """Removes the specified user from the specified group.
 
@@ -282,6 +429,7 @@ class NextcloudClient(SimpleHttpClient):
         validate(response, WITHOUT_DATA_SCHEMA)
         self._raise_for_status(response["ocs"]["meta"])
 
+    @operation
     async def share(self, requester: str, path: str, group_id: str):
         """Share an existing file or folder with all permissions for a group.
 
@@ -332,6 +480,7 @@ class NextcloudClient(SimpleHttpClient):
 
         return response["ocs"]["data"]["id"]
 
+    @operation
     async def unshare(self, requester: str, share_id: str):
         """Remove a given Nextcloud share
 
@@ -355,6 +504,7 @@ class NextcloudClient(SimpleHttpClient):
     # calendar operations
     # ===================
 
+    @operation
     async def get_users_own_calendars(self, user_id: str):
         """List all calendars owned by a specific user.
 
@@ -367,6 +517,7 @@ class NextcloudClient(SimpleHttpClient):
             headers=self._headers,
         )
 
+    @operation
     async def get_calendar(self, user_id: str, calendar_id: int):
         """Get properties for a specific calendar from the perspective of a specific user.
 
@@ -380,6 +531,7 @@ class NextcloudClient(SimpleHttpClient):
             headers=self._headers,
         )
 
+    @operation
     async def reorder_calendars(self, user_id: str, calendar_id: int):
         """Move up a calendar at the top of the list for a specific user.
 
@@ -394,6 +546,7 @@ class NextcloudClient(SimpleHttpClient):
             json_body={},
         )
 
+    @operation
     async def create_and_share_calendar(
         self, room_id: str, displayname: str, user_ids: List[str]
     ):
@@ -415,6 +568,7 @@ class NextcloudClient(SimpleHttpClient):
             },
         )
 
+    @operation
     async def share_calendar(
         self,
         user_id: str,
@@ -443,6 +597,7 @@ class NextcloudClient(SimpleHttpClient):
             },
         )
 
+    @operation
     async def unshare_calendar(
         self, calendar_ids: List[int], room_id: str, delete_group: bool
     ):
@@ -463,6 +618,7 @@ class NextcloudClient(SimpleHttpClient):
             },
         )
 
+    @operation
     async def add_user_access_to_calendars(
         self, user_id: str, room_id: str, calendar_ids: List[int], displayname: str
     ):
@@ -486,6 +642,7 @@ class NextcloudClient(SimpleHttpClient):
             },
         )
 
+    @operation
     async def remove_user_access_to_calendars(self, user_id: str, room_id: str):
         """Revoke a user's access to a calendar in the context of a room.
 
@@ -502,6 +659,7 @@ class NextcloudClient(SimpleHttpClient):
             },
         )
 
+    @operation
     async def rename_calendars(
         self, calendar_ids: List[int], room_id: str, displayname: str
     ):
@@ -60,6 +60,10 @@ from synapse.media.media_storage import MediaStorage
 from synapse.media.storage_provider import StorageProviderWrapper
 from synapse.media.thumbnailer import Thumbnailer, ThumbnailError
 from synapse.media.url_previewer import UrlPreviewer
+from synapse.media.watcha_media_usage import (  # watcha+
+    MediaUsageReconciler,
+    get_size_on_disk,
+)
 from synapse.metrics.background_process_metrics import run_as_background_process
 from synapse.storage.databases.main.media_repository import LocalMedia, RemoteMedia
 from synapse.types import UserID
@@ -157,6 +161,10 @@ class MediaRepository:
                 MEDIA_RETENTION_CHECK_PERIOD_MS,
             )
 
+        self.media_usage_reconciler = MediaUsageReconciler(  # watcha+
+            hs, self.primary_base_path
+        )
+
         if hs.config.media.url_preview_enabled:
             self.url_previewer: Optional[UrlPreviewer] = UrlPreviewer(
                 hs, self, self.media_storage
@@ -294,6 +302,7 @@ class MediaRepository:
         file_info = FileInfo(server_name=None, file_id=media_id)
         fname = await self.media_storage.store_file(content, file_info)
         logger.info("Stored local media in file %r", fname)
+        await self.store.update_media_usage("local", os.path.getsize(fname))  # watcha+
 
         await self.store.update_local_media(
             media_id=media_id,
@@ -337,6 +346,7 @@ class MediaRepository:
         fname = await self.media_storage.store_file(content, file_info)
 
         logger.info("Stored local media in file %r", fname)
+        await self.store.update_media_usage("local", os.path.getsize(fname))  # watcha+
 
         await self.store.store_local_media(
             media_id=media_id,
@@ -723,6 +733,7 @@ class MediaRepository:
             )
 
         logger.info("Stored remote media in file %r", fname)
+        await self.store.update_media_usage("remote", length)  # watcha+
 
         return RemoteMedia(
             media_origin=server_name,
@@ -1099,6 +1110,12 @@ class MediaRepository:
                             media_id, t_width, t_height, t_type, t_method, t_len
                         )
 
+                    # watcha+
+                    # The url cache is only accounted for by the reconciliation.
+                    if not url_cache:
+                        await self.store.update_media_usage("thumbnails", t_len)
+                    # +watcha
+
         return {"width": m_width, "height": m_height}
 
     async def _apply_media_retention_rules(self) -> None:
@@ -1158,6 +1175,13 @@ class MediaRepository:
 
             async with self.remote_media_linearizer.queue(key):
                 full_path = self.filepaths.remote_media_filepath(origin, file_id)
+                # watcha+
+                thumbnail_dir = self.filepaths.remote_media_thumbnail_dir(
+                    origin, file_id
+                )
+                media_size = get_size_on_disk(full_path)
+                thumbnails_size = get_size_on_disk(thumbnail_dir)
+                # +watcha
                 try:
                     os.remove(full_path)
                 except OSError as e:
@@ -1175,6 +1199,11 @@ class MediaRepository:
                 await self.store.delete_remote_media(origin, media_id)
                 deleted += 1
 
+                # watcha+
+                await self.store.update_media_usage("remote", -media_size)
+                await self.store.update_media_usage("thumbnails", -thumbnails_size)
+                # +watcha
+
         return {"deleted": deleted}
 
     async def delete_local_media_ids(
@@ -1239,6 +1268,12 @@ class MediaRepository:
         for media_id in media_ids:
             logger.info("Deleting media with ID '%s'", media_id)
             full_path = self.filepaths.local_media_filepath(media_id)
+            # watcha+
+            media_size = get_size_on_disk(full_path)
+            thumbnails_size = get_size_on_disk(
+                self.filepaths.local_media_thumbnail_dir(media_id)
+            )
+            # +watcha
             try:
                 os.remove(full_path)
             except OSError as e:
@@ -1256,6 +1291,11 @@ class MediaRepository:
             await self.store.delete_url_cache((media_id,))
             await self.store.delete_url_cache_media((media_id,))
 
+            # watcha+
+            await self.store.update_media_usage("local", -media_size)
+            await self.store.update_media_usage("thumbnails", -thumbnails_size)
+            # +watcha
+
             removed_media.append(media_id)
 
         return removed_media, len(removed_media)
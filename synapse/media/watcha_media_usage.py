@@ -0,0 +1,109 @@
+import logging
+import os
+from typing import TYPE_CHECKING, Dict, List
+
+from synapse.logging.context import defer_to_thread
+from synapse.metrics.background_process_metrics import run_as_background_process
+from synapse.util.watcha import ActionStatus, build_log_message
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+# The media category of each top-level directory of the media store
+MEDIA_USAGE_CATEGORIES = {
+    "local_content": "local",
+    "remote_content": "remote",
+    "local_thumbnails": "thumbnails",
+    "remote_thumbnail": "thumbnails",
+    "url_cache": "url_cache",
+    "url_cache_thumbnails": "url_cache",
+}
+
+RECONCILE_MEDIA_USAGE_PERIOD_MS = 24 * 60 * 60 * 1000  # 1 day
+
+
+def get_size_on_disk(path: str) -> int:
+    """Get the number of bytes used by a file or by the files of a directory.
+
+    Missing files are ignored, as they may be deleted while walking the directory.
+    """
+    if not os.path.isdir(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return size
+
+
+def _list_chunks(path: str) -> List[str]:
+    """List the sub-directories of a media store directory, each of them being
+    walked separately."""
+    try:
+        with os.scandir(path) as entries:
+            return [entry.path for entry in entries]
+    except FileNotFoundError:
+        return []
+
+
+class MediaUsageReconciler:
+    """Periodically computes the disk usage of the media store, to correct the
+    running totals maintained by the `MediaRepository`.
+
+    The media store is walked on a thread, one sub-directory at a time, so that
+    neither the reactor nor the threadpool is held for long on large stores.
+    """
+
+    def __init__(self, hs: "HomeServer", base_path: str):
+        self.clock = hs.get_clock()
+        self.reactor = hs.get_reactor()
+        self.store = hs.get_datastores().main
+        self.base_path = base_path
+
+        self.clock.looping_call(self._start_reconcile, RECONCILE_MEDIA_USAGE_PERIOD_MS)
+        # Compute the usage at startup if it is not known yet.
+        self.clock.call_later(0, self._start_reconcile, only_if_unknown=True)
+
+    def _start_reconcile(self, only_if_unknown: bool = False):
+        return run_as_background_process(
+            "watcha_reconcile_media_usage", self.reconcile, only_if_unknown
+        )
+
+    async def reconcile(self, only_if_unknown: bool = False) -> Dict[str, int]:
+        """Walk the media store and replace the running totals of each category.
+
+        Args:
+            only_if_unknown: whether to walk the media store only if the usage has
+                never been computed.
+
+        Returns:
+            the number of bytes of each category
+        """
+        if only_if_unknown and await self.store.get_media_usage():
+            return {}
+
+        sizes = dict.fromkeys(MEDIA_USAGE_CATEGORIES.values(), 0)
+        for directory, category in MEDIA_USAGE_CATEGORIES.items():
+            chunks = await defer_to_thread(
+                self.reactor, _list_chunks, os.path.join(self.base_path, directory)
+            )
+            for chunk in chunks:
+                sizes[category] += await defer_to_thread(
+                    self.reactor, get_size_on_disk, chunk
+                )
+
+        await self.store.set_media_usage(sizes)
+        logger.info(
+            build_log_message(status=ActionStatus.SUCCESS, log_vars={"sizes": sizes})
+        )
+
+        return sizes
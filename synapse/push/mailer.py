@@ -22,6 +22,7 @@
 import logging
 import urllib.parse
 from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, TypeVar
+from typing import Any, Awaitable, Callable  # watcha+
 
 import bleach
 import jinja2
@@ -148,6 +149,7 @@ class Mailer:
         self.email_subjects: EmailSubjectConfig = hs.config.email.email_subjects
         self.account_handler = self.hs.get_account_validity_handler()  # watcha+
         self.profile_handler = self.hs.get_profile_handler()  # watcha+
+        self.mail_queue_handler = self.hs.get_mail_queue_handler()  # watcha+
 
         logger.info("Created Mailer for app_name %s" % app_name)
 
@@ -243,11 +245,9 @@ class Mailer:
             **b64_images,
         }
 
-        await self.send_email(
-            email_address,
-            subject,
-            template_vars,
-        )
+        # The temporary password must not be stored in the mail queue, and the
+        # caller must know whether it was delivered
+        await self.send_email(email_address, subject, template_vars, retried=True)
 
     # +watcha
 
@@ -452,9 +452,17 @@ class Mailer:
 
         emails_sent_counter.labels("notification").inc()
 
+        """ watcha!
         await self.send_email(
             email_address, summary_text, template_vars, unsubscribe_link
         )
+        !watcha"""
+        # watcha+
+        # The pusher only waits for the mail to be persisted in the mail queue
+        await self.send_email(
+            email_address, summary_text, template_vars, unsubscribe_link, queued=True
+        )
+        # +watcha
 
     async def send_email(
         self,
@@ -462,8 +470,17 @@ class Mailer:
         subject: str,
         extra_template_vars: TemplateVars,
         unsubscribe_link: Optional[str] = None,
+        queued: bool = False,  # watcha+
+        retried: bool = False,  # watcha+
     ) -> None:
-        """Send an email with the given information and template text"""
+        """Send an email with the given information and template text
+
+        watcha+
+        If `queued` is set, the email is persisted in the mail queue and delivered in
+        the background instead of being sent before returning. If `retried` is set, a
+        failed delivery is retried a few times before the error is raised.
+        +watcha
+        """
         template_vars: TemplateVars = {
             "app_name": self.app_name,
             "server_name": self.hs.config.server.server_name,
@@ -474,7 +491,19 @@ class Mailer:
         html_text = self.template_html.render(**template_vars)
         plain_text = self.template_text.render(**template_vars)
 
+        """ watcha!
         await self.send_email_handler.send_email(
+        !watcha"""
+        # watcha+
+        send_email: Callable[..., Awaitable[Any]]
+        if queued:
+            send_email = self.mail_queue_handler.enqueue_mail
+        elif retried:
+            send_email = self.mail_queue_handler.deliver_mail
+        else:
+            send_email = self.send_email_handler.send_email
+        await send_email(
+        # +watcha
             email_address=email_address,
             subject=subject,
             app_name=self.app_name,
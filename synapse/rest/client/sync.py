@@ -33,6 +33,7 @@ from synapse.events.utils import (
     format_event_raw,
 )
 from synapse.handlers.presence import format_user_presence_state
+from synapse.handlers.watcha_sliding_sync import parse_sliding_sync_request  # watcha+
 from synapse.handlers.sync import (
     ArchivedSyncResult,
     InvitedSyncResult,
@@ -42,7 +43,9 @@ from synapse.handlers.sync import (
     SyncResult,
 )
 from synapse.http.server import HttpServer
+from synapse.http.server import iterencode_json, respond_with_json_iterator  # watcha+
 from synapse.http.servlet import RestServlet, parse_boolean, parse_integer, parse_string
+from synapse.http.servlet import parse_json_object_from_request  # watcha+
 from synapse.http.site import SynapseRequest
 from synapse.logging.opentracing import trace_with_opname
 from synapse.types import JsonDict, Requester, StreamToken
@@ -55,6 +58,27 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# watcha+
+# The depth of the mappings of a sync response which are encoded key by key, down to
+# the entries of each room (e.g. `rooms.join.<room_id>`)
+SYNC_RESPONSE_SPLIT_DEPTH = 3
+
+
+def format_sync_timings(sync_result: SyncResult) -> str:
+    """Format the time spent in each phase of a sync as a Server-Timing header.
+
+    e.g. `rooms;dur=12.5, state_delta;dur=3.1, sync;desc="gappy"`
+    """
+    timings = [
+        f"{phase};dur={duration * 1000:.1f}"
+        for phase, duration in sync_result.phase_timings.items()
+    ]
+    timings.append(f'sync;desc="{sync_result.sync_type}"')
+    return ", ".join(timings)
+
+
+# +watcha
+
 
 class SyncRestServlet(RestServlet):
     """
@@ -109,8 +133,16 @@ class SyncRestServlet(RestServlet):
         self._event_serializer = hs.get_event_client_serializer()
         self._msc2654_enabled = hs.config.experimental.msc2654_enabled
         self._msc3773_enabled = hs.config.experimental.msc3773_enabled
+        self._sync_timings_header = hs.config.watcha.sync_timings_header  # watcha+
 
+    """ watcha!
     async def on_GET(self, request: SynapseRequest) -> Tuple[int, JsonDict]:
+    !watcha"""
+    # watcha+
+    async def on_GET(
+        self, request: SynapseRequest
+    ) -> Optional[Tuple[int, JsonDict]]:
+    # +watcha
         # This will always be set by the time Twisted calls us.
         assert request.args is not None
 
@@ -239,7 +271,26 @@ class SyncRestServlet(RestServlet):
         )
 
         logger.debug("Event formatting complete")
+        """ watcha!
         return 200, response_content
+        !watcha"""
+        # watcha+
+        if self._sync_timings_header and await self.auth.is_server_admin(requester):
+            request.setHeader(
+                b"Server-Timing", format_sync_timings(sync_result).encode("ascii")
+            )
+
+        # The response is encoded room by room on a thread as it is streamed, and each
+        # room is dropped once encoded, so that the response of users in many rooms is
+        # not held in memory both as objects and as encoded bytes.
+        respond_with_json_iterator(
+            request,
+            200,
+            iterencode_json(response_content, SYNC_RESPONSE_SPLIT_DEPTH, consume=True),
+            send_cors=True,
+        )
+        return None
+        # +watcha
 
     @trace_with_opname("sync.encode_response")
     async def encode_response(
@@ -553,5 +604,81 @@ class SyncRestServlet(RestServlet):
         return result
 
 
+# watcha+
+class SlidingSyncRestServlet(RestServlet):
+    """Sliding sync, in the spirit of MSC3575.
+
+    POST parameters::
+        pos(str): The position returned by the previous request of the connection.
+            The connection is reset if not set.
+        timeout(int): How long to wait for changes in milliseconds.
+
+    Request JSON::
+        {
+          "conn_id": // optional id of the connection, to sync several at once
+          "lists": {
+            "${list_name}": {
+              "ranges": [[0, 19]], // windows of the rooms ordered by recency
+              "timeline_limit": 10,
+              "required_state": [["m.room.topic", ""], ["m.room.member", "$ME"]]
+            }
+          },
+          "room_subscriptions": {
+            "${room_id}": {"timeline_limit": 10, "required_state": []}
+          }
+        }
+
+    Response JSON::
+        {
+          "pos": // position to send with the next request
+          "lists": {
+            "${list_name}": {
+              "count": // number of rooms in the list
+              "ops": [{"op": "SYNC", "range": [0, 19], "room_ids": [...]}]
+            }
+          },
+          "rooms": {
+            "${room_id}": {
+              "initial": // whether the room is sent for the first time
+              "name", "required_state", "timeline", "limited", "prev_batch",
+              "joined_count", "notification_count", "highlight_count"
+              // or "invite_state" for invites
+            }
+          },
+          "extensions": {}
+        }
+
+    The lists only contain operations when their windows changed.
+    """
+
+    PATTERNS = client_patterns("/org.matrix.msc3575/sync$", releases=(), unstable=True)
+
+    def __init__(self, hs: "HomeServer"):
+        super().__init__()
+        self.auth = hs.get_auth()
+        self.sliding_sync_handler = hs.get_sliding_sync_handler()
+
+    async def on_POST(self, request: SynapseRequest) -> Tuple[int, JsonDict]:
+        requester = await self.auth.get_user_by_req(request)
+
+        pos = parse_string(request, "pos")
+        timeout = parse_integer(request, "timeout", default=0)
+        sliding_sync_request = parse_sliding_sync_request(
+            parse_json_object_from_request(request)
+        )
+
+        result = await self.sliding_sync_handler.sliding_sync(
+            requester, sliding_sync_request, pos, timeout
+        )
+        return 200, result
+
+
+# +watcha
+
+
 def register_servlets(hs: "HomeServer", http_server: HttpServer) -> None:
     SyncRestServlet(hs).register(http_server)
+    # watcha+
+    if hs.config.experimental.msc3575_enabled:
+        SlidingSyncRestServlet(hs).register(http_server)
+    # +watcha
@@ -1,9 +1,12 @@
+import csv
 import logging
 
 from jsonschema.exceptions import SchemaError, ValidationError
+from unpaddedbase64 import decode_base64, encode_base64
 
 from synapse.api.errors import (
     AuthError,
+    Codes,
     HttpResponseException,
     NextcloudError,
     SynapseError,
@@ -11,16 +14,37 @@ from synapse.api.errors import (
 """ watcha!
 from synapse.config.emailconfig import ThreepidBehaviour
 !watcha"""
-from synapse.http.servlet import RestServlet, parse_json_object_from_request
+from synapse.http.server import respond_with_json_iterator
+from synapse.http.servlet import (
+    RestServlet,
+    parse_integer,
+    parse_json_object_from_request,
+    parse_string,
+)
 from synapse.push.mailer import Mailer
 from synapse.rest.admin._base import assert_requester_is_admin, assert_user_is_admin
 from synapse.rest.client._base import client_patterns
+from synapse.storage.databases.main.watcha_administration import (
+    ROOM_LIST_MAX_LIMIT,
+    ROOM_LIST_ORDER_BY,
+)
+from synapse.util import json_decoder, json_encoder
 from synapse.util.watcha import Secrets, build_log_message
 
 logger = logging.getLogger(__name__)
 
 
 class WatchaUserlistRestServlet(RestServlet):
+    """List the active users of the server.
+
+    Optional query parameters:
+        search: only list the users which id, display name or email address
+            contains this string.
+        limit: the size of a page. If set, the response is an object with the list
+            of users as 'users' and, if there may be more users, a 'next_batch' token.
+        from: the 'next_batch' token of the previous page.
+    """
+
     PATTERNS = client_patterns("/watcha_user_list", v1=True)
 
     def __init__(self, hs):
@@ -30,11 +54,41 @@ class WatchaUserlistRestServlet(RestServlet):
 
     async def on_GET(self, request):
         await assert_requester_is_admin(self.auth, request)
-        result = await self.administration_handler.watcha_user_list()
+
+        limit = _parse_limit(request)
+        users = await self.administration_handler.watcha_user_list(
+            search_term=parse_string(request, "search"),
+            from_user_id=parse_string(request, "from"),
+            limit=limit,
+        )
+
+        if limit is None:
+            return 200, users
+
+        result = {"users": users}
+        if len(users) == limit:
+            result["next_batch"] = users[-1]["user_id"]
         return 200, result
 
 
 class WatchaRoomListRestServlet(RestServlet):
+    """List the rooms of the server.
+
+    Optional query parameters:
+        type: only list the rooms of this type ('dm_room' or 'regular_room').
+        status: only list the rooms with this status ('new', 'active' or 'inactive').
+        member: only list the rooms which a member id contains this string.
+        order_by: the room attribute to sort by, defaults to 'room_id'.
+        dir: 'f' for ascending order (default), 'b' for descending order.
+        limit: the size of a page, at most ROOM_LIST_MAX_LIMIT. If set, the response
+            is an object with the list of rooms as 'rooms' and, if there may be more
+            rooms, a 'next_batch' token. Otherwise, all the rooms are listed, read
+            page by page.
+        from: the 'next_batch' token of the previous page.
+
+    The JSON body is streamed room by room.
+    """
+
     PATTERNS = client_patterns("/watcha_room_list", v1=True)
 
     def __init__(self, hs):
@@ -44,8 +98,99 @@ class WatchaRoomListRestServlet(RestServlet):
 
     async def on_GET(self, request):
         await assert_requester_is_admin(self.auth, request)
-        result = await self.store.watcha_room_list()
-        return 200, result
+
+        limit = _parse_limit(request)
+        filters = {
+            "room_type": parse_string(
+                request, "type", allowed_values=("dm_room", "regular_room")
+            ),
+            "status": parse_string(
+                request, "status", allowed_values=("new", "active", "inactive")
+            ),
+            "member": parse_string(request, "member"),
+            "order_by": parse_string(
+                request,
+                "order_by",
+                default="room_id",
+                allowed_values=tuple(ROOM_LIST_ORDER_BY),
+            ),
+            "direction": parse_string(
+                request, "dir", default="f", allowed_values=("f", "b")
+            ),
+        }
+        from_key = _decode_room_list_token(parse_string(request, "from"))
+
+        if limit is not None:
+            rooms, next_key = await self.store.watcha_room_list(
+                **filters, from_key=from_key, limit=min(limit, ROOM_LIST_MAX_LIMIT)
+            )
+        else:
+            rooms = []
+            next_key = from_key
+            while True:
+                page, next_key = await self.store.watcha_room_list(
+                    **filters, from_key=next_key
+                )
+                rooms.extend(page)
+                if next_key is None:
+                    break
+
+        respond_with_json_iterator(
+            request, 200, _encode_room_list(rooms, next_key, paginated=limit is not None)
+        )
+
+
+def _parse_limit(request):
+    limit = parse_integer(request, "limit")
+    if limit is not None and limit <= 0:
+        raise SynapseError(
+            400,
+            build_log_message(
+                action="check if limit is positive", log_vars={"limit": limit}
+            ),
+            Codes.INVALID_PARAM,
+        )
+    return limit
+
+
+def _encode_room_list_token(key):
+    return encode_base64(json_encoder.encode(key).encode(), urlsafe=True)
+
+
+def _decode_room_list_token(token):
+    if token is None:
+        return None
+
+    try:
+        value, room_id = json_decoder.decode(decode_base64(token).decode())
+        if not isinstance(room_id, str):
+            raise ValueError(room_id)
+    except (TypeError, ValueError) as e:
+        raise SynapseError(
+            400,
+            build_log_message(
+                action="decode room list token", log_vars={"from": token, "error": e}
+            ),
+            Codes.INVALID_PARAM,
+        )
+
+    return value, room_id
+
+
+def _encode_room_list(rooms, next_key, paginated):
+    """Encode the room list one room at a time, so that it is streamed to the client"""
+    yield b'{"rooms":[' if paginated else b"["
+    for index, room in enumerate(rooms):
+        if index:
+            yield b","
+        yield json_encoder.encode(room).encode()
+    yield b"]"
+
+    if paginated:
+        if next_key is not None:
+            yield b',"next_batch":'
+            yield json_encoder.encode(_encode_room_list_token(next_key)).encode()
+        yield b"}"
 
 
 class WatchaUpdateUserRoleRestServlet(RestServlet):
@@ -113,7 +258,7 @@ class WatchaAdminStatsRestServlet(RestServlet):
 
 
 class WatchaRegisterRestServlet(RestServlet):
-    PATTERNS = client_patterns("/watcha_register", v1=True)
+    PATTERNS = client_patterns("/watcha_register$", v1=True)
 
     def __init__(self, hs):
         super().__init__()
@@ -148,8 +293,98 @@ class WatchaRegisterRestServlet(RestServlet):
         return 200, {"user_id": user_id}
 
 
+def _parse_invitees_csv(content: bytes):
+    """Parse the invitees of a bulk registration from a CSV file, which header
+    names the columns among 'email', 'displayname', 'admin', 'keycloak_username'
+    and 'keycloak_as_broker'."""
+    try:
+        reader = csv.DictReader(content.decode("utf-8-sig").splitlines())
+        invitees = [
+            {key.strip(): value.strip() for key, value in row.items() if key and value}
+            for row in reader
+        ]
+    except (UnicodeDecodeError, csv.Error) as error:
+        raise SynapseError(
+            400,
+            build_log_message(action="parse CSV file", log_vars={"error": error}),
+            Codes.BAD_JSON,
+        )
+
+    for invitee in invitees:
+        for key in ("admin", "keycloak_as_broker"):
+            if key in invitee:
+                invitee[key] = invitee[key].lower() in ("1", "true", "yes")
+    return invitees
+
+
+class WatchaBulkRegisterRestServlet(RestServlet):
+    """Register many users in the background.
+
+    The invitees are given either as a JSON object with an 'invitees' list of the
+    parameters accepted by `/watcha_register`, or as a CSV file with these
+    parameters as columns. The response holds the id of the bulk registration,
+    which progress is returned by `GET /watcha_register/bulk/<id>`.
+    """
+
+    PATTERNS = client_patterns("/watcha_register/bulk$", v1=True)
+
+    def __init__(self, hs):
+        super().__init__()
+        self.auth = hs.get_auth()
+        self.registration_handler = hs.get_watcha_registration_handler()
+
+    async def on_POST(self, request):
+        requester = await self.auth.get_user_by_req(request)
+        await assert_user_is_admin(self.auth, requester.user)
+
+        content_types = request.requestHeaders.getRawHeaders(b"Content-Type") or []
+        if any(content_type.startswith(b"text/csv") for content_type in content_types):
+            invitees = _parse_invitees_csv(request.content.read())
+        else:
+            invitees = parse_json_object_from_request(request).get("invitees")
+
+        if not isinstance(invitees, list) or not invitees:
+            raise SynapseError(
+                400,
+                build_log_message(
+                    action="check if invitees are set",
+                    log_vars={"invitees": invitees},
+                ),
+                Codes.BAD_JSON,
+            )
+
+        task_id = await self.registration_handler.start_bulk_registration(
+            requester.user.to_string(), invitees
+        )
+
+        return 202, {"id": task_id}
+
+
+class WatchaBulkRegisterStatusRestServlet(RestServlet):
+    PATTERNS = client_patterns("/watcha_register/bulk/(?P<task_id>[^/]*)$", v1=True)
+
+    def __init__(self, hs):
+        super().__init__()
+        self.auth = hs.get_auth()
+        self.registration_handler = hs.get_watcha_registration_handler()
+
+    async def on_GET(self, request, task_id):
+        requester = await self.auth.get_user_by_req(request)
+        await assert_user_is_admin(self.auth, requester.user)
+
+        bulk_registration = await self.registration_handler.get_bulk_registration(
+            task_id
+        )
+        if bulk_registration is None:
+            raise SynapseError(404, "Unknown bulk registration", Codes.NOT_FOUND)
+
+        return 200, bulk_registration
+
+
 def register_servlets(hs, http_server):
     WatchaAdminStatsRestServlet(hs).register(http_server)
+    WatchaBulkRegisterRestServlet(hs).register(http_server)
+    WatchaBulkRegisterStatusRestServlet(hs).register(http_server)
     WatchaRegisterRestServlet(hs).register(http_server)
     WatchaRoomListRestServlet(hs).register(http_server)
     WatchaUpdateUserRoleRestServlet(hs).register(http_server)
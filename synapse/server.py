@@ -154,6 +154,8 @@ from synapse.util.task_scheduler import TaskScheduler
 # watcha+
 from synapse.handlers.watcha_administration import AdministrationHandler as WatchaAdministrationHandler
 from synapse.handlers.watcha_registration import RegistrationHandler as WatchaRegistrationHandler
+from synapse.handlers.watcha_mail import MailQueueHandler
+from synapse.handlers.watcha_sliding_sync import SlidingSyncHandler
 from synapse.handlers.watcha_nextcloud import NextcloudHandler
 from synapse.http.watcha_keycloak_client import KeycloakClient
 from synapse.http.watcha_nextcloud_client import NextcloudClient
@@ -260,6 +262,8 @@ class HomeServer(metaclass=abc.ABCMeta):
         "profile",
         "room_forgetter",
         "stats",
+        "nextcloud",  # watcha+
+        "mail_queue",  # watcha+
     ]
 
     # This is overridden in derived application classes
@@ -945,6 +949,14 @@ class HomeServer(metaclass=abc.ABCMeta):
     def get_nextcloud_handler(self) -> NextcloudHandler:
         return NextcloudHandler(self)
 
+    @cache_in_self
+    def get_mail_queue_handler(self) -> MailQueueHandler:
+        return MailQueueHandler(self)
+
+    @cache_in_self
+    def get_sliding_sync_handler(self) -> SlidingSyncHandler:
+        return SlidingSyncHandler(self)
+
     # +watcha
 
     @cache_in_self
@@ -58,6 +58,7 @@ from synapse.types import StateMap, StrCollection
 from synapse.types.state import StateFilter
 from synapse.util.async_helpers import Linearizer
 from synapse.util.caches.expiringcache import ExpiringCache
+from synapse.util.caches.lrucache import LruCache  # watcha+
 from synapse.util.metrics import Measure, measure_func
 
 if TYPE_CHECKING:
@@ -921,3 +922,16 @@ class StateResolutionStore:
         """
 
         return self.store.get_auth_chain_difference(room_id, state_sets)
+
+    # watcha+
+    @property
+    def power_levels_auth_cache(self) -> LruCache[str, Optional[str]]:
+        """The power levels event in the auth events of each event."""
+        return self.store.state_res_power_levels_cache
+
+    @property
+    def mainline_positions_cache(self) -> LruCache[str, Mapping[str, int]]:
+        """The positions of the events in the mainline of each power levels event."""
+        return self.store.state_res_mainline_cache
+
+    # +watcha
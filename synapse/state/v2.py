@@ -18,6 +18,7 @@
 #
 #
 
+import enum  # watcha+
 import heapq
 import itertools
 import logging
@@ -29,6 +30,7 @@ from typing import (
     Generator,
     Iterable,
     List,
+    Mapping,  # watcha+
     Optional,
     Sequence,
     Set,
@@ -44,6 +46,7 @@ from synapse.api.errors import AuthError
 from synapse.api.room_versions import RoomVersion
 from synapse.events import EventBase
 from synapse.types import MutableStateMap, StateMap, StrCollection
+from synapse.util.caches.lrucache import LruCache  # watcha+
 
 logger = logging.getLogger(__name__)
 
@@ -69,6 +72,17 @@ class StateResolutionStore(Protocol):
     ) -> Awaitable[Set[str]]:
         ...
 
+    # watcha+
+    @property
+    def power_levels_auth_cache(self) -> LruCache[str, Optional[str]]:
+        ...
+
+    @property
+    def mainline_positions_cache(self) -> LruCache[str, Mapping[str, int]]:
+        ...
+
+    # +watcha
+
 
 # We want to await to the reactor occasionally during state res when dealing
 # with large data sets, so that we don't exhaust the reactor. This is done by
@@ -81,6 +95,16 @@ __all__ = [
 ]
 
 
+# watcha+
+class _Sentinel(enum.Enum):
+    # defining a sentinel in this way allows mypy to correctly handle the
+    # type of a cache lookup.
+    sentinel = object()
+
+
+# +watcha
+
+
 async def resolve_events_with_store(
     clock: Clock,
     room_id: str,
@@ -241,6 +265,7 @@ async def _get_power_level_for_sender(
     """
     event = await _get_event(room_id, event_id, event_map, state_res_store)
 
+    """ watcha!
     pl = None
     for aid in event.auth_event_ids():
         aev = await _get_event(
@@ -249,6 +274,28 @@ async def _get_power_level_for_sender(
         if aev and (aev.type, aev.state_key) == (EventTypes.PowerLevels, ""):
             pl = aev
             break
+    !watcha """
+    # watcha+
+    pl = None
+    pl_event_id = await _get_power_levels_auth_event_id(
+        room_id, event_id, event_map, state_res_store
+    )
+    if pl_event_id is not None:
+        pl = await _get_event(
+            room_id, pl_event_id, event_map, state_res_store, allow_none=True
+        )
+        if pl is None:
+            # The cached power levels event is no longer available, e.g. purged
+            # since: walk the auth events again
+            state_res_store.power_levels_auth_cache.pop(event_id, None)
+            pl_event_id = await _get_power_levels_auth_event_id(
+                room_id, event_id, event_map, state_res_store
+            )
+            if pl_event_id is not None:
+                pl = await _get_event(
+                    room_id, pl_event_id, event_map, state_res_store, allow_none=True
+                )
+    # +watcha
 
     if pl is None:
         # Couldn't find power level. Check if they're the creator of the room
@@ -641,6 +688,7 @@ async def _mainline_sort(
         # skip calculating the mainline in that case.
         return []
 
+    """ watcha!
     mainline = []
     pl = resolved_power_event_id
     idx = 0
@@ -665,6 +713,12 @@ async def _mainline_sort(
         idx += 1
 
     mainline_map = {ev_id: i + 1 for i, ev_id in enumerate(reversed(mainline))}
+    !watcha """
+    # watcha+
+    mainline_map = await _get_mainline_positions(
+        clock, room_id, resolved_power_event_id, event_map, state_res_store
+    )
+    # +watcha
 
     event_ids = list(event_ids)
 
@@ -688,7 +742,7 @@ async def _mainline_sort(
 async def _get_mainline_depth_for_event(
     clock: Clock,
     event: EventBase,
-    mainline_map: Dict[str, int],
+    mainline_map: Mapping[str, int],  # watcha+
     event_map: Dict[str, EventBase],
     state_res_store: StateResolutionStore,
 ) -> int:
@@ -705,6 +759,7 @@ async def _get_mainline_depth_for_event(
     """
 
     room_id = event.room_id
+    """ watcha!
     tmp_event: Optional[EventBase] = event
 
     # We do an iterative search, replacing `event with the power level in its
@@ -727,6 +782,24 @@ async def _get_mainline_depth_for_event(
                 break
 
         idx += 1
+    !watcha """
+    # watcha+
+    tmp_event_id: Optional[str] = event.event_id
+
+    # We do an iterative search, replacing `event with the power level in its
+    # auth events (if any)
+    idx = 0
+    while tmp_event_id:
+        depth = mainline_map.get(tmp_event_id)
+        if depth is not None:
+            return depth
+
+        tmp_event_id = await _get_power_levels_auth_event_id(
+            room_id, tmp_event_id, event_map, state_res_store
+        )
+
+        idx += 1
+    # +watcha
 
         if idx % _AWAIT_AFTER_ITERATIONS == 0:
             await clock.sleep(0)
@@ -735,6 +808,113 @@ async def _get_mainline_depth_for_event(
     return 0
 
 
+# watcha+
+async def _get_power_levels_auth_event_id(
+    room_id: str,
+    event_id: str,
+    event_map: Dict[str, EventBase],
+    state_res_store: StateResolutionStore,
+) -> Optional[str]:
+    """Get the power levels event in the auth events of the given event.
+
+    The auth events of an event never change, so the result is cached for the
+    following resolutions, unless some auth events are missing.
+
+    Args:
+        room_id
+        event_id
+        event_map
+        state_res_store
+
+    Returns:
+        The ID of the power levels event, or None if there is none.
+    """
+    cache = state_res_store.power_levels_auth_cache
+    cached_event_id = cache.get(event_id, _Sentinel.sentinel)
+    if cached_event_id is not _Sentinel.sentinel:
+        return cached_event_id
+
+    event = await _get_event(room_id, event_id, event_map, state_res_store)
+
+    pl_event_id = None
+    missing_auth_events = False
+    for aid in event.auth_event_ids():
+        aev = await _get_event(
+            room_id, aid, event_map, state_res_store, allow_none=True
+        )
+        if aev is None:
+            missing_auth_events = True
+        elif (aev.type, aev.state_key) == (EventTypes.PowerLevels, ""):
+            pl_event_id = aid
+            break
+
+    # A missing auth event may be the power levels event
+    if pl_event_id is not None or not missing_auth_events:
+        cache.set(event_id, pl_event_id)
+
+    return pl_event_id
+
+
+async def _get_mainline_positions(
+    clock: Clock,
+    room_id: str,
+    resolved_power_event_id: Optional[str],
+    event_map: Dict[str, EventBase],
+    state_res_store: StateResolutionStore,
+) -> Mapping[str, int]:
+    """Get the positions of the power levels events in the mainline of the given
+    power levels event, from 1 for the oldest one.
+
+    The result is cached for the following resolutions, unless the mainline is
+    incomplete because of missing auth events.
+
+    Args:
+        clock
+        room_id
+        resolved_power_event_id: The final resolved power level event ID
+        event_map
+        state_res_store
+
+    Returns:
+        A map from the event IDs of the mainline to their positions
+    """
+    if resolved_power_event_id is None:
+        return {}
+
+    cache = state_res_store.mainline_positions_cache
+    mainline_map = cache.get(resolved_power_event_id)
+    if mainline_map is not None:
+        return mainline_map
+
+    mainline = []
+    pl: Optional[str] = resolved_power_event_id
+    idx = 0
+    while pl:
+        mainline.append(pl)
+        pl = await _get_power_levels_auth_event_id(
+            room_id, pl, event_map, state_res_store
+        )
+
+        # We await occasionally when we're working with large data sets to
+        # ensure that we don't block the reactor loop for too long.
+        if idx != 0 and idx % _AWAIT_AFTER_ITERATIONS == 0:
+            await clock.sleep(0)
+
+        idx += 1
+
+    mainline_map = {ev_id: i + 1 for i, ev_id in enumerate(reversed(mainline))}
+
+    # The oldest event has no power levels event in its auth events only if none
+    # of them is missing
+    if mainline[-1] in state_res_store.power_levels_auth_cache:
+        cache.set(resolved_power_event_id, mainline_map)
+
+    return mainline_map
+
+
+# +watcha
+
+
 @overload
 async def _get_event(
     room_id: str,
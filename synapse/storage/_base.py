@@ -127,6 +127,9 @@ class SQLBaseStore(metaclass=ABCMeta):
         # Purge other caches based on room state.
         self._attempt_to_invalidate_cache("get_room_summary", (room_id,))
         self._attempt_to_invalidate_cache("get_partial_current_state_ids", (room_id,))
+        # watcha+
+        self._attempt_to_invalidate_cache("get_room_calendar_event_ids", (room_id,))
+        # +watcha
 
     def _invalidate_state_caches_all(self, room_id: str) -> None:
         """Invalidates caches that are based on the current state, but does
@@ -139,6 +142,9 @@ class SQLBaseStore(metaclass=ABCMeta):
             room_id: Room where state changed
         """
         self._attempt_to_invalidate_cache("get_partial_current_state_ids", (room_id,))
+        # watcha+
+        self._attempt_to_invalidate_cache("get_room_calendar_event_ids", (room_id,))
+        # +watcha
         self._attempt_to_invalidate_cache("get_users_in_room", (room_id,))
         self._attempt_to_invalidate_cache("is_host_invited", None)
         self._attempt_to_invalidate_cache("is_host_joined", None)
@@ -107,6 +107,27 @@ class StateStorageController:
         state_group_delta = await self.stores.state.get_state_group_delta(state_group)
         return state_group_delta.prev_group, state_group_delta.delta_ids
 
+    # watcha+
+    async def get_state_deltas_from_group(
+        self, from_group: int, to_groups: Collection[int]
+    ) -> Optional[Dict[int, StateMap[str]]]:
+        """Get the changes of state between a state group and some of its descendants.
+
+        Args:
+            from_group: The state group to compute the changes from.
+            to_groups: The state groups to compute the changes to.
+
+        Returns:
+            A map from each of `to_groups` to the state map of the event IDs which
+            changed since `from_group`, or None if one of `to_groups` does not descend
+            from `from_group` through a short enough chain of deltas.
+        """
+        return await self.stores.state.get_state_deltas_from_group(
+            from_group, to_groups
+        )
+
+    # +watcha
+
     @trace
     @tag_args
     async def get_state_groups_ids(
@@ -88,8 +88,11 @@ if TYPE_CHECKING:
     from synapse.server import HomeServer
 # watcha+
 from .watcha_administration import AdministrationStore
+from .watcha_mail import MailQueueStore
+from .watcha_media import MediaUsageStore
 from .watcha_nextcloud import NextcloudStore
 from .watcha_partner import PartnerStore
+from .watcha_sliding_sync import SlidingSyncStore
 
 # +watcha
 
@@ -158,13 +161,16 @@ class DataStore(
     CensorEventsStore,
     UIAuthStore,
     EventForwardExtremitiesStore,
+    NextcloudStore,  # watcha+
     CacheInvalidationWorkerStore,
     LockStore,
     SessionStore,
     # watcha+
     AdministrationStore,
     PartnerStore,
-    NextcloudStore,
+    MediaUsageStore,
+    MailQueueStore,
+    SlidingSyncStore,
     # +watcha
     TaskSchedulerWorkerStore,
 ):
@@ -43,6 +43,9 @@ from synapse.storage.database import (
 )
 from synapse.storage.databases.main.cache import CacheInvalidationWorkerStore
 from synapse.storage.databases.main.push_rule import PushRulesWorkerStore
+from synapse.storage.databases.main.watcha_administration import (  # watcha+
+    update_direct_rooms_txn,
+)
 from synapse.storage.engines import PostgresEngine
 from synapse.storage.util.id_generators import (
     AbstractStreamIdGenerator,
@@ -708,6 +711,12 @@ class AccountDataWorkerStore(PushRulesWorkerStore, CacheInvalidationWorkerStore)
             values={"stream_id": next_id, "content": content_json},
         )
 
+        # watcha+
+        # Direct rooms get denormalized for the Watcha admin console.
+        if account_data_type == AccountDataTypes.DIRECT:
+            update_direct_rooms_txn(txn, user_id, content)
+        # +watcha
+
         # Ignored users get denormalized into a separate table as an optimisation.
         if account_data_type != AccountDataTypes.IGNORED_USER_LIST:
             return
@@ -815,6 +824,11 @@ class AccountDataWorkerStore(PushRulesWorkerStore, CacheInvalidationWorkerStore)
                 # account data entry to delete in the first place.
                 return False
 
+            # watcha+
+            if account_data_type == AccountDataTypes.DIRECT:
+                update_direct_rooms_txn(txn, user_id, {})
+            # +watcha
+
             # Ignored users get denormalized into a separate table as an optimisation.
             if account_data_type == AccountDataTypes.IGNORED_USER_LIST:
                 # If this method was called with the ignored users account data type, we
@@ -36,6 +36,9 @@ from synapse.storage.database import (
 from synapse.storage.databases.main.monthly_active_users import (
     MonthlyActiveUsersWorkerStore,
 )
+from synapse.storage.databases.main.watcha_administration import (  # watcha+
+    update_user_last_seen_txn,
+)
 from synapse.types import JsonDict, UserID
 from synapse.util.caches.lrucache import LruCache
 
@@ -708,6 +711,15 @@ class ClientIpWorkerStore(ClientIpBackgroundUpdateStore, MonthlyActiveUsersWorke
                 value_values=devices_values,
             )
 
+        # watcha+
+        last_seen_by_user: Dict[str, int] = {}
+        for (user_id, _, _), (_, _, last_seen) in to_update.items():
+            last_seen_by_user[user_id] = max(
+                last_seen, last_seen_by_user.get(user_id, last_seen)
+            )
+        update_user_last_seen_txn(txn, last_seen_by_user)
+        # +watcha
+
     async def get_last_client_ip_by_device(
         self, user_id: str, device_id: Optional[str]
     ) -> Dict[Tuple[str, str], DeviceLastConnectionInfo]:
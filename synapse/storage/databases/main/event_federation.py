@@ -29,6 +29,7 @@ from typing import (
     FrozenSet,
     Iterable,
     List,
+    Mapping,  # watcha+
     Optional,
     Sequence,
     Set,
@@ -122,6 +123,23 @@ class _NoChainCoverIndex(Exception):
         super().__init__("Unexpectedly no chain cover for events in %s" % (room_id,))
 
 
+# watcha+
+@attr.s(frozen=True, slots=True, auto_attribs=True)
+class _CachedAuthChainDifference:
+    """The auth chain difference of some state sets, which implements __len__ to
+    count both the events of the state sets it is cached for and the difference.
+    """
+
+    state_event_count: int
+    difference: FrozenSet[str]
+
+    def __len__(self) -> int:
+        return self.state_event_count + len(self.difference)
+
+
+# +watcha
+
+
 class EventFederationWorkerStore(SignatureWorkerStore, EventsWorkerStore, SQLBaseStore):
     # TODO: this attribute comes from EventPushActionWorkerStore. Should we inherit from
     # that store so that mypy can deduce this for itself?
@@ -147,6 +165,24 @@ class EventFederationWorkerStore(SignatureWorkerStore, EventsWorkerStore, SQLBas
             500000, "_event_auth_cache", size_callback=len
         )
 
+        # watcha+
+        # Caches of the state resolution v2, which only depend on auth events and
+        # so are shared by all the resolutions: the power levels event in the auth
+        # events of each event, and the positions of the power levels events in the
+        # mainline of each power levels event.
+        self.state_res_power_levels_cache: LruCache[str, Optional[str]] = LruCache(
+            100000, "state_res_power_levels_cache"
+        )
+        self.state_res_mainline_cache: LruCache[str, Mapping[str, int]] = LruCache(
+            100000, "state_res_mainline_cache", size_callback=len
+        )
+        # The auth chain differences of the state sets of the rooms, which never
+        # change either.
+        self._auth_chain_difference_cache: LruCache[
+            Tuple[str, FrozenSet[FrozenSet[str]]], _CachedAuthChainDifference
+        ] = LruCache(500000, "_auth_chain_difference_cache", size_callback=len)
+        # +watcha
+
         self._clock.looping_call(self._get_stats_for_federation_staging, 30 * 1000)
 
         if isinstance(self.database_engine, PostgresEngine):
@@ -439,7 +475,41 @@ class EventFederationWorkerStore(SignatureWorkerStore, EventsWorkerStore, SQLBas
 
         return results
 
+    # watcha+
+    async def get_auth_chain_difference(
+        self, room_id: str, state_sets: List[Set[str]]
+    ) -> Set[str]:
+        """Given sets of state events figure out the auth chain difference (as
+        per state res v2 algorithm), from the cache if the same sets were already
+        resolved, as happens for the bursts of events over the same forks.
+
+        The auth chains of the events never change, and neither does the
+        difference, which only depends on the distinct sets.
+
+        Returns:
+            The set of the difference in auth chains.
+        """
+        cache_key = (room_id, frozenset(frozenset(ids) for ids in state_sets))
+        cached = self._auth_chain_difference_cache.get(cache_key)
+        if cached is not None:
+            return set(cached.difference)
+
+        difference = await self._compute_auth_chain_difference(room_id, state_sets)
+
+        self._auth_chain_difference_cache.set(
+            cache_key,
+            _CachedAuthChainDifference(
+                sum(len(ids) for ids in cache_key[1]), frozenset(difference)
+            ),
+        )
+        return difference
+
+    # +watcha
+
+    """ watcha!
     async def get_auth_chain_difference(
+    !watcha """
+    async def _compute_auth_chain_difference(  # watcha+
         self, room_id: str, state_sets: List[Set[str]]
     ) -> Set[str]:
         """Given sets of state events figure out the auth chain difference (as
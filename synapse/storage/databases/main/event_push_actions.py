@@ -109,6 +109,7 @@ from synapse.storage.databases.main.stream import StreamWorkerStore
 from synapse.types import JsonDict
 from synapse.util import json_encoder
 from synapse.util.caches.descriptors import cached
+from synapse.util.caches.descriptors import cachedList  # watcha+
 
 if TYPE_CHECKING:
     from synapse.server import HomeServer
@@ -527,6 +528,98 @@ class EventPushActionsWorkerStore(ReceiptsWorkerStore, StreamWorkerStore, SQLBas
             user_id,
         )
 
+    # watcha+
+    @cachedList(
+        cached_method_name="get_unread_event_push_actions_by_room_for_user",
+        list_name="room_ids",
+    )
+    async def get_unread_event_push_actions_by_rooms_for_user(
+        self,
+        room_ids: Collection[str],
+        user_id: str,
+    ) -> Mapping[str, RoomNotifCounts]:
+        """Get the unread counts of a user in several rooms, in a single transaction.
+
+        The latest read receipts of the user in all the rooms are fetched at once,
+        rather than with a query per room. The counts are then computed room by room
+        within the transaction.
+
+        Args:
+            room_ids: The rooms to retrieve the counts in.
+            user_id: The user to retrieve the counts for.
+
+        Returns:
+            A map from room ID to the RoomNotifCounts of the user in the room.
+        """
+        return await self.db_pool.runInteraction(
+            "get_unread_event_push_actions_by_rooms",
+            self._get_unread_counts_by_receipts_txn,
+            room_ids,
+            user_id,
+        )
+
+    def _get_unread_counts_by_receipts_txn(
+        self,
+        txn: LoggingTransaction,
+        room_ids: Collection[str],
+        user_id: str,
+    ) -> Dict[str, RoomNotifCounts]:
+        room_clause, room_args = make_in_list_sql_clause(
+            self.database_engine, "room_id", room_ids
+        )
+        receipt_types_clause, receipts_args = make_in_list_sql_clause(
+            self.database_engine,
+            "receipt_type",
+            (ReceiptTypes.READ, ReceiptTypes.READ_PRIVATE),
+        )
+
+        # The stream ordering of the user's latest unthreaded receipt in each room.
+        txn.execute(
+            f"""
+                SELECT room_id, MAX(stream_ordering)
+                FROM receipts_linearized
+                INNER JOIN events USING (room_id, event_id)
+                WHERE {receipt_types_clause}
+                AND user_id = ?
+                AND {room_clause}
+                AND thread_id IS NULL
+                GROUP BY room_id
+            """,
+            (*receipts_args, user_id, *room_args),
+        )
+        stream_orderings: Dict[str, int] = dict(
+            cast(List[Tuple[str, int]], txn.fetchall())
+        )
+
+        # The stream ordering of the latest membership event (which we assume is a
+        # join) in the rooms without receipts.
+        rooms_without_receipt = [
+            room_id for room_id in room_ids if room_id not in stream_orderings
+        ]
+        if rooms_without_receipt:
+            room_clause, room_args = make_in_list_sql_clause(
+                self.database_engine, "c.room_id", rooms_without_receipt
+            )
+            txn.execute(
+                f"""
+                    SELECT c.room_id, e.stream_ordering
+                    FROM local_current_membership AS c
+                    INNER JOIN events AS e USING (event_id)
+                    WHERE c.user_id = ? AND {room_clause}
+                """,
+                (user_id, *room_args),
+            )
+            stream_orderings.update(cast(List[Tuple[str, int]], txn.fetchall()))
+
+        return {
+            room_id: self._get_unread_counts_by_pos_txn(
+                txn, room_id, user_id, stream_orderings[room_id]
+            )
+            for room_id in room_ids
+        }
+
+    # +watcha
+
     def _get_unread_counts_by_receipt_txn(
         self,
         txn: LoggingTransaction,
@@ -55,6 +55,9 @@ from synapse.storage.database import (
 )
 from synapse.storage.databases.main.events_worker import EventCacheEntry
 from synapse.storage.databases.main.search import SearchEntry
+from synapse.storage.databases.main.watcha_administration import (  # watcha+
+    update_room_stats_txn,
+)
 from synapse.storage.engines import PostgresEngine
 from synapse.storage.util.id_generators import AbstractStreamIdGenerator
 from synapse.storage.util.sequence import SequenceGenerator
@@ -1683,6 +1686,15 @@ class PersistEventsStore:
             inhibit_local_membership_updates=inhibit_local_membership_updates,
         )
 
+        # watcha+
+        # Update the rooms statistics of the Watcha admin console.
+        update_room_stats_txn(
+            txn,
+            [event for event, _ in events_and_contexts],
+            self._clock.time_msec(),
+        )
+        # +watcha
+
         # Prefill the event cache
         self._add_to_cache(txn, events_and_contexts)
 
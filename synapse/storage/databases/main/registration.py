@@ -291,6 +291,28 @@ class RegistrationWorkerStore(CacheInvalidationWorkerStore):
             func=get_user_by_id_txn,
         )
 
+    # watcha+
+    @cached()
+    async def get_user_role_flags(self, user_id: str) -> Tuple[bool, bool]:
+        """Get the flags the Watcha role of a user is inferred from.
+
+        Returns:
+            a tuple of whether the user is a server admin and whether they are
+            a partner, both False if the user does not exist.
+        """
+        row = await self.db_pool.simple_select_one(
+            table="users",
+            keyvalues={"name": user_id},
+            retcols=("admin", "is_partner"),
+            allow_none=True,
+            desc="get_user_role_flags",
+        )
+        if row is None:
+            return False, False
+        return bool(row[0]), bool(row[1])
+
+    # +watcha
+
     async def is_trial_user(self, user_id: str) -> bool:
         """Checks if user is in the "trial" period, i.e. within the first
         N days of registration defined by `mau_trial_days` config or the
@@ -554,6 +576,11 @@ class RegistrationWorkerStore(CacheInvalidationWorkerStore):
             self._invalidate_cache_and_stream(
                 txn, self.get_user_by_id, (user.to_string(),)
             )
+            # watcha+
+            self._invalidate_cache_and_stream(
+                txn, self.get_user_role_flags, (user.to_string(),)
+            )
+            # +watcha
 
         await self.db_pool.runInteraction("set_server_admin", set_server_admin_txn)
 
@@ -805,6 +832,10 @@ class RegistrationWorkerStore(CacheInvalidationWorkerStore):
                 "nextcloud_username": nextcloud_username,  # watcha+
             },
         )
+        # watcha+
+        txn.call_after(self._attempt_to_invalidate_cache, "get_username", (user_id,))
+        self._send_invalidation_to_replication(txn, "get_username", (user_id,))
+        # +watcha
 
     async def remove_user_external_id(
         self, auth_provider: str, external_id: str, user_id: str
@@ -816,6 +847,7 @@ class RegistrationWorkerStore(CacheInvalidationWorkerStore):
             external_id: id on that system
             user_id: complete mxid that it is mapped to
         """
+        """ watcha!
         await self.db_pool.simple_delete(
             table="user_external_ids",
             keyvalues={
@@ -825,6 +857,28 @@ class RegistrationWorkerStore(CacheInvalidationWorkerStore):
             },
             desc="remove_user_external_id",
         )
+        !watcha """
+        # watcha+
+        def _remove_user_external_id_txn(txn: LoggingTransaction) -> None:
+            self.db_pool.simple_delete_txn(
+                txn,
+                table="user_external_ids",
+                keyvalues={
+                    "auth_provider": auth_provider,
+                    "external_id": external_id,
+                    "user_id": user_id,
+                },
+            )
+            # The Nextcloud username of the user is stored with its external ids
+            txn.call_after(
+                self._attempt_to_invalidate_cache, "get_username", (user_id,)
+            )
+            self._send_invalidation_to_replication(txn, "get_username", (user_id,))
+
+        await self.db_pool.runInteraction(
+            "remove_user_external_id", _remove_user_external_id_txn
+        )
+        # +watcha
 
     async def replace_user_external_id(
         self,
@@ -862,6 +916,12 @@ class RegistrationWorkerStore(CacheInvalidationWorkerStore):
                 table="user_external_ids",
                 keyvalues={"user_id": user_id},
             )
+            # watcha+
+            txn.call_after(
+                self._attempt_to_invalidate_cache, "get_username", (user_id,)
+            )
+            self._send_invalidation_to_replication(txn, "get_username", (user_id,))
+            # +watcha
 
         def _replace_user_external_id_txn(
             txn: LoggingTransaction,
@@ -2617,6 +2677,7 @@ class RegistrationStore(StatsStore, RegistrationBackgroundUpdateStore):
             )
 
         self._invalidate_cache_and_stream(txn, self.get_user_by_id, (user_id,))
+        self._invalidate_cache_and_stream(txn, self.get_user_role_flags, (user_id,))  # watcha+
 
     async def user_set_password_hash(
         self, user_id: str, password_hash: Optional[str]
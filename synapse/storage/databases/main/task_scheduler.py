@@ -182,6 +182,45 @@ class TaskSchedulerWorkerStore(SQLBaseStore):
         )
         return nb_rows > 0
 
+    # watcha+
+    async def update_pending_scheduled_task(
+        self,
+        id: str,
+        timestamp: int,
+        params: Optional[JsonMapping],
+        expected_params: Optional[JsonMapping],
+    ) -> bool:
+        """Update the timestamp and the params of a scheduled task, provided that it
+        is still pending and that its params are still `expected_params`.
+
+        Args:
+            id: id of the `ScheduledTask` to update
+            timestamp: new timestamp of the task
+            params: new params of the task
+            expected_params: the params the task must have to be updated
+
+        Returns: `False` if the task was launched or changed in the meantime, `True`
+            otherwise
+        """
+        nb_rows = await self.db_pool.simple_update(
+            "scheduled_tasks",
+            {
+                "id": id,
+                "status": TaskStatus.SCHEDULED,
+                "params": None
+                if expected_params is None
+                else json_encoder.encode(expected_params),
+            },
+            {
+                "timestamp": timestamp,
+                "params": None if params is None else json_encoder.encode(params),
+            },
+            desc="update_pending_scheduled_task",
+        )
+        return nb_rows > 0
+
+    # +watcha
+
     async def get_scheduled_task(self, id: str) -> Optional[ScheduledTask]:
         """Get a specific `ScheduledTask` from its id.
 
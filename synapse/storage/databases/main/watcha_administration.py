@@ -1,19 +1,33 @@
 import calendar
 import inspect
-import json
 import logging
-import subprocess
+import math
 from collections import defaultdict
 from datetime import datetime
 
-from synapse.storage._base import SQLBaseStore
-from synapse.storage.database import DatabasePool
-from synapse.util.watcha import build_log_message
+from synapse.api.constants import AccountDataTypes, EventTypes
+from synapse.storage._base import SQLBaseStore, db_to_json
+from synapse.storage.database import DatabasePool, make_in_list_sql_clause
+from synapse.storage.databases.main.watcha_sliding_sync import BUMP_EVENT_TYPES
 
 logger = logging.getLogger(__name__)
 
 SETUP_PROPERTIES_PATH = "/etc/watcha.conf"
 
+# The columns which the rooms of the Watcha admin console can be sorted by. The
+# room id, creation and last message time are indexed in `watcha_room_stats`.
+ROOM_LIST_ORDER_BY = {
+    "room_id": "watcha_room_stats.room_id",
+    "name": "COALESCE(room_stats_state.name, '')",
+    "member_count": (
+        "room_stats_current.joined_members + room_stats_current.invited_members"
+    ),
+    "creation_ts": "COALESCE(watcha_room_stats.creation_ts, 0)",
+    "last_message_ts": "COALESCE(watcha_room_stats.last_message_ts, 0)",
+}
+# The maximum number of rooms of a page of the room list
+ROOM_LIST_MAX_LIMIT = 1000
+
 
 def _caller_name():
     """returns the name of the function calling the one calling this one"""
@@ -24,82 +38,353 @@ def _caller_name():
         return "<unknown function>"
 
 
+def _format_size(size):
+    """Format a number of bytes in a human readable way, like `du -h` does"""
+    for unit in ("", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            break
+        size /= 1024
+
+    if not unit:
+        return str(size)
+    if size < 10:
+        return f"{math.ceil(size * 10) / 10:.1f}{unit}"
+    return f"{math.ceil(size)}{unit}"
+
+
+def _escape_like(value):
+    """Escape the wildcards of a LIKE pattern, with a backslash as escape character"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def update_room_stats_txn(txn, events, received_ts):
+    """Update `watcha_room_stats` with a batch of persisted events.
+
+    This is called from the events persistence rather than from a store method, so
+    that it works whatever the store of the event persister.
+
+    Args:
+        txn: the database transaction
+        events: the events being persisted
+        received_ts: the time the events are received, in milliseconds
+    """
+    created_room_ids = {
+        event.room_id for event in events if event.type == EventTypes.Create
+    }
+    if created_room_ids:
+        txn.execute_batch(
+            """
+            INSERT INTO watcha_room_stats (room_id, creation_ts) VALUES (?, ?)
+            ON CONFLICT (room_id) DO UPDATE SET creation_ts = EXCLUDED.creation_ts
+        """,
+            [(room_id, received_ts) for room_id in created_room_ids],
+        )
+
+    messaged_room_ids = {
+        event.room_id for event in events if event.type == EventTypes.Message
+    }
+    if messaged_room_ids:
+        txn.execute_batch(
+            """
+            INSERT INTO watcha_room_stats (room_id, last_message_ts) VALUES (?, ?)
+            ON CONFLICT (room_id) DO UPDATE SET last_message_ts = EXCLUDED.last_message_ts
+        """,
+            [(room_id, received_ts) for room_id in messaged_room_ids],
+        )
+
+    # Backfilled events have a negative stream ordering, and never bump a room
+    bump_stream_orderings = {}
+    for event in events:
+        stream_ordering = event.internal_metadata.stream_ordering
+        if (
+            event.type in BUMP_EVENT_TYPES
+            and not event.internal_metadata.is_outlier()
+            and stream_ordering > 0
+        ):
+            bump_stream_orderings[event.room_id] = max(
+                stream_ordering, bump_stream_orderings.get(event.room_id, 0)
+            )
+    if bump_stream_orderings:
+        txn.execute_batch(
+            """
+            INSERT INTO watcha_room_stats (room_id, bump_stream_ordering) VALUES (?, ?)
+            ON CONFLICT (room_id) DO UPDATE
+                SET bump_stream_ordering = EXCLUDED.bump_stream_ordering
+                WHERE watcha_room_stats.bump_stream_ordering IS NULL
+                    OR watcha_room_stats.bump_stream_ordering
+                        < EXCLUDED.bump_stream_ordering
+        """,
+            list(bump_stream_orderings.items()),
+        )
+
+
+def update_user_last_seen_txn(txn, last_seen_by_user):
+    """Keep `watcha_user_last_seen` up to date with a batch of client IPs.
+
+    Args:
+        txn: the database transaction
+        last_seen_by_user: a dict mapping user ids to the time they were last seen
+    """
+    txn.execute_batch(
+        """
+        INSERT INTO watcha_user_last_seen (user_id, last_seen) VALUES (?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET last_seen = EXCLUDED.last_seen
+            WHERE watcha_user_last_seen.last_seen < EXCLUDED.last_seen
+    """,
+        list(last_seen_by_user.items()),
+    )
+
+
+def update_direct_rooms_txn(txn, user_id, content):
+    """Synchronise `watcha_direct_rooms` with the m.direct account data of a user.
+
+    Args:
+        txn: the database transaction
+        user_id: the owner of the account data
+        content: the m.direct content, mapping user ids to lists of room ids
+    """
+    previous_room_ids = set(
+        DatabasePool.simple_select_onecol_txn(
+            txn,
+            table="watcha_direct_rooms",
+            keyvalues={"user_id": user_id},
+            retcol="room_id",
+        )
+    )
+
+    # As for the ignored users, invalid data means no direct rooms.
+    current_room_ids = set()
+    if isinstance(content, dict):
+        for room_ids in content.values():
+            if isinstance(room_ids, list):
+                current_room_ids.update(
+                    room_id for room_id in room_ids if isinstance(room_id, str)
+                )
+
+    if previous_room_ids == current_room_ids:
+        return
+
+    DatabasePool.simple_delete_many_txn(
+        txn,
+        table="watcha_direct_rooms",
+        column="room_id",
+        values=previous_room_ids - current_room_ids,
+        keyvalues={"user_id": user_id},
+    )
+    DatabasePool.simple_insert_many_txn(
+        txn,
+        table="watcha_direct_rooms",
+        keys=("user_id", "room_id"),
+        values=[(user_id, room_id) for room_id in current_room_ids - previous_room_ids],
+    )
+
+
 class AdministrationStore(SQLBaseStore):
     def __init__(self, database: DatabasePool, db_conn, hs):
         super().__init__(database, db_conn, hs)
         self.hs = hs
         self.clock = hs.get_clock()
 
-    async def _get_new_rooms(self):
-        """Retrieve a list of rooms that have recevied m.room.create event during the last week
+        self.db_pool.updates.register_background_update_handler(
+            "watcha_room_stats_populate", self._background_populate_room_stats
+        )
+        self.db_pool.updates.register_background_update_handler(
+            "watcha_direct_rooms_populate", self._background_populate_direct_rooms
+        )
+        self.db_pool.updates.register_background_update_handler(
+            "watcha_user_last_seen_populate", self._background_populate_user_last_seen
+        )
 
-        Returns:
-            A list of room_id
-        """
+    async def _background_populate_room_stats(self, progress, batch_size):
+        """Populate `watcha_room_stats` from the events of the existing rooms"""
+        last_room_id = progress.get("last_room_id", "")
 
-        def _get_new_rooms_txn(txn):
+        def _background_populate_room_stats_txn(txn):
             txn.execute(
                 """
-                SELECT DISTINCT room_id
+                SELECT room_id
+                FROM rooms
+                WHERE room_id > ?
+                ORDER BY room_id ASC
+                LIMIT ?
+            """,
+                (last_room_id, batch_size),
+            )
+            room_ids = [row[0] for row in txn.fetchall()]
+            if not room_ids:
+                return 0
+
+            clause, args = make_in_list_sql_clause(
+                self.database_engine, "room_id", room_ids
+            )
+            # Rows written by the events persistence in the meantime are more recent
+            # than the ones computed here, so they take precedence.
+            txn.execute(
+                f"""
+                INSERT INTO watcha_room_stats (room_id, creation_ts, last_message_ts)
+                SELECT
+                    room_id
+                    , MIN(CASE WHEN type = 'm.room.create' THEN received_ts END)
+                    , MAX(CASE WHEN type = 'm.room.message' THEN received_ts END)
                 FROM events
-                WHERE type = "m.room.create"
-                    AND received_ts >= (SELECT (strftime('%s','now') || substr(strftime('%f', 'now'),4)) - (3600 * 24 * 7 * 1000));
-            """
+                WHERE {clause}
+                    AND type IN ('m.room.create', 'm.room.message')
+                GROUP BY room_id
+                ON CONFLICT (room_id) DO UPDATE SET
+                    creation_ts = COALESCE(watcha_room_stats.creation_ts, EXCLUDED.creation_ts)
+                    , last_message_ts = COALESCE(watcha_room_stats.last_message_ts, EXCLUDED.last_message_ts)
+            """,
+                args,
             )
 
-            return [rooms[0] for rooms in txn.fetchall()]
+            self.db_pool.updates._background_update_progress_txn(
+                txn, "watcha_room_stats_populate", {"last_room_id": room_ids[-1]}
+            )
+            return len(room_ids)
 
-        return await self.db_pool.runInteraction("_get_new_rooms", _get_new_rooms_txn)
+        count = await self.db_pool.runInteraction(
+            "_background_populate_room_stats", _background_populate_room_stats_txn
+        )
+        if not count:
+            await self.db_pool.updates._end_background_update(
+                "watcha_room_stats_populate"
+            )
 
-    async def _get_active_rooms(self):
-        """Retrieve a list of rooms that have recevied some message during the last week
+        return count
 
-        Returns:
-            A list of room_id
-        """
+    async def _background_populate_direct_rooms(self, progress, batch_size):
+        """Populate `watcha_direct_rooms` from the existing m.direct account data"""
+        last_user_id = progress.get("last_user_id", "")
 
-        def _get_active_rooms_txn(txn):
+        def _background_populate_direct_rooms_txn(txn):
             txn.execute(
                 """
-                SELECT DISTINCT room_id
-                FROM events
-                WHERE type = "m.room.message"
-                    AND received_ts >= (
-                        SELECT (strftime('%s','now') || substr(strftime('%f', 'now'),4)) - (3600 * 24 * 7 * 1000));
-            """
+                SELECT user_id, content
+                FROM account_data
+                WHERE account_data_type = ?
+                    AND user_id > ?
+                ORDER BY user_id ASC
+                LIMIT ?
+            """,
+                (AccountDataTypes.DIRECT, last_user_id, batch_size),
             )
+            rows = txn.fetchall()
+            if not rows:
+                return 0
 
-            return [rooms[0] for rooms in txn.fetchall()]
+            for user_id, content in rows:
+                update_direct_rooms_txn(txn, user_id, db_to_json(content))
 
-        return await self.db_pool.runInteraction(
-            "_get_active_rooms", _get_active_rooms_txn
+            self.db_pool.updates._background_update_progress_txn(
+                txn, "watcha_direct_rooms_populate", {"last_user_id": rows[-1][0]}
+            )
+            return len(rows)
+
+        count = await self.db_pool.runInteraction(
+            "_background_populate_direct_rooms", _background_populate_direct_rooms_txn
         )
+        if not count:
+            await self.db_pool.updates._end_background_update(
+                "watcha_direct_rooms_populate"
+            )
 
-    async def _get_dm_rooms(self):
-        """Retrieve a list of rooms that have m.direct flag on account_data and with exactly two joinned or invited members
+        return count
 
-        Returns:
-            A list of room_id
-        """
-        members_by_room = await self.members_by_room()
+    async def _background_populate_user_last_seen(self, progress, batch_size):
+        """Populate `watcha_user_last_seen` from the `user_ips` table"""
+        last_user_id = progress.get("last_user_id", "")
 
-        dm_rooms_by_member = await self.db_pool.simple_select_onecol(
-            table="account_data",
-            keyvalues={"account_data_type": "m.direct"},
-            retcol="content",
-        )
+        def _background_populate_user_last_seen_txn(txn):
+            txn.execute(
+                """
+                SELECT name
+                FROM users
+                WHERE name > ?
+                ORDER BY name ASC
+                LIMIT ?
+            """,
+                (last_user_id, batch_size),
+            )
+            user_ids = [row[0] for row in txn.fetchall()]
+            if not user_ids:
+                return 0
 
-        dm_rooms = list(
-            {
-                room
-                for row in dm_rooms_by_member
-                for member_rooms in json.loads(row).values()
-                for room in member_rooms
-                if room in members_by_room and len(members_by_room[room]) == 2
-            }
+            clause, args = make_in_list_sql_clause(
+                self.database_engine, "user_id", user_ids
+            )
+            txn.execute(
+                f"""
+                INSERT INTO watcha_user_last_seen (user_id, last_seen)
+                SELECT
+                    user_id
+                    , MAX(last_seen)
+                FROM user_ips
+                WHERE {clause}
+                GROUP BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET last_seen = EXCLUDED.last_seen
+                    WHERE watcha_user_last_seen.last_seen < EXCLUDED.last_seen
+            """,
+                args,
+            )
+
+            self.db_pool.updates._background_update_progress_txn(
+                txn, "watcha_user_last_seen_populate", {"last_user_id": user_ids[-1]}
+            )
+            return len(user_ids)
+
+        count = await self.db_pool.runInteraction(
+            "_background_populate_user_last_seen",
+            _background_populate_user_last_seen_txn,
         )
+        if not count:
+            await self.db_pool.updates._end_background_update(
+                "watcha_user_last_seen_populate"
+            )
+
+        return count
 
-        return dm_rooms
+    def _get_rooms_stats_sql(self):
+        """Build the query giving the stats of each non empty room, as maintained in
+        `watcha_room_stats`.
+
+        Returns:
+            A tuple of the SQL query and its arguments
+        """
+        week_threshold = self.clock.time_msec() - 7 * 24 * 3600 * 1000
+
+        sql = """
+            SELECT
+                rooms.room_id AS room_id
+                , rooms.creator AS creator
+                , room_stats_state.name AS name
+                , room_stats_current.joined_members + room_stats_current.invited_members AS member_count
+                , COALESCE(watcha_room_stats.creation_ts, 0) AS creation_ts
+                , COALESCE(watcha_room_stats.last_message_ts, 0) AS last_message_ts
+                , CASE
+                    WHEN room_stats_current.joined_members + room_stats_current.invited_members = 2
+                        AND EXISTS (
+                            SELECT 1
+                            FROM watcha_direct_rooms
+                            WHERE watcha_direct_rooms.room_id = rooms.room_id)
+                    THEN 'dm_room'
+                    ELSE 'regular_room'
+                END AS type
+                , CASE
+                    WHEN watcha_room_stats.creation_ts >= ? THEN 'new'
+                    WHEN watcha_room_stats.last_message_ts >= ? THEN 'active'
+                    ELSE 'inactive'
+                END AS status
+            FROM rooms
+                INNER JOIN room_stats_current
+                    ON room_stats_current.room_id = rooms.room_id
+                LEFT JOIN room_stats_state
+                    ON room_stats_state.room_id = rooms.room_id
+                LEFT JOIN watcha_room_stats
+                    ON watcha_room_stats.room_id = rooms.room_id
+            WHERE room_stats_current.joined_members + room_stats_current.invited_members > 0
+        """
+
+        return sql, [week_threshold, week_threshold]
 
     async def _get_room_count_per_type(self):
         """Retrieve a dict of number of active and non active rooms per type (direct message room, regular room).
@@ -107,29 +392,39 @@ class AdministrationStore(SQLBaseStore):
         Returns:
             A dict of integers
         """
-        members_by_room = await self.members_by_room()
-        dm_rooms = await self._get_dm_rooms()
-        new_rooms = await self._get_new_rooms()
-        active_rooms = await self._get_active_rooms()
+        rooms_stats_sql, args = self._get_rooms_stats_sql()
 
-        active_rooms = set(active_rooms).union(new_rooms)
-
-        all_rooms = await self.db_pool.simple_select_onecol(
-            table="rooms",
-            keyvalues=None,
-            retcol="room_id",
-        )
+        def _get_room_count_per_type_txn(txn):
+            txn.execute(
+                f"""
+                SELECT
+                    type
+                    , status
+                    , COUNT(*)
+                FROM ({rooms_stats_sql}) AS rooms_stats
+                GROUP BY type, status
+            """,
+                args,
+            )
 
-        regular_rooms = set(all_rooms) & set(members_by_room.keys()) - set(dm_rooms)
+            return txn.fetchall()
 
-        result = {
-            "dm_room_count": len(dm_rooms),
-            "active_dm_room_count": len(set(dm_rooms).intersection(active_rooms)),
-            "regular_room_count": len(regular_rooms),
-            "active_regular_room_count": len(regular_rooms.intersection(active_rooms)),
+        counts = {
+            (room_type, status): count
+            for room_type, status, count in await self.db_pool.runInteraction(
+                "_get_room_count_per_type", _get_room_count_per_type_txn
+            )
         }
 
-        return result
+        def count(room_type, statuses=("new", "active", "inactive")):
+            return sum(counts.get((room_type, status), 0) for status in statuses)
+
+        return {
+            "dm_room_count": count("dm_room"),
+            "active_dm_room_count": count("dm_room", ("new", "active")),
+            "regular_room_count": count("regular_room"),
+            "active_regular_room_count": count("regular_room", ("new", "active")),
+        }
 
     async def _get_users_stats(self):
         """Retrieve the count of users per role (administrators, members and partners) and some stats about activity of users
@@ -178,16 +473,30 @@ class AdministrationStore(SQLBaseStore):
 
             txn.execute(
                 """
-                SELECT
-                    user_id
-                    , max(last_seen)
-                FROM user_ips
-                GROUP BY user_id;
-            """
+                SELECT COUNT(*)
+                FROM watcha_user_last_seen
+                WHERE last_seen > ?
+            """,
+                (MONTH_TRESHOLD,),
             )
-            last_seen_ts_per_users = txn.fetchall()
+            last_month_logged_users = txn.fetchone()
 
-            return collaborators_users, partner_users, last_seen_ts_per_users
+            txn.execute(
+                """
+                SELECT COUNT(*)
+                FROM watcha_user_last_seen
+                WHERE last_seen > ?
+            """,
+                (WEEK_TRESHOLD,),
+            )
+            last_week_logged_users = txn.fetchone()
+
+            return (
+                collaborators_users,
+                partner_users,
+                last_month_logged_users,
+                last_week_logged_users,
+            )
 
         users = await self.db_pool.runInteraction(
             "_get_users_stats", _get_users_stats_txn
@@ -195,19 +504,8 @@ class AdministrationStore(SQLBaseStore):
 
         number_of_collaborators = users[0][0]
         number_of_partners = users[1][0]
-        last_seen_ts_per_users = users[2]
-
-        last_month_logged_users = [
-            user_ts[0]
-            for user_ts in last_seen_ts_per_users
-            if user_ts[1] > MONTH_TRESHOLD
-        ]
-
-        last_week_logged_users = [
-            user_ts[0]
-            for user_ts in last_seen_ts_per_users
-            if user_ts[1] > WEEK_TRESHOLD
-        ]
+        number_of_last_month_logged_users = users[2][0]
+        number_of_last_week_logged_users = users[3][0]
 
         return {
             "administrators_users": administrators_users,
@@ -220,8 +518,8 @@ class AdministrationStore(SQLBaseStore):
                 "number_of_users_logged_at_least_once": number_of_collaborators
                 + number_of_partners
                 + number_of_administrators,
-                "number_of_last_month_logged_users": len(last_month_logged_users),
-                "number_of_last_week_logged_users": len(last_week_logged_users),
+                "number_of_last_month_logged_users": number_of_last_month_logged_users,
+                "number_of_last_week_logged_users": number_of_last_week_logged_users,
             },
         }
 
@@ -242,6 +540,7 @@ class AdministrationStore(SQLBaseStore):
 
         return {
             "disk_usage": await self._get_disk_usage(),
+            "disk_usage_details": await self.get_media_usage(),
             "watcha_release": setup_properties.get("watcha_release", ""),
             "upgrade_date": setup_properties.get("upgrade_date", ""),
             "install_date": setup_properties.get("install_date", ""),
@@ -263,86 +562,90 @@ class AdministrationStore(SQLBaseStore):
         return setup_properties
 
     async def _get_disk_usage(self):
-        """Recover data volume from media files"""
-
-        try:
-            completed_process = subprocess.run(
-                ["du", "-bsh", self.hs.config.media.media_store_path],
-                stdout=subprocess.PIPE,
-                timeout=3,
-                check=True,
-            )
-        except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as e:
-            logger.warn(build_log_message(log_vars={"error": e}))
-            return
+        """Recover data volume from media files, as maintained by the media repository
 
-        stdout = completed_process.stdout
-        try:
-            stdout = stdout.decode()
-        except AttributeError as e:
-            logger.warn(build_log_message(log_vars={"error": e}))
-            return
-
-        tokens = stdout.split("\t")
-        if len(tokens) == 1:
-            logger.warn(build_log_message(log_vars={"error": e}))
+        Returns:
+            the human readable size of the media store, like `du -h` does, or None if
+            it has not been computed yet.
+        """
+        media_usage = await self.get_media_usage()
+        if not media_usage:
             return
 
-        disk_usage = tokens[0]
-        return disk_usage
+        return _format_size(sum(media_usage.values()))
 
-    async def watcha_user_list(self):
-        """Retrieve a list of all users with some informations.
+    async def watcha_user_list(self, search_term=None, from_user_id=None, limit=None):
+        """Retrieve a list of active users with some informations, sorted by user_id.
 
         Used for Watcha admin console.
 
+        Args:
+            search_term: if set, only return the users which id, display name or
+                email address contains this string, case insensitively.
+            from_user_id: if set, only return the users after this one.
+            limit: the maximum number of users to return, all of them if None.
+
         Returns:
-            A list of tuples which contains users informations
+            A list of dicts which contains users informations
         """
+        FIELDS = [
+            "user_id",
+            "email_address",
+            "display_name",
+            "is_partner",
+            "is_admin",
+            "last_seen",
+            "creation_ts",
+        ]
 
-        def watcha_user_list_txn(txn):
-            FIELDS = [
-                "user_id",
-                "email_address",
-                "display_name",
-                "is_partner",
-                "is_admin",
-                "last_seen",
-                "creation_ts",
-            ]
-
-            SQL_USER_LIST = """
-                SELECT
-                    users.name
-                    , user_email.address
-                    , profiles.displayname
-                    , users.is_partner
-                    , users.admin
-                    , users_last_seen.last_seen
-                    , users.creation_ts * 1000
-                FROM users
-                    LEFT JOIN
-                        (SELECT
-                            t.user_id
-                            , t.address
-                        FROM user_threepids AS t
-                        WHERE t.medium = 'email') AS user_email
-                        ON users.name = user_email.user_id
-                    LEFT JOIN
-                        (SELECT
-                            user_ips.user_id
-                            , max(user_ips.last_seen) as last_seen
-                        FROM user_ips
-                        GROUP BY user_ips.user_id) as users_last_seen ON users_last_seen.user_id = users.name
-                    LEFT JOIN profiles ON users.name LIKE "@"||profiles.user_id||":%"
-                WHERE users.deactivated = 0
-                GROUP BY users.name
+        sql = """
+            SELECT
+                users.name
+                , (SELECT MIN(user_threepids.address)
+                    FROM user_threepids
+                    WHERE user_threepids.user_id = users.name
+                        AND user_threepids.medium = 'email') AS email_address
+                , profiles.displayname
+                , users.is_partner
+                , users.admin
+                , watcha_user_last_seen.last_seen
+                , users.creation_ts * 1000
+            FROM users
+                LEFT JOIN profiles
+                    ON profiles.full_user_id = users.name
+                LEFT JOIN watcha_user_last_seen
+                    ON watcha_user_last_seen.user_id = users.name
+            WHERE users.deactivated = 0
+        """
+        args = []
+
+        if from_user_id is not None:
+            sql += " AND users.name > ?"
+            args.append(from_user_id)
+
+        if search_term:
+            sql += """
+                AND (
+                    LOWER(users.name) LIKE ? ESCAPE '\\'
+                    OR LOWER(profiles.displayname) LIKE ? ESCAPE '\\'
+                    OR EXISTS (
+                        SELECT 1
+                        FROM user_threepids
+                        WHERE user_threepids.user_id = users.name
+                            AND user_threepids.medium = 'email'
+                            AND LOWER(user_threepids.address) LIKE ? ESCAPE '\\'))
             """
+            pattern = "%" + _escape_like(search_term.lower()) + "%"
+            args.extend((pattern, pattern, pattern))
 
-            txn.execute(SQL_USER_LIST)
-            result = txn.fetchall()
+        sql += " ORDER BY users.name ASC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
 
-            return [dict(zip(FIELDS, user)) for user in result]
+        def watcha_user_list_txn(txn):
+            txn.execute(sql, args)
+            return [dict(zip(FIELDS, user)) for user in txn.fetchall()]
 
         users = await self.db_pool.runInteraction(
             "watcha_user_list", watcha_user_list_txn
@@ -367,8 +670,8 @@ class AdministrationStore(SQLBaseStore):
                     , state_key
                     , membership
                 FROM current_state_events
-                WHERE type = "m.room.member"
-                    AND (membership = "join" OR membership = "invite");
+                WHERE type = 'm.room.member'
+                    AND (membership = 'join' OR membership = 'invite');
             """
             )
 
@@ -393,38 +696,177 @@ class AdministrationStore(SQLBaseStore):
             for room_id, members in membership_by_room.items()
         }
 
-    async def watcha_room_list(self):
-        """Retrieve a list of rooms with some informations for each one (room_id, creator, name, members, type and status).
+    async def _get_members_of_rooms(self, room_ids):
+        """Retrieve the users with membership 'join' or 'invite' in some rooms.
 
-        Used for Watcha admin console.
+        Args:
+            room_ids: the ids of the rooms
 
         Returns:
-            A list of dict for each rooms.
+            A dict with room_id as key and list of user_id as value.
         """
 
-        def watcha_room_list_txn(txn):
+        def _get_members_of_rooms_txn(txn):
+            clause, args = make_in_list_sql_clause(
+                self.database_engine, "room_id", room_ids
+            )
             txn.execute(
-                """
+                f"""
                 SELECT
-                    rooms.room_id
-                    , rooms.creator
-                    , room_stats_state.name
-                FROM rooms
-                    LEFT JOIN room_stats_state
-                        ON room_stats_state.room_id = rooms.room_id
-                ORDER BY rooms.room_id ASC;
+                    room_id
+                    , state_key
+                FROM current_state_events
+                WHERE type = 'm.room.member'
+                    AND membership IN ('join', 'invite')
+                    AND {clause}
+            """,
+                args,
+            )
+
+            return txn.fetchall()
+
+        members_by_room = {room_id: [] for room_id in room_ids}
+        if room_ids:
+            for room_id, user_id in await self.db_pool.runInteraction(
+                "_get_members_of_rooms", _get_members_of_rooms_txn
+            ):
+                members_by_room[room_id].append(user_id)
+
+        return members_by_room
+
+    async def watcha_room_list(
+        self,
+        room_type=None,
+        status=None,
+        member=None,
+        order_by="room_id",
+        direction="f",
+        from_key=None,
+        limit=ROOM_LIST_MAX_LIMIT,
+    ):
+        """Retrieve a page of rooms with some informations for each one (room_id, creator, name, members, type and status).
+
+        Used for Watcha admin console. The rooms are filtered and sorted on the
+        columns of `watcha_room_stats` rather than on the stats of all the rooms, so
+        that a page is read from its indexes.
+
+        Args:
+            room_type: if set, only return the rooms of this type ('dm_room' or 'regular_room').
+            status: if set, only return the rooms with this status ('new', 'active' or 'inactive').
+            member: if set, only return the rooms which a joined or invited member id contains this string.
+            order_by: the column to sort the rooms by, one of ROOM_LIST_ORDER_BY.
+            direction: 'f' for ascending order, 'b' for descending order.
+            from_key: the sort key `(value, room_id)` of the last room of the previous page.
+            limit: the maximum number of rooms to return, at most ROOM_LIST_MAX_LIMIT.
+
+        Returns:
+            A tuple of the list of dict for each rooms and the sort key of the last
+            one if there might be more rooms to fetch, None otherwise.
+        """
+        if order_by not in ROOM_LIST_ORDER_BY:
+            raise ValueError(f"Unknown order_by: {order_by}")
+
+        week_threshold = self.clock.time_msec() - 7 * 24 * 3600 * 1000
+        limit = min(limit, ROOM_LIST_MAX_LIMIT)
+        order_by_column = ROOM_LIST_ORDER_BY[order_by]
+        comparator, ordering = (">", "ASC") if direction == "f" else ("<", "DESC")
+
+        is_dm_room = """
+            room_stats_current.joined_members + room_stats_current.invited_members = 2
+            AND EXISTS (
+                SELECT 1
+                FROM watcha_direct_rooms
+                WHERE watcha_direct_rooms.room_id = watcha_room_stats.room_id)
+        """
+        args = [week_threshold, week_threshold]
+        clauses = [
+            "room_stats_current.joined_members + room_stats_current.invited_members > 0"
+        ]
+        if room_type == "dm_room":
+            clauses.append(f"({is_dm_room})")
+        elif room_type == "regular_room":
+            clauses.append(f"NOT ({is_dm_room})")
+        if status == "new":
+            clauses.append("watcha_room_stats.creation_ts >= ?")
+            args.append(week_threshold)
+        elif status == "active":
+            clauses.append(
+                """
+                COALESCE(watcha_room_stats.creation_ts, 0) < ?
+                AND watcha_room_stats.last_message_ts >= ?
+            """
+            )
+            args.extend((week_threshold, week_threshold))
+        elif status == "inactive":
+            clauses.append(
+                """
+                COALESCE(watcha_room_stats.creation_ts, 0) < ?
+                AND COALESCE(watcha_room_stats.last_message_ts, 0) < ?
+            """
+            )
+            args.extend((week_threshold, week_threshold))
+        if member is not None:
+            clauses.append(
+                """
+                EXISTS (
+                    SELECT 1
+                    FROM current_state_events
+                    WHERE current_state_events.room_id = watcha_room_stats.room_id
+                        AND current_state_events.type = 'm.room.member'
+                        AND current_state_events.membership IN ('join', 'invite')
+                        AND current_state_events.state_key LIKE ? ESCAPE '\\')
+            """
+            )
+            args.append("%" + _escape_like(member) + "%")
+        if from_key is not None:
+            clauses.append(
+                f"""
+                ({order_by_column} {comparator} ?
+                    OR ({order_by_column} = ?
+                        AND watcha_room_stats.room_id {comparator} ?))
             """
             )
+            args.extend((from_key[0], from_key[0], from_key[1]))
+
+        sql = f"""
+            SELECT
+                watcha_room_stats.room_id
+                , rooms.creator
+                , room_stats_state.name
+                , CASE WHEN {is_dm_room} THEN 'dm_room' ELSE 'regular_room' END
+                , CASE
+                    WHEN watcha_room_stats.creation_ts >= ? THEN 'new'
+                    WHEN watcha_room_stats.last_message_ts >= ? THEN 'active'
+                    ELSE 'inactive'
+                END
+                , {order_by_column}
+            FROM watcha_room_stats
+                INNER JOIN rooms
+                    ON rooms.room_id = watcha_room_stats.room_id
+                INNER JOIN room_stats_current
+                    ON room_stats_current.room_id = watcha_room_stats.room_id
+                LEFT JOIN room_stats_state
+                    ON room_stats_state.room_id = watcha_room_stats.room_id
+            WHERE {" AND ".join(clauses)}
+            ORDER BY {order_by_column} {ordering}, watcha_room_stats.room_id {ordering}
+            LIMIT ?
+        """
+        args.append(limit)
 
+        def watcha_room_list_txn(txn):
+            txn.execute(sql, args)
             return txn.fetchall()
 
         rooms = await self.db_pool.runInteraction(
             "watcha_room_list", watcha_room_list_txn
         )
-        members_by_room = await self.members_by_room()
-        new_rooms = await self._get_new_rooms()
-        active_rooms = await self._get_active_rooms()
-        dm_rooms = await self._get_dm_rooms()
+        members_by_room = await self._get_members_of_rooms(
+            [room[0] for room in rooms]
+        )
+
+        next_key = None
+        if len(rooms) == limit:
+            next_key = (rooms[-1][5], rooms[-1][0])
 
         return [
             {
@@ -432,25 +874,27 @@ class AdministrationStore(SQLBaseStore):
                 "creator": creator,
                 "name": name,
                 "members": members_by_room[room_id],
-                "type": "dm_room" if room_id in dm_rooms else "regular_room",
-                "status": "new"
-                if room_id in new_rooms
-                else "active"
-                if room_id in active_rooms
-                else "inactive",
+                "type": room_type,
+                "status": status,
             }
-            for room_id, creator, name in rooms
-            if room_id
-            in members_by_room  # don't show empty room (and avoid a possible exception)
-        ]
+            for room_id, creator, name, room_type, status, _ in rooms
+        ], next_key
 
     async def _update_user(self, user_id, **updatevalues):
-        return await self.db_pool.simple_update(
-            table="users",
-            keyvalues={"name": user_id},
-            updatevalues=updatevalues,
-            desc=_caller_name(),
-        )
+        def _update_user_txn(txn):
+            updated = self.db_pool.simple_update_txn(
+                txn,
+                table="users",
+                keyvalues={"name": user_id},
+                updatevalues=updatevalues,
+            )
+            self._invalidate_cache_and_stream(txn, self.get_user_by_id, (user_id,))
+            self._invalidate_cache_and_stream(
+                txn, self.get_user_role_flags, (user_id,)
+            )
+            return updated
+
+        return await self.db_pool.runInteraction(_caller_name(), _update_user_txn)
 
     async def update_user_role(self, user_id, role):
         if role == "collaborator":
@@ -474,7 +918,7 @@ class AdministrationStore(SQLBaseStore):
                             user_threepids.user_id
                             , user_threepids.address
                         FROM user_threepids
-                        WHERE user_threepids.medium = "email") AS user_emails
+                        WHERE user_threepids.medium = 'email') AS user_emails
                         ON user_emails.user_id = users.name
                 LEFT JOIN user_directory ON users.name = user_directory.user_id
                 WHERE users.admin = 1
@@ -0,0 +1,145 @@
+from typing import Dict, List, Optional
+
+import attr
+
+from synapse.storage._base import SQLBaseStore, db_to_json
+from synapse.storage.database import LoggingTransaction
+from synapse.util import json_encoder
+
+
+@attr.s(slots=True, frozen=True, auto_attribs=True)
+class QueuedMail:
+    """An outbound mail waiting to be delivered."""
+
+    id: str
+    email_address: str
+    subject: str
+    app_name: str
+    html: str
+    text: str
+    additional_headers: Optional[Dict[str, str]]
+    queued_ts: int
+    attempts: int
+
+
+class MailQueueStore(SQLBaseStore):
+    async def enqueue_mail(
+        self,
+        id: str,
+        email_address: str,
+        subject: str,
+        app_name: str,
+        html: str,
+        text: str,
+        additional_headers: Optional[Dict[str, str]],
+        queued_ts: int,
+    ):
+        """Add a rendered mail to the outbound queue.
+
+        Args:
+            id: the id of the mail
+            email_address: the address to send the mail to
+            subject: the subject of the mail
+            app_name: the app name to include in the From header
+            html: the HTML content of the mail
+            text: the plain text content of the mail
+            additional_headers: the additional headers of the mail
+            queued_ts: the time the mail is queued at, when it can be first sent
+        """
+        await self.db_pool.simple_insert(
+            table="watcha_mail_queue",
+            values={
+                "id": id,
+                "email_address": email_address,
+                "subject": subject,
+                "app_name": app_name,
+                "html": html,
+                "text": text,
+                "additional_headers": (
+                    json_encoder.encode(additional_headers)
+                    if additional_headers is not None
+                    else None
+                ),
+                "queued_ts": queued_ts,
+                "next_attempt_ts": queued_ts,
+                "attempts": 0,
+            },
+            desc="enqueue_mail",
+        )
+
+    async def get_mails_to_send(self, now: int, limit: int) -> List[QueuedMail]:
+        """Get the queued mails which are due, the oldest first.
+
+        Args:
+            now: the current time
+            limit: the maximum number of mails to return
+        """
+
+        def get_mails_to_send_txn(txn: LoggingTransaction) -> List[QueuedMail]:
+            txn.execute(
+                """
+                SELECT id, email_address, subject, app_name, html, text,
+                    additional_headers, queued_ts, attempts
+                FROM watcha_mail_queue
+                WHERE next_attempt_ts <= ?
+                ORDER BY next_attempt_ts
+                LIMIT ?
+            """,
+                (now, limit),
+            )
+            return [
+                QueuedMail(
+                    id=row[0],
+                    email_address=row[1],
+                    subject=row[2],
+                    app_name=row[3],
+                    html=row[4],
+                    text=row[5],
+                    additional_headers=(
+                        db_to_json(row[6]) if row[6] is not None else None
+                    ),
+                    queued_ts=row[7],
+                    attempts=row[8],
+                )
+                for row in txn
+            ]
+
+        return await self.db_pool.runInteraction(
+            "get_mails_to_send", get_mails_to_send_txn
+        )
+
+    async def reschedule_mail(self, id: str, attempts: int, next_attempt_ts: int):
+        """Record a failed attempt to send a queued mail.
+
+        Args:
+            id: the id of the mail
+            attempts: the number of failed attempts so far
+            next_attempt_ts: the time of the next attempt
+        """
+        await self.db_pool.simple_update_one(
+            table="watcha_mail_queue",
+            keyvalues={"id": id},
+            updatevalues={"attempts": attempts, "next_attempt_ts": next_attempt_ts},
+            desc="reschedule_mail",
+        )
+
+    async def delete_mail(self, id: str):
+        """Remove a mail from the outbound queue.
+
+        Args:
+            id: the id of the mail
+        """
+        await self.db_pool.simple_delete(
+            table="watcha_mail_queue",
+            keyvalues={"id": id},
+            desc="delete_mail",
+        )
+
+    async def count_queued_mails(self) -> int:
+        """Get the number of mails waiting to be delivered."""
+        return await self.db_pool.simple_select_one_onecol(
+            table="watcha_mail_queue",
+            keyvalues={},
+            retcol="COUNT(*)",
+            desc="count_queued_mails",
+        )
@@ -0,0 +1,53 @@
+from typing import Dict
+
+from synapse.storage._base import SQLBaseStore
+
+
+class MediaUsageStore(SQLBaseStore):
+    async def update_media_usage(self, category: str, size_delta: int):
+        """Add some bytes to the disk usage of a media category.
+
+        Args:
+            category: the media category, e.g. 'local', 'remote' or 'thumbnails'
+            size_delta: the number of bytes to add, negative when media are deleted
+        """
+
+        def update_media_usage_txn(txn):
+            txn.execute(
+                """
+                INSERT INTO watcha_media_usage (category, size) VALUES (?, ?)
+                ON CONFLICT (category) DO UPDATE SET size = watcha_media_usage.size + EXCLUDED.size
+            """,
+                (category, size_delta),
+            )
+
+        await self.db_pool.runInteraction("update_media_usage", update_media_usage_txn)
+
+    async def set_media_usage(self, sizes: Dict[str, int]):
+        """Replace the disk usage of the media categories.
+
+        Args:
+            sizes: the number of bytes of each category
+        """
+        await self.db_pool.simple_upsert_many(
+            table="watcha_media_usage",
+            key_names=("category",),
+            key_values=[(category,) for category in sizes],
+            value_names=("size",),
+            value_values=[(size,) for size in sizes.values()],
+            desc="set_media_usage",
+        )
+
+    async def get_media_usage(self) -> Dict[str, int]:
+        """Get the disk usage of the media categories.
+
+        Returns:
+            the number of bytes of each category, empty if it has never been computed
+        """
+        rows = await self.db_pool.simple_select_list(
+            table="watcha_media_usage",
+            keyvalues=None,
+            retcols=("category", "size"),
+            desc="get_media_usage",
+        )
+        return dict(rows)
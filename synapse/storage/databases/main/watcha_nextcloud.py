@@ -1,11 +1,19 @@
-from synapse.storage._base import SQLBaseStore
-from synapse.storage.database import DatabasePool
+from typing import Collection, List, Mapping, Optional
 
+from immutabledict import immutabledict
 
-class NextcloudStore(SQLBaseStore):
+from synapse.api.constants import EventTypes
+from synapse.storage.database import DatabasePool, LoggingTransaction
+from synapse.storage.databases.main.cache import CacheInvalidationWorkerStore
+from synapse.types.state import StateFilter
+from synapse.util.caches.descriptors import cached, cachedList
+
+
+class NextcloudStore(CacheInvalidationWorkerStore):
     def __init__(self, database: DatabasePool, db_conn, hs: "Homeserver"):
         super().__init__(database, db_conn, hs)
 
+    @cached()
     async def get_share_id(self, room_id: str):
         """Get Nextcloud share id of a room.
 
@@ -27,11 +35,18 @@ class NextcloudStore(SQLBaseStore):
             room_id: id of the room
             share_id: id of the Nextcloud share
         """
-        await self.db_pool.simple_upsert(
-            table="watcha_nextcloud_shares",
-            keyvalues={"room_id": room_id},
-            values={"share_id": share_id},
-            desc="register_nextcloud_share",
+
+        def register_share_txn(txn: LoggingTransaction):
+            self.db_pool.simple_upsert_txn(
+                txn,
+                table="watcha_nextcloud_shares",
+                keyvalues={"room_id": room_id},
+                values={"share_id": share_id},
+            )
+            self._invalidate_cache_and_stream(txn, self.get_share_id, (room_id,))
+
+        await self.db_pool.runInteraction(
+            "register_nextcloud_share", register_share_txn
         )
 
     async def delete_share(self, room_id: str):
@@ -40,12 +55,62 @@ class NextcloudStore(SQLBaseStore):
         Args:
             room_id: id of the room where the share is associated
         """
-        await self.db_pool.simple_delete(
+
+        def delete_share_txn(txn: LoggingTransaction):
+            self.db_pool.simple_delete_txn(
+                txn,
+                table="watcha_nextcloud_shares",
+                keyvalues={"room_id": room_id},
+            )
+            self._invalidate_cache_and_stream(txn, self.get_share_id, (room_id,))
+
+        await self.db_pool.runInteraction("delete_nextcloud_share", delete_share_txn)
+
+    async def get_shares_to_reconcile(
+        self, reconciled_before_ts: int, limit: int
+    ) -> List[str]:
+        """Get the shared rooms which Nextcloud group was least recently reconciled
+        with their members.
+
+        Args:
+            reconciled_before_ts: only get the rooms not reconciled since this time
+            limit: the maximum number of rooms to get
+
+        Returns:
+            the ids of the rooms, the least recently reconciled first
+        """
+
+        def get_shares_to_reconcile_txn(txn: LoggingTransaction) -> List[str]:
+            txn.execute(
+                """
+                SELECT room_id FROM watcha_nextcloud_shares
+                WHERE COALESCE(reconciled_ts, 0) < ?
+                ORDER BY COALESCE(reconciled_ts, 0), room_id
+                LIMIT ?
+                """,
+                (reconciled_before_ts, limit),
+            )
+            return [room_id for room_id, in txn]
+
+        return await self.db_pool.runInteraction(
+            "get_shares_to_reconcile", get_shares_to_reconcile_txn
+        )
+
+    async def set_share_reconciled(self, room_id: str, reconciled_ts: int):
+        """Record the time the Nextcloud group of a shared room was reconciled
+
+        Args:
+            room_id: id of the room
+            reconciled_ts: the time of the reconciliation
+        """
+        await self.db_pool.simple_update(
             table="watcha_nextcloud_shares",
             keyvalues={"room_id": room_id},
-            desc="delete_nextcloud_share",
+            updatevalues={"reconciled_ts": reconciled_ts},
+            desc="set_share_reconciled",
         )
 
+    @cached()
     async def get_username(self, user_id: str):
         """Look up a Nextcloud username by their user_id
 
@@ -62,3 +127,45 @@ class NextcloudStore(SQLBaseStore):
             allow_none=True,
             desc="get_nextcloud_username",
         )
+
+    @cachedList(cached_method_name="get_username", list_name="user_ids")
+    async def get_usernames(
+        self, user_ids: Collection[str]
+    ) -> Mapping[str, Optional[str]]:
+        """Look up the Nextcloud usernames of many users at once
+
+        Args:
+            user_ids: The matrix IDs of the users
+
+        Returns:
+            the Nextcloud username of each user, None if they are not known
+        """
+        rows = await self.db_pool.simple_select_many_batch(
+            table="user_external_ids",
+            column="user_id",
+            iterable=user_ids,
+            retcols=("user_id", "nextcloud_username"),
+            desc="get_nextcloud_usernames",
+        )
+        return {
+            user_id: username for user_id, username in rows if username is not None
+        }
+
+    @cached(max_entries=10000)
+    async def get_room_calendar_event_ids(self, room_id: str) -> Mapping[str, str]:
+        """Get the current Nextcloud calendar state events of a room.
+
+        The cache is invalidated on every change of the current state of the room.
+
+        Args:
+            room_id: id of the room
+
+        Returns:
+            the id of the calendar state event of each state key
+        """
+        state_ids = await self.get_partial_filtered_current_state_ids(
+            room_id, StateFilter.from_types([(EventTypes.NextcloudCalendar, None)])
+        )
+        return immutabledict(
+            {state_key: event_id for (_, state_key), event_id in state_ids.items()}
+        )
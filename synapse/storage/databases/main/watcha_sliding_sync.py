@@ -0,0 +1,171 @@
+from typing import TYPE_CHECKING, Collection, Dict, List, Tuple
+
+from synapse.api.constants import EventTypes, Membership
+from synapse.storage._base import SQLBaseStore
+from synapse.storage.database import (
+    DatabasePool,
+    LoggingDatabaseConnection,
+    LoggingTransaction,
+    make_in_list_sql_clause,
+)
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+# The events which bump a room to the top of the room lists, as the events the users
+# see in the room list previews: the encrypted rooms only receive m.room.encrypted
+# events, whatever their content
+BUMP_EVENT_TYPES = (
+    EventTypes.Create,
+    EventTypes.Message,
+    EventTypes.Encrypted,
+    "m.sticker",
+    "m.call.invite",
+    "m.poll.start",
+    "org.matrix.msc3381.poll.start",
+)
+
+
+class SlidingSyncStore(SQLBaseStore):
+    """The recency of rooms, as used to order the room lists of sliding sync.
+
+    The recency of a room is the stream ordering of its last bump event, as
+    maintained in `watcha_room_stats`, or of the membership of the user if the room
+    has none, e.g. if it was joined over federation and had no message since.
+    """
+
+    def __init__(
+        self,
+        database: DatabasePool,
+        db_conn: LoggingDatabaseConnection,
+        hs: "HomeServer",
+    ):
+        super().__init__(database, db_conn, hs)
+
+        self.db_pool.updates.register_background_update_handler(
+            "watcha_room_stats_bump_populate", self._background_populate_bump
+        )
+
+    async def get_sliding_sync_rooms(self, user_id: str) -> List[Tuple[str, str, int]]:
+        """Get the rooms a local user is joined or invited to, the most recent first.
+
+        Args:
+            user_id: the mxid of the user
+
+        Returns:
+            the id, the membership of the user and the recency of each room
+        """
+
+        def get_sliding_sync_rooms_txn(
+            txn: LoggingTransaction,
+        ) -> List[Tuple[str, str, int]]:
+            txn.execute(
+                """
+                SELECT c.room_id, c.membership
+                    , COALESCE(s.bump_stream_ordering, e.stream_ordering, 0) AS recency
+                FROM local_current_membership AS c
+                LEFT JOIN watcha_room_stats AS s USING (room_id)
+                LEFT JOIN events AS e ON e.event_id = c.event_id
+                WHERE c.user_id = ? AND c.membership IN (?, ?)
+                ORDER BY recency DESC, c.room_id
+            """,
+                (user_id, Membership.JOIN, Membership.INVITE),
+            )
+            return [
+                (room_id, membership, recency) for room_id, membership, recency in txn
+            ]
+
+        return await self.db_pool.runInteraction(
+            "get_sliding_sync_rooms", get_sliding_sync_rooms_txn
+        )
+
+    async def get_rooms_recency(self, room_ids: Collection[str]) -> Dict[str, int]:
+        """Get the recency of some rooms.
+
+        Args:
+            room_ids: the ids of the rooms
+
+        Returns:
+            the recency of each room which has a bump event. The recency of the
+            others is the one of the membership of the user, which did not change.
+        """
+        if not room_ids:
+            return {}
+
+        def get_rooms_recency_txn(txn: LoggingTransaction) -> Dict[str, int]:
+            clause, args = make_in_list_sql_clause(
+                self.database_engine, "room_id", room_ids
+            )
+            txn.execute(
+                f"""
+                SELECT room_id, bump_stream_ordering
+                FROM watcha_room_stats
+                WHERE {clause} AND bump_stream_ordering IS NOT NULL
+            """,
+                args,
+            )
+            return dict(txn)
+
+        return await self.db_pool.runInteraction(
+            "get_rooms_recency", get_rooms_recency_txn
+        )
+
+    async def _background_populate_bump(self, progress: dict, batch_size: int) -> int:
+        """Populate the bump stream ordering of `watcha_room_stats` from the events of
+        the existing rooms"""
+        last_room_id = progress.get("last_room_id", "")
+
+        def _background_populate_bump_txn(txn: LoggingTransaction) -> int:
+            txn.execute(
+                """
+                SELECT room_id
+                FROM rooms
+                WHERE room_id > ?
+                ORDER BY room_id ASC
+                LIMIT ?
+            """,
+                (last_room_id, batch_size),
+            )
+            room_ids = [row[0] for row in txn.fetchall()]
+            if not room_ids:
+                return 0
+
+            room_clause, room_args = make_in_list_sql_clause(
+                self.database_engine, "room_id", room_ids
+            )
+            type_clause, type_args = make_in_list_sql_clause(
+                self.database_engine, "type", BUMP_EVENT_TYPES
+            )
+            # Rows written by the events persistence in the meantime are more recent
+            # than the ones computed here, so they take precedence.
+            txn.execute(
+                f"""
+                INSERT INTO watcha_room_stats (room_id, bump_stream_ordering)
+                SELECT room_id, MAX(stream_ordering)
+                FROM events
+                WHERE {room_clause} AND {type_clause}
+                    AND NOT outlier AND stream_ordering > 0
+                GROUP BY room_id
+                ON CONFLICT (room_id) DO UPDATE SET
+                    bump_stream_ordering = COALESCE(
+                        watcha_room_stats.bump_stream_ordering,
+                        EXCLUDED.bump_stream_ordering
+                    )
+            """,
+                room_args + type_args,
+            )
+
+            self.db_pool.updates._background_update_progress_txn(
+                txn, "watcha_room_stats_bump_populate", {"last_room_id": room_ids[-1]}
+            )
+            return len(room_ids)
+
+        count = await self.db_pool.runInteraction(
+            "_background_populate_bump", _background_populate_bump_txn
+        )
+        if not count:
+            await self.db_pool.updates._end_background_update(
+                "watcha_room_stats_bump_populate"
+            )
+
+        return count
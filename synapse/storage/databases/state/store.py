@@ -44,13 +44,22 @@ from synapse.storage.database import (
     LoggingDatabaseConnection,
     LoggingTransaction,
 )
+from synapse.storage.engines import PostgresEngine  # watcha+
 from synapse.storage.databases.state.bg_updates import StateBackgroundUpdateStore
+from synapse.storage.databases.state.watcha_compressor import (  # watcha+
+    StateCompressorStore,
+)
 from synapse.storage.types import Cursor
 from synapse.storage.util.sequence import build_sequence_generator
 from synapse.types import MutableStateMap, StateKey, StateMap
 from synapse.types.state import StateFilter
+from synapse.util.caches import intern_string  # watcha+
 from synapse.util.caches.descriptors import cached
 from synapse.util.caches.dictionary_cache import DictionaryCache
+from synapse.util.caches.watcha_state_map import (  # watcha+
+    SharedStateMap,
+    SharedStateMapSizer,
+)
 from synapse.util.cancellation import cancellable
 
 if TYPE_CHECKING:
@@ -75,7 +84,12 @@ class _GetStateGroupDelta:
         return len(self.delta_ids) if self.delta_ids else 0
 
 
+""" watcha!
 class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
+!watcha """
+class StateGroupDataStore(  # watcha+
+    StateCompressorStore, StateBackgroundUpdateStore, SQLBaseStore
+):
     """A data store for fetching/storing state groups."""
 
     def __init__(
@@ -119,12 +133,14 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
             "*stateGroupCache*",
             # TODO: this hasn't been tuned yet
             50000,
+            size_callback=SharedStateMapSizer(),  # watcha+
         )
         self._state_group_members_cache: DictionaryCache[
             int, StateKey, str
         ] = DictionaryCache(
             "*stateGroupMembersCache*",
             500000,
+            size_callback=SharedStateMapSizer(),  # watcha+
         )
 
         def get_max_state_group_txn(txn: Cursor) -> int:
@@ -183,6 +199,108 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
             "get_state_group_delta", _get_state_group_delta_txn
         )
 
+    # watcha+
+    async def get_state_deltas_from_group(
+        self, from_group: int, to_groups: Collection[int]
+    ) -> Optional[Dict[int, StateMap[str]]]:
+        """Get the changes of state between a state group and some of its descendants,
+        by walking their delta chains rather than loading the full state of the groups.
+
+        Args:
+            from_group: The state group to compute the changes from.
+            to_groups: The state groups to compute the changes to.
+
+        Returns:
+            A map from each of `to_groups` to the (type, state_key) -> event_id of the
+            state which changed since `from_group`, or None if one of `to_groups` does
+            not descend from `from_group` within MAX_STATE_DELTA_HOPS hops.
+        """
+
+        def _get_state_deltas_from_group_txn(
+            txn: LoggingTransaction,
+        ) -> Optional[Dict[int, StateMap[str]]]:
+            chains = {}
+            for to_group in to_groups:
+                chain = self._get_state_group_chain_txn(txn, to_group, from_group)
+                if chain is None:
+                    return None
+                chains[to_group] = chain
+
+            rows = cast(
+                List[Tuple[int, str, str, str]],
+                self.db_pool.simple_select_many_txn(
+                    txn,
+                    table="state_groups_state",
+                    column="state_group",
+                    iterable={group for chain in chains.values() for group in chain},
+                    keyvalues={},
+                    retcols=("state_group", "type", "state_key", "event_id"),
+                ),
+            )
+            delta_ids_by_group: Dict[int, MutableStateMap[str]] = {}
+            for state_group, event_type, state_key, event_id in rows:
+                delta_ids_by_group.setdefault(state_group, {})[
+                    (event_type, state_key)
+                ] = event_id
+
+            deltas: Dict[int, StateMap[str]] = {}
+            for to_group, chain in chains.items():
+                delta: MutableStateMap[str] = {}
+                # Apply the deltas from the oldest to the most recent group
+                for state_group in reversed(chain):
+                    delta.update(delta_ids_by_group.get(state_group, {}))
+                deltas[to_group] = delta
+            return deltas
+
+        return await self.db_pool.runInteraction(
+            "get_state_deltas_from_group", _get_state_deltas_from_group_txn
+        )
+
+    def _get_state_group_chain_txn(
+        self, txn: LoggingTransaction, state_group: int, ancestor: int
+    ) -> Optional[List[int]]:
+        """Get the state groups from a state group back to one of its ancestors, that
+        one excluded, or None if it is not found within MAX_STATE_DELTA_HOPS hops.
+        """
+        if isinstance(self.database_engine, PostgresEngine):
+            txn.execute(
+                """
+                WITH RECURSIVE chain(state_group, hops) AS (
+                    VALUES(?::bigint, 0)
+                    UNION ALL
+                    SELECT e.prev_state_group, c.hops + 1
+                    FROM state_group_edges e, chain c
+                    WHERE e.state_group = c.state_group
+                        AND c.state_group != ?
+                        AND c.hops < ?
+                )
+                SELECT state_group FROM chain ORDER BY hops
+            """,
+                (state_group, ancestor, MAX_STATE_DELTA_HOPS),
+            )
+            chain = [row[0] for row in txn]
+        else:
+            # As in _count_state_group_hops_txn, we don't use WITH RECURSIVE on sqlite3
+            next_group: Optional[int] = state_group
+            chain = [state_group]
+            while next_group != ancestor and len(chain) <= MAX_STATE_DELTA_HOPS:
+                next_group = self.db_pool.simple_select_one_onecol_txn(
+                    txn,
+                    table="state_group_edges",
+                    keyvalues={"state_group": next_group},
+                    retcol="prev_state_group",
+                    allow_none=True,
+                )
+                if next_group is None:
+                    break
+                chain.append(next_group)
+
+        if chain[-1] != ancestor:
+            return None
+        return chain[:-1]
+
+    # +watcha
+
     @trace
     @tag_args
     @cancellable
@@ -416,11 +534,13 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
             state_dict_non_members = {}
 
             for k, v in group_state_dict.items():
+                k = (intern_string(k[0]), intern_string(k[1]))  # watcha+
                 if k[0] == EventTypes.Member:
                     state_dict_members[k] = v
                 else:
                     state_dict_non_members[k] = v
 
+            """ watcha!
             self._state_group_members_cache.update(
                 cache_seq_num_members,
                 key=group,
@@ -434,6 +554,32 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
                 value=state_dict_non_members,
                 fetched_keys=non_member_types,
             )
+            !watcha """
+            # watcha+
+            # The full state of a group is cached as a map sharing its memory with
+            # the state of the other groups
+            self._state_group_members_cache.update(
+                cache_seq_num_members,
+                key=group,
+                value=(
+                    state_dict_members
+                    if member_types is not None
+                    else SharedStateMap(state_dict_members)
+                ),
+                fetched_keys=member_types,
+            )
+
+            self._state_group_cache.update(
+                cache_seq_num_non_members,
+                key=group,
+                value=(
+                    state_dict_non_members
+                    if non_member_types is not None
+                    else SharedStateMap(state_dict_non_members)
+                ),
+                fetched_keys=non_member_types,
+            )
+            # +watcha
 
     @trace
     @tag_args
@@ -681,7 +827,7 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
                 self._state_group_members_cache.update,
                 self._state_group_members_cache.sequence,
                 key=state_group,
-                value=current_member_state_ids,
+                value=SharedStateMap(current_member_state_ids),  # watcha+
             )
 
             current_non_member_state_ids = {
@@ -693,7 +839,7 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
                 self._state_group_cache.update,
                 self._state_group_cache.sequence,
                 key=state_group,
-                value=current_non_member_state_ids,
+                value=SharedStateMap(current_non_member_state_ids),  # watcha+
             )
 
             return state_group
@@ -749,6 +895,8 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
         room_id: str,
         state_groups_to_delete: Collection[int],
     ) -> None:
+        self._lock_state_compression_txn(txn)  # watcha+
+
         logger.info(
             "[purge] found %i state groups to delete", len(state_groups_to_delete)
         )
@@ -864,6 +1012,8 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
         room_id: str,
         state_groups_to_delete: Collection[int],
     ) -> None:
+        self._lock_state_compression_txn(txn)  # watcha+
+
         # first we have to delete the state groups states
         logger.info("[purge] removing %s from state_groups_state", room_id)
 
@@ -896,3 +1046,11 @@ class StateGroupDataStore(StateBackgroundUpdateStore, SQLBaseStore):
             values=state_groups_to_delete,
             keyvalues={},
         )
+
+        # watcha+
+        self.db_pool.simple_delete_txn(
+            txn,
+            table="watcha_state_compressor_rooms",
+            keyvalues={"room_id": room_id},
+        )
+        # +watcha
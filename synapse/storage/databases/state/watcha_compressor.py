@@ -0,0 +1,436 @@
+"""Online compression of the state groups.
+
+The state of a state group is stored as a delta against a previous group, which
+makes a chain to walk back to a full snapshot on every lookup. The chains built as
+the events are persisted follow the history of the room, and are as long as
+allowed. As in the offline `synapse_compress_state` tool, the compressor rewrites
+them toward a structure of levels: each group is a delta against the head of the
+first level with space, and a level is full once it holds as many groups as its
+maximum length, in which case the next group starts it over against the head of
+the next level. A lookup then reads at most as many deltas as the sum of the
+lengths of the levels, and most of them are small.
+
+The compressor runs as a background update, in order of room and state group, so
+that its batches adapt to the speed of the database and it resumes where it
+stopped after a restart. The levels of each room are saved with the last group
+compressed, so that the groups created later are compressed on top of the same
+chains the next time the update is queued.
+
+The purge of state groups reads which groups are deltas against the purged ones in
+order to rewrite them as snapshots, so it must not run while the compressor makes
+new groups deltas against them. Both lock `watcha_state_compressor_rooms` before
+reading the state groups.
+"""
+import logging
+from time import monotonic as monotonic_time
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+import attr
+from prometheus_client import Counter, Histogram
+
+from synapse.metrics.background_process_metrics import wrap_as_background_process
+from synapse.storage.database import (
+    DatabasePool,
+    LoggingDatabaseConnection,
+    LoggingTransaction,
+    make_in_list_sql_clause,
+)
+from synapse.storage.databases.state.bg_updates import StateBackgroundUpdateStore
+from synapse.storage.engines import PostgresEngine
+from synapse.types import JsonDict, StateMap
+from synapse.util import json_decoder, json_encoder
+
+if TYPE_CHECKING:
+    from synapse.server import HomeServer
+
+logger = logging.getLogger(__name__)
+
+STATE_COMPRESSOR_UPDATE_NAME = "watcha_compress_state_groups"
+
+# How often the compression of the state groups created since the last run is queued
+STATE_COMPRESSOR_INTERVAL_MS = 24 * 60 * 60 * 1000
+
+# The state of each compressed group is loaded in memory, so a batch is made of
+# fewer groups than the items of the other background updates
+BATCH_SIZE_SCALE_FACTOR = 10
+
+compressed_state_groups_counter = Counter(
+    "synapse_watcha_state_compressor_groups",
+    "Number of state groups rewritten by the state group compressor",
+)
+
+compressed_state_rows_counter = Counter(
+    "synapse_watcha_state_compressor_rows",
+    "Number of rows in state_groups_state of the state groups rewritten by the "
+    "state group compressor, before and after they are rewritten",
+    ["when"],
+)
+
+state_lookup_timer = Histogram(
+    "synapse_watcha_state_compressor_lookup_seconds",
+    "Time to read the full state of the last state group of each batch of the state "
+    "group compressor, before and after the batch is rewritten",
+    ["when"],
+)
+
+
+@attr.s(slots=True, auto_attribs=True)
+class Level:
+    """A level of the compressed chains of a room.
+
+    Attributes:
+        max_length: the maximum number of groups in the level
+        current_length: the number of groups in the level
+        head: the last group of the level, which the next groups are deltas against
+    """
+
+    max_length: int
+    current_length: int = 0
+    head: Optional[int] = None
+
+    def has_space(self) -> bool:
+        return self.current_length < self.max_length
+
+    def update(self, head: int, has_space: bool) -> None:
+        """Set the head of the level, either appended to the level if it has space,
+        or starting it over.
+        """
+        self.head = head
+        self.current_length = self.current_length + 1 if has_space else 1
+
+
+def choose_prev_group(levels: List[Level], state_group: int) -> Optional[int]:
+    """Choose the group a state group is a delta against, and add it to the levels.
+
+    Returns:
+        The head of the first level with space, or None if the group must be stored
+        as a full snapshot.
+    """
+    for level in levels:
+        if level.has_space():
+            prev_group = level.head
+            level.update(state_group, True)
+            return prev_group
+        level.update(state_group, False)
+    return None
+
+
+def load_levels(levels_json: Optional[str], max_lengths: List[int]) -> List[Level]:
+    """Load the levels saved for a room, or start new ones if there are none or if
+    the configured lengths changed.
+    """
+    if levels_json is not None:
+        levels = [Level(*level) for level in json_decoder.decode(levels_json)]
+        if [level.max_length for level in levels] == max_lengths:
+            return levels
+    return [Level(max_length) for max_length in max_lengths]
+
+
+class StateCompressorStore(StateBackgroundUpdateStore):
+    """Compresses the chains of state groups in a background update."""
+
+    def __init__(
+        self,
+        database: DatabasePool,
+        db_conn: LoggingDatabaseConnection,
+        hs: "HomeServer",
+    ):
+        super().__init__(database, db_conn, hs)
+
+        self._state_compressor_levels = hs.config.watcha.state_compressor_levels
+
+        self.db_pool.updates.register_background_update_handler(
+            STATE_COMPRESSOR_UPDATE_NAME, self._compress_state_groups
+        )
+
+        if (
+            hs.config.watcha.state_compressor_enabled
+            and hs.config.worker.run_background_tasks
+        ):
+            self._clock.looping_call(
+                self.queue_state_compression, STATE_COMPRESSOR_INTERVAL_MS
+            )
+            self._clock.call_later(1, self.queue_state_compression)
+
+    def _lock_state_compression_txn(self, txn: LoggingTransaction) -> None:
+        """Lock the compression of the state groups against their purge, until the
+        end of the transaction.
+
+        On PostgreSQL, it must be called before the transaction reads anything, so
+        that its snapshot includes the changes committed by the other side.
+        """
+        self.database_engine.lock_table(txn, "watcha_state_compressor_rooms")
+
+    @wrap_as_background_process("queue_state_compression")
+    async def queue_state_compression(self) -> None:
+        """Queue the compression of the state groups created since the last run,
+        unless it is already queued.
+        """
+        try:
+            await self.db_pool.simple_insert(
+                table="background_updates",
+                values={
+                    "update_name": STATE_COMPRESSOR_UPDATE_NAME,
+                    "progress_json": "{}",
+                },
+                desc="queue_state_compression",
+            )
+        except self.db_pool.engine.module.IntegrityError:
+            return
+
+        self.db_pool.updates.start_doing_background_updates()
+
+    async def _compress_state_groups(self, progress: JsonDict, batch_size: int) -> int:
+        """Compress the state groups, room by room, up to the last group when the
+        update started.
+        """
+        room_id = progress.get("room_id")
+        max_group = progress.get("max_group")
+
+        batch_size = max(1, int(batch_size / BATCH_SIZE_SCALE_FACTOR))
+
+        if max_group is None:
+            rows = await self.db_pool.execute(
+                "_compress_state_groups",
+                "SELECT coalesce(max(id), 0) FROM state_groups",
+            )
+            max_group = rows[0][0]
+
+        def compress_txn(txn: LoggingTransaction) -> Tuple[bool, int]:
+            self._lock_state_compression_txn(txn)
+
+            current_room_id = room_id
+            if current_room_id is None:
+                current_room_id = self._get_next_compressed_room_txn(txn, None)
+
+            # A room without groups to compress counts as one, so that a batch does
+            # not go through all the rooms when few groups were created
+            processed = 0
+            while current_room_id is not None and processed < batch_size:
+                limit = batch_size - processed
+                state_groups = self._get_state_groups_to_compress_txn(
+                    txn, current_room_id, max_group, limit
+                )
+                if state_groups:
+                    self._compress_room_state_groups_txn(
+                        txn, current_room_id, state_groups
+                    )
+                processed += max(1, len(state_groups))
+                if len(state_groups) < limit:
+                    current_room_id = self._get_next_compressed_room_txn(
+                        txn, current_room_id
+                    )
+
+            if current_room_id is None:
+                return True, processed
+
+            self.db_pool.updates._background_update_progress_txn(
+                txn,
+                STATE_COMPRESSOR_UPDATE_NAME,
+                {"room_id": current_room_id, "max_group": max_group},
+            )
+            return False, processed
+
+        finished, result = await self.db_pool.runInteraction(
+            STATE_COMPRESSOR_UPDATE_NAME, compress_txn
+        )
+
+        if finished:
+            await self.db_pool.updates._end_background_update(
+                STATE_COMPRESSOR_UPDATE_NAME
+            )
+
+        return result * BATCH_SIZE_SCALE_FACTOR
+
+    def _get_next_compressed_room_txn(
+        self, txn: LoggingTransaction, room_id: Optional[str]
+    ) -> Optional[str]:
+        """Get the room with state groups following the given one, or the first one
+        if None.
+        """
+        if room_id is None:
+            txn.execute("SELECT min(room_id) FROM state_groups")
+        else:
+            txn.execute(
+                "SELECT min(room_id) FROM state_groups WHERE room_id > ?", (room_id,)
+            )
+        row = txn.fetchone()
+        return row[0] if row else None
+
+    def _get_state_groups_to_compress_txn(
+        self, txn: LoggingTransaction, room_id: str, max_group: int, limit: int
+    ) -> List[int]:
+        """Get the next groups of a room to compress, locking them on PostgreSQL."""
+        last_state_group = self.db_pool.simple_select_one_onecol_txn(
+            txn,
+            table="watcha_state_compressor_rooms",
+            keyvalues={"room_id": room_id},
+            retcol="last_state_group",
+            allow_none=True,
+        )
+
+        sql = """
+            SELECT id FROM state_groups
+            WHERE room_id = ? AND ? < id AND id <= ?
+            ORDER BY id ASC
+            LIMIT ?
+        """
+        if isinstance(self.database_engine, PostgresEngine):
+            sql += " FOR UPDATE"
+        txn.execute(sql, (room_id, last_state_group or 0, max_group, limit))
+        return [state_group for (state_group,) in txn]
+
+    def _get_existing_state_groups_txn(
+        self, txn: LoggingTransaction, state_groups: Set[int]
+    ) -> Set[int]:
+        """Get the groups which still exist, locking them on PostgreSQL."""
+        if not state_groups:
+            return set()
+
+        clause, args = make_in_list_sql_clause(
+            self.database_engine, "id", state_groups
+        )
+        sql = f"SELECT id FROM state_groups WHERE {clause}"
+        if isinstance(self.database_engine, PostgresEngine):
+            sql += " FOR UPDATE"
+        txn.execute(sql, args)
+        return {state_group for (state_group,) in txn}
+
+    def _compress_room_state_groups_txn(
+        self, txn: LoggingTransaction, room_id: str, state_groups: List[int]
+    ) -> None:
+        """Rewrite the given groups of a room, in order, as deltas against the heads
+        of the levels of the room.
+
+        The full state of every group is unchanged, so the cached state and deltas
+        of the groups, here and on the other workers, are still correct.
+        """
+        levels_json = self.db_pool.simple_select_one_onecol_txn(
+            txn,
+            table="watcha_state_compressor_rooms",
+            keyvalues={"room_id": room_id},
+            retcol="levels",
+            allow_none=True,
+        )
+        levels = load_levels(levels_json, self._state_compressor_levels)
+
+        # The heads may have been purged since the last run, in which case the
+        # compression starts over in new levels
+        heads = {level.head for level in levels if level.head is not None}
+        if self._get_existing_state_groups_txn(txn, heads) != heads:
+            levels = load_levels(None, self._state_compressor_levels)
+            heads = set()
+
+        last_state_group = state_groups[-1]
+        start = monotonic_time()
+        self._get_state_groups_from_groups_txn(txn, [last_state_group])
+        state_lookup_timer.labels("before").observe(monotonic_time() - start)
+
+        states = self._get_state_groups_from_groups_txn(
+            txn, list(heads.union(state_groups))
+        )
+        prev_groups: Dict[int, int] = dict(
+            self.db_pool.simple_select_many_txn(
+                txn,
+                table="state_group_edges",
+                column="state_group",
+                iterable=state_groups,
+                keyvalues={},
+                retcols=("state_group", "prev_state_group"),
+            )
+        )
+
+        rewritten: Dict[int, Tuple[Optional[int], StateMap[str]]] = {}
+        for state_group in state_groups:
+            prev_group = choose_prev_group(levels, state_group)
+            state = states[state_group]
+            # A delta cannot remove state, so the group is stored as a snapshot if
+            # it lacks some of the state of the head
+            if prev_group is not None and not set(states[prev_group]) <= set(state):
+                prev_group = None
+            if prev_group == prev_groups.get(state_group):
+                continue
+
+            if prev_group is None:
+                delta = dict(state)
+            else:
+                prev_state = states[prev_group]
+                delta = {
+                    key: event_id
+                    for key, event_id in state.items()
+                    if prev_state.get(key) != event_id
+                }
+            rewritten[state_group] = (prev_group, delta)
+
+        if rewritten:
+            clause, args = make_in_list_sql_clause(
+                self.database_engine, "state_group", rewritten
+            )
+            txn.execute(f"SELECT count(*) FROM state_groups_state WHERE {clause}", args)
+            (rows_before,) = txn.fetchone()  # type: ignore[misc]
+
+            self.db_pool.simple_delete_many_txn(
+                txn,
+                table="state_group_edges",
+                column="state_group",
+                values=list(rewritten),
+                keyvalues={},
+            )
+            self.db_pool.simple_insert_many_txn(
+                txn,
+                table="state_group_edges",
+                keys=("state_group", "prev_state_group"),
+                values=[
+                    (state_group, prev_group)
+                    for state_group, (prev_group, _) in rewritten.items()
+                    if prev_group is not None
+                ],
+            )
+            self.db_pool.simple_delete_many_txn(
+                txn,
+                table="state_groups_state",
+                column="state_group",
+                values=list(rewritten),
+                keyvalues={},
+            )
+            self.db_pool.simple_insert_many_txn(
+                txn,
+                table="state_groups_state",
+                keys=("state_group", "room_id", "type", "state_key", "event_id"),
+                values=[
+                    (state_group, room_id, key[0], key[1], event_id)
+                    for state_group, (_, delta) in rewritten.items()
+                    for key, event_id in delta.items()
+                ],
+            )
+
+            rows_after = sum(len(delta) for _, delta in rewritten.values())
+            compressed_state_groups_counter.inc(len(rewritten))
+            compressed_state_rows_counter.labels("before").inc(rows_before)
+            compressed_state_rows_counter.labels("after").inc(rows_after)
+            logger.info(
+                "Compressed %d state groups of %s: %d rows rewritten as %d",
+                len(rewritten),
+                room_id,
+                rows_before,
+                rows_after,
+            )
+
+        start = monotonic_time()
+        self._get_state_groups_from_groups_txn(txn, [last_state_group])
+        state_lookup_timer.labels("after").observe(monotonic_time() - start)
+
+        self.db_pool.simple_upsert_txn(
+            txn,
+            table="watcha_state_compressor_rooms",
+            keyvalues={"room_id": room_id},
+            values={
+                "last_state_group": last_state_group,
+                "levels": json_encoder.encode(
+                    [
+                        [level.max_length, level.current_length, level.head]
+                        for level in levels
+                    ]
+                ),
+            },
+        )
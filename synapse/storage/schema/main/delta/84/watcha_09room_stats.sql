@@ -0,0 +1,24 @@
+-- Rooms statistics used by the Watcha admin console, maintained as events are persisted.
+CREATE TABLE IF NOT EXISTS watcha_room_stats (
+    room_id TEXT NOT NULL PRIMARY KEY,
+    creation_ts BIGINT, -- The time the m.room.create event was received.
+    last_message_ts BIGINT -- The time the last m.room.message event was received.
+);
+
+CREATE INDEX IF NOT EXISTS watcha_room_stats_creation_ts ON watcha_room_stats(creation_ts);
+CREATE INDEX IF NOT EXISTS watcha_room_stats_last_message_ts ON watcha_room_stats(last_message_ts);
+
+-- Denormalization of the m.direct account data, as for ignored_users.
+CREATE TABLE IF NOT EXISTS watcha_direct_rooms (
+    user_id TEXT NOT NULL, -- The user who flagged the room as direct.
+    room_id TEXT NOT NULL,
+    CONSTRAINT watcha_direct_rooms_uniqueness UNIQUE (user_id, room_id)
+);
+
+CREATE INDEX IF NOT EXISTS watcha_direct_rooms_room_id ON watcha_direct_rooms(room_id);
+
+INSERT INTO background_updates (ordering, update_name, progress_json) VALUES
+    (8409, 'watcha_room_stats_populate', '{}');
+
+INSERT INTO background_updates (ordering, update_name, progress_json) VALUES
+    (8409, 'watcha_direct_rooms_populate', '{}');
@@ -0,0 +1,10 @@
+-- The last time each user was seen, maintained with the `user_ips` table.
+CREATE TABLE IF NOT EXISTS watcha_user_last_seen (
+    user_id TEXT NOT NULL PRIMARY KEY,
+    last_seen BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS watcha_user_last_seen_last_seen ON watcha_user_last_seen(last_seen);
+
+INSERT INTO background_updates (ordering, update_name, progress_json) VALUES
+    (8410, 'watcha_user_last_seen_populate', '{}');
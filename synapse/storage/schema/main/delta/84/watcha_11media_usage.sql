@@ -0,0 +1,6 @@
+-- The disk usage of the media store per category (local, remote, thumbnails, url_cache),
+-- updated as media are stored or deleted and periodically reconciled with the disk.
+CREATE TABLE IF NOT EXISTS watcha_media_usage (
+    category TEXT NOT NULL PRIMARY KEY,
+    size BIGINT NOT NULL
+);
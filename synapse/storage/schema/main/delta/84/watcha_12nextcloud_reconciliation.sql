@@ -0,0 +1,3 @@
+-- The last time the members of the Nextcloud group of a shared room were reconciled with
+-- the members of the room.
+ALTER TABLE watcha_nextcloud_shares ADD COLUMN reconciled_ts BIGINT;
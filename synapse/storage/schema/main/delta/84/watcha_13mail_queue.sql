@@ -0,0 +1,16 @@
+-- The outbound mails waiting to be delivered, rendered when they were queued. A mail is
+-- deleted once delivered, or once it has failed too many times.
+CREATE TABLE IF NOT EXISTS watcha_mail_queue (
+    id TEXT NOT NULL PRIMARY KEY,
+    email_address TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    app_name TEXT NOT NULL,
+    html TEXT NOT NULL,
+    text TEXT NOT NULL,
+    additional_headers TEXT,
+    queued_ts BIGINT NOT NULL,
+    next_attempt_ts BIGINT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS watcha_mail_queue_next_attempt_ts ON watcha_mail_queue(next_attempt_ts);
@@ -0,0 +1,6 @@
+-- The stream ordering of the last event which bumps a room to the top of the room
+-- lists of sliding sync: a message, whether encrypted or not, a sticker, a call...
+ALTER TABLE watcha_room_stats ADD COLUMN bump_stream_ordering BIGINT;
+
+INSERT INTO background_updates (ordering, update_name, progress_json) VALUES
+    (8414, 'watcha_room_stats_bump_populate', '{}');
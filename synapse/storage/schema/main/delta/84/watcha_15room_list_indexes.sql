@@ -0,0 +1,6 @@
+-- The sort keys of the rooms of the Watcha admin console, so that a page of rooms is
+-- read from the index rather than sorted from all the rooms.
+CREATE INDEX IF NOT EXISTS watcha_room_stats_list_creation_ts
+    ON watcha_room_stats((COALESCE(creation_ts, 0)), room_id);
+CREATE INDEX IF NOT EXISTS watcha_room_stats_list_last_message_ts
+    ON watcha_room_stats((COALESCE(last_message_ts, 0)), room_id);
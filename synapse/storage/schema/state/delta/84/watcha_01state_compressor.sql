@@ -0,0 +1,9 @@
+-- The progress of the state group compressor in each room: the last state group it
+-- compressed, and the levels of the compressed chains as a JSON list of
+-- [max_length, current_length, head] triples, so that the groups created later are
+-- compressed on top of the same chains.
+CREATE TABLE IF NOT EXISTS watcha_state_compressor_rooms (
+    room_id TEXT NOT NULL PRIMARY KEY,
+    last_state_group BIGINT NOT NULL,
+    levels TEXT NOT NULL
+);
@@ -22,6 +22,7 @@ import enum
 import logging
 import threading
 from typing import Dict, Generic, Iterable, Optional, Set, Tuple, TypeVar, Union
+from typing import Any, Callable, Mapping  # watcha+
 
 import attr
 from typing_extensions import Literal
@@ -56,7 +57,7 @@ class DictionaryEntry(Generic[DKT, DV]):
 
     full: bool
     known_absent: Set[DKT]
-    value: Dict[DKT, DV]
+    value: Mapping[DKT, DV]  # watcha+
 
     def __len__(self) -> int:
         return len(self.value)
@@ -118,7 +119,24 @@ class DictionaryCache(Generic[KT, DKT, DV]):
     for the '2' dict key.
     """
 
+    """ watcha!
     def __init__(self, name: str, max_entries: int = 1000):
+    !watcha """
+    # watcha+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1000,
+        size_callback: Callable[[Any], int] = len,
+    ):
+        """
+        Args:
+            name: the name of the cache
+            max_entries: the maximum size of the cache
+            size_callback: the size of the values of the cache, that is of the full
+                dicts and of the entries of a single key, defaults to their length
+        """
+        # +watcha
         # We use a single LruCache to store two different types of entries:
         #   1. Map from (key, dict_key) -> dict value (or sentinel, indicating
         #      the key doesn't exist in the dict); and
@@ -140,12 +158,12 @@ class DictionaryCache(Generic[KT, DKT, DV]):
         #     * A key of `(KT, _FullCacheKey.KEY)` has a value of `Dict[DKT, DV]`
         self.cache: LruCache[
             Tuple[KT, Union[DKT, Literal[_FullCacheKey.KEY]]],
-            Union[_PerKeyValue, Dict[DKT, DV]],
+            Union[_PerKeyValue, Mapping[DKT, DV]],  # watcha+
         ] = LruCache(
             max_size=max_entries,
             cache_name=name,
             cache_type=TreeCache,
-            size_callback=len,
+            size_callback=size_callback,  # watcha+
         )
 
         self.name = name
@@ -224,7 +242,10 @@ class DictionaryCache(Generic[KT, DKT, DV]):
             return DictionaryEntry(False, known_absent, values)
 
         # We have the full dict!
+        """ watcha!
         assert isinstance(entry, dict)
+        !watcha """
+        assert isinstance(entry, Mapping)  # watcha+
 
         for dict_key in missing:
             # We explicitly add each dict key to the cache, so that cache hit
@@ -246,7 +267,10 @@ class DictionaryCache(Generic[KT, DKT, DV]):
         # First we check if we have cached the full dict.
         entry = self.cache.get((key, _FullCacheKey.KEY), _Sentinel.sentinel)
         if entry is not _Sentinel.sentinel:
+            """ watcha!
             assert isinstance(entry, dict)
+            !watcha """
+            assert isinstance(entry, Mapping)  # watcha+
             return DictionaryEntry(True, set(), entry)
 
         return DictionaryEntry(False, set(), {})
@@ -274,7 +298,7 @@ class DictionaryCache(Generic[KT, DKT, DV]):
         self,
         sequence: int,
         key: KT,
-        value: Dict[DKT, DV],
+        value: Mapping[DKT, DV],  # watcha+
         fetched_keys: Optional[Iterable[DKT]] = None,
     ) -> None:
         """Updates the entry in the cache.
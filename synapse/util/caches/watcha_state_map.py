@@ -0,0 +1,162 @@
+"""Immutable state maps sharing their memory with the maps of other state groups.
+
+The state of consecutive state groups only differs by a few entries, yet the state
+group caches used to hold a full dict for each of them. A `SharedStateMap` spreads
+its entries over buckets, by hash of the key, and the buckets are interned: the
+maps of a state group and of its children share all the buckets the deltas between
+them did not touch, whichever order they are loaded in, and without the cache
+having to know how the groups relate. The types and state keys are interned too, as
+the same few types and user IDs are found in the state of every group of a room.
+
+A cache of these maps is sized with a `SharedStateMapSizer`, which counts the
+entries of the buckets referenced by the cached maps once each.
+"""
+import weakref
+from typing import Any, Dict, ItemsView, Iterator, Mapping, Tuple
+from weakref import WeakValueDictionary
+
+from synapse.util.caches import intern_string
+
+# The average number of entries of a bucket. A change in the state of a group
+# copies a bucket, while the list of the buckets of a map is its own.
+TARGET_BUCKET_SIZE = 16
+
+# A reference to a bucket costs about an eighth of the memory of an entry
+BUCKET_REFERENCES_PER_ENTRY = 8
+
+_StateKey = Tuple[str, str]
+_BucketItems = Tuple[Tuple[_StateKey, str], ...]
+
+
+class _Bucket:
+    __slots__ = ["items", "__weakref__"]
+
+    def __init__(self, items: _BucketItems):
+        self.items = items
+
+
+# The buckets of the maps in memory, by their entries. A bucket is dropped once the
+# last map referencing it is.
+_buckets: "WeakValueDictionary[_BucketItems, _Bucket]" = WeakValueDictionary()
+
+
+class _SharedStateItemsView(ItemsView[_StateKey, str]):
+    _mapping: "SharedStateMap"
+
+    def __iter__(self) -> Iterator[Tuple[_StateKey, str]]:
+        for bucket in self._mapping._buckets:
+            yield from bucket.items
+
+
+class SharedStateMap(Mapping[_StateKey, str]):
+    """An immutable map of (type, state_key) to event ID, whose entries are
+    shared with the other maps holding the same buckets.
+    """
+
+    __slots__ = ["_buckets", "_mask", "_len", "__weakref__"]
+
+    def __init__(self, state: Mapping[_StateKey, str]):
+        bucket_count = 1 << (len(state) // TARGET_BUCKET_SIZE).bit_length()
+        mask = bucket_count - 1
+
+        bucket_items: Dict[int, Dict[_StateKey, str]] = {}
+        for (typ, state_key), event_id in state.items():
+            key = (intern_string(typ), intern_string(state_key))
+            bucket_items.setdefault(hash(key) & mask, {})[key] = event_id
+
+        buckets = []
+        for index in range(bucket_count):
+            items = tuple(sorted(bucket_items.get(index, {}).items()))
+            bucket = _buckets.get(items)
+            if bucket is None:
+                bucket = _buckets[items] = _Bucket(items)
+            buckets.append(bucket)
+
+        self._buckets = tuple(buckets)
+        self._mask = mask
+        self._len = len(state)
+
+    def __getitem__(self, key: _StateKey) -> str:
+        for item_key, event_id in self._buckets[hash(key) & self._mask].items:
+            if item_key == key:
+                return event_id
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[_StateKey]:
+        for bucket in self._buckets:
+            for key, _ in bucket.items:
+                yield key
+
+    def __len__(self) -> int:
+        return self._len
+
+    def items(self) -> ItemsView[_StateKey, str]:
+        # Iterate over the buckets rather than looking up each key
+        return _SharedStateItemsView(self)
+
+    def to_dict(self) -> Dict[_StateKey, str]:
+        """Copy the map into a dict, faster than looking up each of its keys."""
+        return dict(self.items())
+
+
+class SharedStateMapSizer:
+    """The size callback of a `LruCache` of `SharedStateMap`s, which charges the
+    entries of a bucket while any of the cached maps references it, and each map
+    for its list of buckets. The size of the cache therefore follows the memory of
+    the cached maps, whichever of them is evicted first.
+
+    The cache calls it once when a value is added and once when it is removed, so a
+    map is charged on the first call and discharged on the second: a map must only
+    be cached under a single key. The other values are sized by their length.
+
+    A map which is dropped from the cache without being discharged, as on a clear
+    of the cache, is discharged once garbage collected.
+    """
+
+    def __init__(self) -> None:
+        # The number of charged maps referencing each bucket, by id of the bucket
+        self._bucket_refs: Dict[int, int] = {}
+        # The charged maps, by id, with the buckets to discharge, which are kept
+        # alive so that their ids are not reused in the meantime
+        self._charged: Dict[
+            int, Tuple["weakref.ref[SharedStateMap]", Tuple[_Bucket, ...]]
+        ] = {}
+
+    def __call__(self, value: Any) -> int:
+        if not isinstance(value, SharedStateMap):
+            return len(value)
+
+        key = id(value)
+        charged = self._charged.get(key)
+        if charged is not None and charged[0]() is value:
+            del self._charged[key]
+            return self._discharge(charged[1])
+
+        def on_collected(ref: "weakref.ref[SharedStateMap]") -> None:
+            charged = self._charged.get(key)
+            if charged is not None and charged[0] is ref:
+                del self._charged[key]
+                self._discharge(charged[1])
+
+        self._charged[key] = (weakref.ref(value, on_collected), value._buckets)
+        return self._charge(value._buckets)
+
+    def _charge(self, buckets: Tuple[_Bucket, ...]) -> int:
+        size = 1 + len(buckets) // BUCKET_REFERENCES_PER_ENTRY
+        for bucket in buckets:
+            refs = self._bucket_refs.get(id(bucket), 0)
+            if not refs:
+                size += len(bucket.items)
+            self._bucket_refs[id(bucket)] = refs + 1
+        return size
+
+    def _discharge(self, buckets: Tuple[_Bucket, ...]) -> int:
+        size = 1 + len(buckets) // BUCKET_REFERENCES_PER_ENTRY
+        for bucket in buckets:
+            refs = self._bucket_refs[id(bucket)] - 1
+            if refs:
+                self._bucket_refs[id(bucket)] = refs
+            else:
+                del self._bucket_refs[id(bucket)]
+                size += len(bucket.items)
+        return size
@@ -232,6 +232,36 @@ class TaskScheduler:
             error=error,
         )
 
+    # watcha+
+    async def update_pending_task(
+        self,
+        id: str,
+        *,
+        timestamp: int,
+        params: Optional[JsonMapping],
+        expected_params: Optional[JsonMapping],
+    ) -> bool:
+        """Update the timestamp and the params of a task which has not been launched
+        yet, as a compare-and-set on its params, e.g. to coalesce it with a new task.
+
+        Unlike `delete_task`, it can be called from any worker: the update is
+        skipped if the task was launched or changed in the meantime.
+
+        Args:
+            id: the id of the task to update
+            timestamp: the new timestamp of the task
+            params: the new params of the task
+            expected_params: the params the task must still have to be updated
+
+        Returns:
+            whether the task was updated
+        """
+        return await self._store.update_pending_scheduled_task(
+            id, timestamp, params, expected_params
+        )
+
+    # +watcha
+
     async def get_task(self, id: str) -> Optional[ScheduledTask]:
         """Get a specific task description by id.
 
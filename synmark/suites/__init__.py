@@ -1,9 +1,29 @@
 from . import logging, lrucache, lrucache_evict
 
+# watcha+
+from . import (
+    watcha_admin_stats,
+    watcha_nextcloud,
+    watcha_room_list,
+    watcha_state_res,
+    watcha_state_res_uncached,
+    watcha_user_list,
+)
+
+# +watcha
+
 SUITES = [
     (logging, 1000),
     (logging, 10000),
     (logging, None),
     (lrucache, None),
     (lrucache_evict, None),
+    # watcha+
+    (watcha_user_list, 100),
+    (watcha_room_list, 100),
+    (watcha_admin_stats, 100),
+    (watcha_nextcloud, 1000),
+    (watcha_state_res, 100),
+    (watcha_state_res_uncached, 100),
+    # +watcha
 ]
@@ -0,0 +1,63 @@
+from pyperf import perf_counter
+
+from synapse.types import ISynapseReactor
+from synmark.watcha import (
+    NEXTCLOUD_SERVICE_ACCOUNT_PASSWORD,
+    FakeNextcloudResource,
+    listen_fake_nextcloud,
+    make_fixture,
+)
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` applications of room memberships to Nextcloud groups, against a
+    local fake Nextcloud server.
+    """
+    resource = FakeNextcloudResource()
+    port = listen_fake_nextcloud(reactor, resource)
+    address = port.getHost()
+
+    fixture = await make_fixture(
+        reactor,
+        watcha_config={
+            "nextcloud_integration": True,
+            "nextcloud_service_account_password": NEXTCLOUD_SERVICE_ACCOUNT_PASSWORD,
+            "nextcloud_url": f"http://{address.host}:{address.port}/nextcloud",
+        },
+    )
+    store = fixture.hs.get_datastores().main
+    nextcloud_handler = fixture.hs.get_nextcloud_handler()
+    for i, room_id in enumerate(fixture.room_ids):
+        await store.register_share(room_id, str(i))
+
+    memberships = [
+        (room_id, user_id)
+        for room_id in fixture.room_ids
+        for user_id in await store.get_users_in_room(room_id)
+        if user_id != fixture.admin_id
+    ]
+
+    start = perf_counter()
+
+    for i in range(loops):
+        room_id, user_id = memberships[i % len(memberships)]
+        # Force the membership to be applied, as if the user had just joined
+        await nextcloud_handler._apply_membership(
+            {
+                "room_id": room_id,
+                "user_id": user_id,
+                "previously_joined": False,
+                "own_calendar_ids": [],
+                "attempts": 0,
+            }
+        )
+
+    end = perf_counter() - start
+
+    assert resource.request_count >= loops
+
+    fixture.cleanup()
+    await port.stopListening()
+
+    return end
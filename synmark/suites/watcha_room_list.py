@@ -0,0 +1,23 @@
+from pyperf import perf_counter
+
+from synapse.types import ISynapseReactor
+from synmark.watcha import make_fixture
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` listings of the rooms for the Watcha admin console.
+    """
+    fixture = await make_fixture(reactor)
+    store = fixture.hs.get_datastores().main
+
+    start = perf_counter()
+
+    for _ in range(loops):
+        await store.watcha_room_list()
+
+    end = perf_counter() - start
+
+    fixture.cleanup()
+
+    return end
@@ -0,0 +1,84 @@
+from typing import List, Tuple
+
+from pyperf import perf_counter
+
+from synapse.server import HomeServer
+from synapse.state import StateResolutionStore
+from synapse.types import ISynapseReactor, StateMap
+from synmark.watcha import make_fixture
+
+# The recorded inputs of a resolution: the room ID, its version and the state sets
+Resolution = Tuple[str, str, List[StateMap[str]]]
+
+
+async def record_resolutions(hs: HomeServer, room_ids: List[str]) -> List[Resolution]:
+    """Record, for each room, the resolution of the forks of its state after a
+    third, two thirds and all of its events, as the events sent over the same forks
+    of a busy room are.
+    """
+    store = hs.get_datastores().main
+    state_storage = hs.get_storage_controllers().state
+
+    resolutions = []
+    for room_id in room_ids:
+        rows = await store.db_pool.simple_select_list(
+            "events",
+            keyvalues={"room_id": room_id},
+            retcols=("stream_ordering", "event_id"),
+            desc="record_resolutions",
+        )
+        event_ids = [event_id for _, event_id in sorted(rows)]
+        forks = [
+            event_ids[len(event_ids) // 3],
+            event_ids[2 * len(event_ids) // 3],
+            event_ids[-1],
+        ]
+        state_sets = await state_storage.get_state_ids_for_events(forks)
+        resolutions.append(
+            (
+                room_id,
+                await store.get_room_version_id(room_id),
+                [state_sets[event_id] for event_id in forks],
+            )
+        )
+
+    return resolutions
+
+
+async def replay_resolutions(
+    hs: HomeServer,
+    resolutions: List[Resolution],
+    loops: int,
+    uncached: bool = False,
+) -> float:
+    """Replay `loops` of the recorded resolutions, in turn, and return the time it
+    took. If `uncached`, the auth chain differences are computed for each of them.
+    """
+    store = hs.get_datastores().main
+    handler = hs.get_state_resolution_handler()
+
+    start = perf_counter()
+
+    for i in range(loops):
+        room_id, room_version, state_sets = resolutions[i % len(resolutions)]
+        if uncached:
+            store._auth_chain_difference_cache.clear()
+        await handler.resolve_events_with_store(
+            room_id, room_version, state_sets, None, StateResolutionStore(store)
+        )
+
+    return perf_counter() - start
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` state resolutions replaying the same forks of the rooms.
+    """
+    fixture = await make_fixture(reactor)
+    resolutions = await record_resolutions(fixture.hs, fixture.room_ids)
+
+    end = await replay_resolutions(fixture.hs, resolutions, loops)
+
+    fixture.cleanup()
+
+    return end
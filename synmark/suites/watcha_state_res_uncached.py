@@ -0,0 +1,19 @@
+from synapse.types import ISynapseReactor
+from synmark.suites.watcha_state_res import record_resolutions, replay_resolutions
+from synmark.watcha import make_fixture
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` state resolutions replaying the same forks of the rooms,
+    without the cache of the auth chain differences, to compare with
+    `watcha_state_res`.
+    """
+    fixture = await make_fixture(reactor)
+    resolutions = await record_resolutions(fixture.hs, fixture.room_ids)
+
+    end = await replay_resolutions(fixture.hs, resolutions, loops, uncached=True)
+
+    fixture.cleanup()
+
+    return end
@@ -0,0 +1,23 @@
+from pyperf import perf_counter
+
+from synapse.types import ISynapseReactor
+from synmark.watcha import make_fixture
+
+
+async def main(reactor: ISynapseReactor, loops: int) -> float:
+    """
+    Benchmark `loops` listings of the users for the Watcha admin console.
+    """
+    fixture = await make_fixture(reactor)
+    administration_handler = fixture.hs.get_watcha_administration_handler()
+
+    start = perf_counter()
+
+    for _ in range(loops):
+        await administration_handler.watcha_user_list()
+
+    end = perf_counter() - start
+
+    fixture.cleanup()
+
+    return end
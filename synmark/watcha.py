@@ -0,0 +1,197 @@
+"""A synthetic Watcha homeserver for the benchmarks of the Watcha-specific paths.
+
+The homeserver runs on the real reactor, with the database of the tests (SQLite, or
+PostgreSQL if SYNAPSE_POSTGRES is set). It is populated with users seen from a few
+devices and rooms with members and messages, through the same handlers as in
+production so that the Watcha tables are maintained as they would be.
+"""
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+import attr
+
+from twisted.internet.interfaces import IListeningPort
+from twisted.web.resource import Resource
+from twisted.web.server import Request, Site
+
+from synapse.api.constants import EventTypes, Membership
+from synapse.config.homeserver import HomeServerConfig
+from synapse.server import HomeServer
+from synapse.storage.databases.main.watcha_administration import (
+    update_user_last_seen_txn,
+)
+from synapse.types import ISynapseReactor, UserID, create_requester
+from synapse.util import Clock
+
+from tests.server import setup_test_homeserver
+from tests.utils import default_config
+
+# The size of the default fixture
+USERS = 200
+ROOMS = 50
+MEMBERS_PER_ROOM = 10
+MESSAGES_PER_ROOM = 20
+DEVICES_PER_USER = 3
+
+NEXTCLOUD_SERVICE_ACCOUNT_PASSWORD = "synmark"
+
+
+@attr.s(slots=True, auto_attribs=True)
+class Fixture:
+    hs: HomeServer
+    admin_id: str
+    user_ids: List[str]
+    room_ids: List[str]
+    cleanups: List[Callable[[], None]]
+
+    def cleanup(self) -> None:
+        for cleanup in reversed(self.cleanups):
+            cleanup()
+
+
+class FakeNextcloudResource(Resource):
+    """Answer every request the way Nextcloud answers successful OCS requests."""
+
+    isLeaf = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.request_count = 0
+
+    def render(self, request: Request) -> bytes:
+        self.request_count += 1
+        request.setHeader(b"Content-Type", b"application/json")
+        return json.dumps(
+            {"ocs": {"meta": {"status": "ok", "statuscode": 100}, "data": {"id": "1"}}}
+        ).encode()
+
+
+def listen_fake_nextcloud(
+    reactor: ISynapseReactor, resource: FakeNextcloudResource
+) -> IListeningPort:
+    return reactor.listenTCP(0, Site(resource), interface="127.0.0.1")
+
+
+async def make_fixture(
+    reactor: ISynapseReactor,
+    users: int = USERS,
+    rooms: int = ROOMS,
+    members_per_room: int = MEMBERS_PER_ROOM,
+    messages_per_room: int = MESSAGES_PER_ROOM,
+    watcha_config: Optional[Dict[str, Any]] = None,
+) -> Fixture:
+    """Set up a homeserver and populate it.
+
+    Args:
+        reactor: the reactor the homeserver runs on
+        users: the number of users, besides the administrator creating the rooms
+        rooms: the number of rooms
+        members_per_room: the number of users joining each room
+        messages_per_room: the number of messages sent in each room
+        watcha_config: the `watcha` section of the configuration
+    """
+    config_dict = default_config("synmark")
+    config_dict["event_cache_size"] = 10000
+    # The benchmarks are not disturbed by the jobs scheduled by the fixture
+    config_dict["run_background_tasks_on"] = "synmark_background_worker"
+    if watcha_config is not None:
+        config_dict["watcha"] = watcha_config
+    config = HomeServerConfig()
+    config.parse_config_dict(config_dict, "", "")
+
+    cleanups: List[Callable[[], None]] = []
+    hs = setup_test_homeserver(
+        cleanups.append, "synmark", config=config, reactor=reactor, clock=Clock(reactor)
+    )
+    store = hs.get_datastores().main
+    await store.db_pool.updates.run_background_updates(False)
+
+    clock = hs.get_clock()
+    registration_handler = hs.get_registration_handler()
+    room_creation_handler = hs.get_room_creation_handler()
+    room_member_handler = hs.get_room_member_handler()
+    event_creation_handler = hs.get_event_creation_handler()
+
+    admin_id = await registration_handler.register_user(
+        localpart="admin", admin=True, bind_emails=["admin@example.com"]
+    )
+    user_ids = []
+    for i in range(users):
+        user_id = await registration_handler.register_user(
+            localpart=f"user{i}",
+            default_display_name=f"User {i}",
+            bind_emails=[f"user{i}@example.com"],
+            make_partner=i % 10 == 0,
+        )
+        await store.record_user_external_id("oidc", f"user{i}", user_id, f"user{i}")
+        user_ids.append(user_id)
+
+    now = clock.time_msec()
+    await store.db_pool.simple_insert_many(
+        table="user_ips",
+        keys=("user_id", "access_token", "device_id", "ip", "user_agent", "last_seen"),
+        values=[
+            (
+                user_id,
+                f"token_{i}_{device}",
+                f"DEVICE{device}",
+                f"10.0.{i % 256}.{device}",
+                "Watcha/synmark",
+                now - (i * DEVICES_PER_USER + device) * 60 * 1000,
+            )
+            for i, user_id in enumerate(user_ids)
+            for device in range(DEVICES_PER_USER)
+        ],
+        desc="synmark_insert_user_ips",
+    )
+    await store.db_pool.runInteraction(
+        "synmark_update_user_last_seen",
+        update_user_last_seen_txn,
+        {
+            user_id: now - i * DEVICES_PER_USER * 60 * 1000
+            for i, user_id in enumerate(user_ids)
+        },
+    )
+
+    admin_requester = create_requester(admin_id)
+    room_ids = []
+    for i in range(rooms):
+        room_id, _, _ = await room_creation_handler.create_room(
+            admin_requester,
+            {"preset": "private_chat", "name": f"Room {i}"},
+            ratelimit=False,
+        )
+        members = [
+            user_ids[(i * members_per_room + j) % len(user_ids)]
+            for j in range(members_per_room)
+        ]
+        for member in members:
+            await room_member_handler.update_membership(
+                admin_requester,
+                UserID.from_string(member),
+                room_id,
+                Membership.INVITE,
+                ratelimit=False,
+            )
+            await room_member_handler.update_membership(
+                create_requester(member),
+                UserID.from_string(member),
+                room_id,
+                Membership.JOIN,
+                ratelimit=False,
+            )
+        for j in range(messages_per_room):
+            sender = members[j % len(members)]
+            await event_creation_handler.create_and_send_nonmember_event(
+                create_requester(sender),
+                {
+                    "type": EventTypes.Message,
+                    "room_id": room_id,
+                    "sender": sender,
+                    "content": {"msgtype": "m.text", "body": f"Message {j}"},
+                },
+                ratelimit=False,
+            )
+        room_ids.append(room_id)
+
+    return Fixture(hs, admin_id, user_ids, room_ids, cleanups)
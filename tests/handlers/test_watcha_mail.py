@@ -0,0 +1,94 @@
+from unittest.mock import AsyncMock
+
+from twisted.internet.defer import ensureDeferred
+
+from synapse.handlers.watcha_mail import (
+    MAIL_DIRECT_MAX_ATTEMPTS,
+    MAIL_DIRECT_RETRY_DELAY_MS,
+    MAIL_MAX_ATTEMPTS,
+    MAIL_RETRY_MAX_DELAY_MS,
+    MAIL_RETRY_MIN_DELAY_MS,
+)
+
+from tests.unittest import HomeserverTestCase
+
+
+class MailQueueHandlerTestCase(HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastores().main
+        self.mail_queue_handler = hs.get_mail_queue_handler()
+        self.send_email_handler = hs.get_send_email_handler()
+        self.send_email_handler.send_email = AsyncMock()
+
+    def enqueue_mail(self):
+        return self.get_success(
+            self.mail_queue_handler.enqueue_mail(
+                "user@example.com", "subject", "Watcha", "<p>html</p>", "text"
+            )
+        )
+
+    def test_deliver_queued_mail(self):
+        self.enqueue_mail()
+        self.pump()
+
+        self.send_email_handler.send_email.assert_called_once_with(
+            email_address="user@example.com",
+            subject="subject",
+            app_name="Watcha",
+            html="<p>html</p>",
+            text="text",
+            additional_headers=None,
+        )
+        self.assertEqual(self.get_success(self.store.count_queued_mails()), 0)
+
+    def test_retry_mail_delivery_with_backoff(self):
+        self.send_email_handler.send_email.side_effect = [Exception(), None]
+        self.enqueue_mail()
+        self.pump()
+        self.assertEqual(self.send_email_handler.send_email.call_count, 1)
+        self.assertEqual(self.get_success(self.store.count_queued_mails()), 1)
+
+        self.reactor.advance(MAIL_RETRY_MIN_DELAY_MS / 2000)
+        self.assertEqual(self.send_email_handler.send_email.call_count, 1)
+
+        self.reactor.advance(MAIL_RETRY_MIN_DELAY_MS / 1000)
+        self.assertEqual(self.send_email_handler.send_email.call_count, 2)
+        self.assertEqual(self.get_success(self.store.count_queued_mails()), 0)
+
+    def test_drop_mail_after_max_attempts(self):
+        self.send_email_handler.send_email.side_effect = Exception()
+        self.enqueue_mail()
+        self.pump()
+        for _ in range(MAIL_MAX_ATTEMPTS):
+            self.reactor.advance(MAIL_RETRY_MAX_DELAY_MS / 1000)
+
+        self.assertEqual(
+            self.send_email_handler.send_email.call_count, MAIL_MAX_ATTEMPTS
+        )
+        self.assertEqual(self.get_success(self.store.count_queued_mails()), 0)
+
+    def test_deliver_mail_is_not_persisted(self):
+        self.send_email_handler.send_email.side_effect = [Exception(), None]
+        self.get_success(
+            self.mail_queue_handler.deliver_mail(
+                "user@example.com", "subject", "Watcha", "<p>password</p>", "password"
+            ),
+            by=MAIL_DIRECT_RETRY_DELAY_MS / 1000,
+        )
+
+        self.assertEqual(self.send_email_handler.send_email.call_count, 2)
+        self.assertEqual(self.get_success(self.store.count_queued_mails()), 0)
+
+    def test_deliver_mail_raises_after_max_attempts(self):
+        self.send_email_handler.send_email.side_effect = Exception()
+        deferred = ensureDeferred(
+            self.mail_queue_handler.deliver_mail(
+                "user@example.com", "subject", "Watcha", "<p>password</p>", "password"
+            )
+        )
+        self.pump(by=MAIL_DIRECT_RETRY_DELAY_MS / 1000)
+        self.failureResultOf(deferred, Exception)
+
+        self.assertEqual(
+            self.send_email_handler.send_email.call_count, MAIL_DIRECT_MAX_ATTEMPTS
+        )
@@ -1,8 +1,17 @@
 from unittest.mock import AsyncMock
 
-from synapse.api.errors import NextcloudError, SynapseError
+from synapse.api.constants import EventTypes
+from synapse.api.errors import HttpResponseException, NextcloudError, SynapseError
+from synapse.handlers.watcha_nextcloud import (
+    RENAME_QUIET_PERIOD_MS,
+    SYNC_BUSY_DELAY_MS,
+    SYNC_COALESCING_DELAY_MS,
+    SYNC_MEMBERSHIP_ACTION_NAME,
+    SYNC_RETRY_MIN_DELAY_MS,
+)
 from synapse.rest import admin
 from synapse.rest.client import login, room
+from synapse.types import TaskStatus, create_requester
 
 from tests.unittest import HomeserverTestCase
 
@@ -23,12 +32,13 @@ class NextcloudHandlerTestCase(HomeserverTestCase):
         self.creator = self.register_user("creator", "pass", admin=True)
         self.creator_tok = self.login("creator", "pass")
         self.inviter = self.register_user("inviter", "pass")
-        inviter_tok = self.login("inviter", "pass")
+        self.inviter_tok = self.login("inviter", "pass")
         self.room_id = self.helper.create_room_as(self.creator, tok=self.creator_tok)
         self.helper.invite(
             self.room_id, src=self.creator, targ=self.inviter, tok=self.creator_tok
         )
-        self.helper.join(self.room_id, self.inviter, tok=inviter_tok)
+        self.helper.join(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.reactor.advance(SYNC_COALESCING_DELAY_MS / 1000)
         self.group_id = self.get_success(
             self.nextcloud_handler.build_group_id(self.room_id)
         )
@@ -48,6 +58,120 @@ class NextcloudHandlerTestCase(HomeserverTestCase):
         self.nextcloud_client.add_user_to_group.reset_mock()
         self.nextcloud_client.share.reset_mock()
 
+    def test_bind_populates_group_in_background(self):
+        self.get_success(
+            self.nextcloud_handler.bind(self.creator, self.room_id, "/folder")
+        )
+        self.nextcloud_client.add_group.assert_called_once_with(self.group_id)
+        self.nextcloud_client.share.assert_called_once()
+
+        self.reactor.advance(0)
+        self.pump()
+        self.assertEquals(self.nextcloud_client.add_user_to_group.call_count, 2)
+
+    def test_retry_membership_sync_with_backoff(self):
+        self.nextcloud_client.remove_user_from_group = AsyncMock(
+            side_effect=HttpResponseException(502, "Bad Gateway", b"")
+        )
+        self.helper.leave(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.reactor.advance(SYNC_COALESCING_DELAY_MS / 1000)
+        self.pump()
+        self.assertEquals(self.nextcloud_client.remove_user_from_group.call_count, 1)
+
+        self.nextcloud_client.remove_user_from_group.side_effect = None
+        self.reactor.advance(SYNC_RETRY_MIN_DELAY_MS / 1000)
+        self.pump()
+        self.assertEquals(self.nextcloud_client.remove_user_from_group.call_count, 2)
+
+    def test_coalesce_membership_sync_in_place(self):
+        task_scheduler = self.hs.get_task_scheduler()
+        task_scheduler.delete_task = AsyncMock()
+        self.helper.leave(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.helper.join(self.room_id, self.inviter, tok=self.inviter_tok)
+
+        tasks = self.get_success(
+            task_scheduler.get_tasks(
+                actions=[SYNC_MEMBERSHIP_ACTION_NAME],
+                resource_id=f"{self.room_id}|{self.inviter}",
+                statuses=[TaskStatus.SCHEDULED],
+            )
+        )
+        self.assertEquals(len(tasks), 1)
+        self.assertTrue(tasks[0].params["previously_joined"])
+        task_scheduler.delete_task.assert_not_called()
+
+        self.reactor.advance(SYNC_COALESCING_DELAY_MS / 1000)
+        self.pump()
+        self.nextcloud_client.remove_user_from_group.assert_not_called()
+
+    def test_defer_membership_sync_of_a_busy_resource(self):
+        self.nextcloud_handler._running_syncs.add(
+            (SYNC_MEMBERSHIP_ACTION_NAME, f"{self.room_id}|{self.inviter}")
+        )
+        self.helper.leave(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.reactor.advance(SYNC_COALESCING_DELAY_MS / 1000)
+        self.pump()
+        self.nextcloud_client.remove_user_from_group.assert_not_called()
+
+        self.nextcloud_handler._running_syncs.clear()
+        self.reactor.advance(SYNC_BUSY_DELAY_MS / 1000)
+        self.pump()
+        self.nextcloud_client.remove_user_from_group.assert_called_once()
+
+    def test_get_calendar_events_follows_room_state(self):
+        def send_calendar_event(content):
+            event, _ = self.get_success(
+                self.nextcloud_handler.event_creation_handler.create_and_send_nonmember_event(
+                    create_requester(self.creator),
+                    {
+                        "type": EventTypes.NextcloudCalendar,
+                        "content": content,
+                        "room_id": self.room_id,
+                        "sender": self.creator,
+                        "state_key": "VEVENT",
+                    },
+                )
+            )
+            return event
+
+        def get_calendar_event_ids():
+            events = self.get_success(
+                self.nextcloud_handler._get_calendar_events(self.room_id)
+            )
+            return [event.event_id for event in events]
+
+        self.assertEquals(get_calendar_event_ids(), [])
+
+        event = send_calendar_event({"id": 1, "is_personal": False})
+        self.assertEquals(get_calendar_event_ids(), [event.event_id])
+
+        send_calendar_event({})
+        self.assertEquals(get_calendar_event_ids(), [])
+
+    def test_reconcile_group(self):
+        self.get_success(
+            self.store.record_user_external_id("oidc", "1", self.creator, "creator")
+        )
+        self.get_success(
+            self.store.record_user_external_id("oidc", "2", self.inviter, "inviter")
+        )
+        self.nextcloud_client.get_group_members = AsyncMock(
+            return_value=["creator", "former_member"]
+        )
+
+        added, removed = self.get_success(
+            self.nextcloud_handler.reconcile_group(self.room_id)
+        )
+
+        self.assertEquals(added, {"inviter"})
+        self.assertEquals(removed, {"former_member"})
+        self.nextcloud_client.add_user_to_group.assert_called_once_with(
+            "inviter", self.group_id
+        )
+        self.nextcloud_client.remove_user_from_group.assert_called_once_with(
+            "former_member", self.group_id
+        )
+
     def test_unbind(self):
         self.get_success(self.nextcloud_handler.unbind(self.creator, self.room_id))
         share_id = self.get_success(self.store.get_share_id(self.room_id))
@@ -118,6 +242,38 @@ class NextcloudHandlerTestCase(HomeserverTestCase):
 
         self.get_success(self.nextcloud_handler.create_group(self.room_id))
 
+    def test_create_group_with_set_displayname_unreachable(self):
+        self.nextcloud_client.set_group_displayname = AsyncMock(
+            side_effect=HttpResponseException(502, "Bad Gateway", b"")
+        )
+
+        self.get_failure(
+            self.nextcloud_handler.create_group(self.room_id), HttpResponseException
+        )
+
+    def test_retry_room_name_sync(self):
+        self.nextcloud_client.set_group_displayname = AsyncMock(
+            side_effect=HttpResponseException(502, "Bad Gateway", b"")
+        )
+        self.helper.send_state(
+            self.room_id, EventTypes.Name, {"name": "new name"}, tok=self.creator_tok
+        )
+        self.reactor.advance(RENAME_QUIET_PERIOD_MS / 1000)
+        self.pump()
+        self.assertEquals(self.nextcloud_client.set_group_displayname.call_count, 1)
+
+        self.nextcloud_client.set_group_displayname.side_effect = None
+        self.reactor.advance(SYNC_RETRY_MIN_DELAY_MS / 1000)
+        self.pump()
+
+        group_displayname = self.get_success(
+            self.nextcloud_handler.build_group_displayname(self.room_id)
+        )
+        self.assertEquals(self.nextcloud_client.set_group_displayname.call_count, 2)
+        self.nextcloud_client.set_group_displayname.assert_called_with(
+            self.group_id, group_displayname
+        )
+
     def test_add_room_members_to_group(self):
         self.get_success(self.nextcloud_handler.add_room_members_to_group(self.room_id))
 
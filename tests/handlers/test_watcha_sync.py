@@ -0,0 +1,52 @@
+from unittest.mock import AsyncMock, patch
+
+from synapse.rest import admin
+from synapse.rest.client import login, room
+from synapse.types import create_requester
+
+from tests.handlers.test_sync import generate_sync_config
+from tests.unittest import HomeserverTestCase
+
+
+class UnreadNotifsTestCase(HomeserverTestCase):
+    servlets = [
+        admin.register_servlets,
+        login.register_servlets,
+        room.register_servlets,
+    ]
+
+    def prepare(self, reactor, clock, hs):
+        self.sync_handler = hs.get_sync_handler()
+
+        self.user_id = self.register_user("user", "pass")
+        self.tok = self.login("user", "pass")
+        self.requester = create_requester(self.user_id)
+
+    def sync(self, since_token=None):
+        return self.get_success(
+            self.sync_handler.wait_for_sync_for_user(
+                self.requester,
+                sync_config=generate_sync_config(self.user_id),
+                since_token=since_token,
+            )
+        )
+
+    def test_fetch_unread_counts_of_the_changed_rooms_only(self):
+        changed_room_id = self.helper.create_room_as(self.user_id, tok=self.tok)
+        self.helper.create_room_as(self.user_id, tok=self.tok)
+        initial_result = self.sync()
+
+        self.helper.send(changed_room_id, "message", tok=self.tok)
+        unread_notifs_for_room_ids = AsyncMock(
+            wraps=self.sync_handler.unread_notifs_for_room_ids
+        )
+        with patch.object(
+            self.sync_handler, "unread_notifs_for_room_ids", unread_notifs_for_room_ids
+        ):
+            result = self.sync(since_token=initial_result.next_batch)
+
+        self.assertEqual([room.room_id for room in result.joined], [changed_room_id])
+        unread_notifs_for_room_ids.assert_called_once()
+        self.assertEqual(
+            list(unread_notifs_for_room_ids.call_args.args[0]), [changed_room_id]
+        )
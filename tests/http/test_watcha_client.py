@@ -0,0 +1,52 @@
+from unittest.mock import AsyncMock
+
+from synapse.api.errors import HttpResponseException
+from synapse.http.watcha_client import ServiceUnavailableError
+
+from tests import unittest
+
+GROUP_MEMBERS = {
+    "ocs": {"meta": {"status": "ok", "statuscode": 100}, "data": {"users": ["user1"]}}
+}
+
+
+class CircuitBreakerTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.nextcloud_client = hs.get_nextcloud_client()
+        self.nextcloud_client.get_json = AsyncMock(
+            side_effect=HttpResponseException(502, "Bad Gateway", b"")
+        )
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        for _ in range(self.nextcloud_client.CIRCUIT_FAILURE_THRESHOLD):
+            self.get_failure(
+                self.nextcloud_client.get_group_members("group"),
+                HttpResponseException,
+            )
+
+        self.get_failure(
+            self.nextcloud_client.get_group_members("group"), ServiceUnavailableError
+        )
+        self.assertEqual(
+            self.nextcloud_client.get_json.call_count,
+            self.nextcloud_client.CIRCUIT_FAILURE_THRESHOLD,
+        )
+
+        self.reactor.advance(self.nextcloud_client.CIRCUIT_RESET_TIMEOUT_MS / 1000)
+        self.nextcloud_client.get_json = AsyncMock(return_value=GROUP_MEMBERS)
+        members = self.get_success(self.nextcloud_client.get_group_members("group"))
+
+        self.assertEqual(members, ["user1"])
+        self.assertFalse(self.nextcloud_client.circuit_breaker.is_open)
+
+    def test_client_errors_do_not_open_the_circuit(self):
+        self.nextcloud_client.get_json = AsyncMock(
+            side_effect=HttpResponseException(404, "Not Found", b"")
+        )
+        for _ in range(self.nextcloud_client.CIRCUIT_FAILURE_THRESHOLD + 1):
+            self.get_failure(
+                self.nextcloud_client.get_group_members("group"),
+                HttpResponseException,
+            )
+
+        self.assertFalse(self.nextcloud_client.circuit_breaker.is_open)
@@ -0,0 +1,78 @@
+from unittest.mock import AsyncMock, Mock
+
+from twisted.internet import defer
+from twisted.internet.error import ConnectError
+
+from tests import unittest
+
+TOKEN = {
+    "access_token": "access_token",
+    "expires_in": 300,
+    "refresh_token": "refresh_token",
+    "refresh_expires_in": 1800,
+}
+
+
+class KeycloakAccessTokenTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.keycloak_client = hs.get_keycloak_client()
+        self.keycloak_client.post_urlencoded_get_json = AsyncMock(return_value=TOKEN)
+
+    def get_grant_types(self):
+        return [
+            call.kwargs["args"]["grant_type"]
+            for call in self.keycloak_client.post_urlencoded_get_json.call_args_list
+        ]
+
+    def test_access_token_is_cached_until_expiry(self):
+        for _ in range(3):
+            token = self.get_success(self.keycloak_client._get_access_token())
+            self.assertEqual(token, "access_token")
+        self.assertEqual(self.get_grant_types(), ["password"])
+
+        self.reactor.advance(300)
+        self.get_success(self.keycloak_client._get_access_token())
+        self.assertEqual(self.get_grant_types(), ["password", "refresh_token"])
+
+        self.reactor.advance(1800)
+        self.get_success(self.keycloak_client._get_access_token())
+        self.assertEqual(
+            self.get_grant_types(), ["password", "refresh_token", "password"]
+        )
+
+    def test_concurrent_renewals_are_deduplicated(self):
+        response = defer.Deferred()
+        self.keycloak_client.post_urlencoded_get_json = Mock(return_value=response)
+
+        first = defer.ensureDeferred(self.keycloak_client._get_access_token())
+        second = defer.ensureDeferred(self.keycloak_client._get_access_token())
+        response.callback(TOKEN)
+
+        self.assertEqual(self.successResultOf(first), "access_token")
+        self.assertEqual(self.successResultOf(second), "access_token")
+        self.assertEqual(self.keycloak_client.post_urlencoded_get_json.call_count, 1)
+
+    def test_token_failures_count_once_for_the_circuit(self):
+        self.keycloak_client.post_urlencoded_get_json = AsyncMock(
+            side_effect=ConnectError()
+        )
+        self.keycloak_client.get_json = AsyncMock(return_value=[])
+        threshold = self.keycloak_client.CIRCUIT_FAILURE_THRESHOLD
+
+        for _ in range(threshold - 1):
+            self.get_failure(self.keycloak_client.get_users(), ConnectError)
+        self.assertFalse(self.keycloak_client.circuit_breaker.is_open)
+
+        self.get_failure(self.keycloak_client.get_users(), ConnectError)
+        self.assertTrue(self.keycloak_client.circuit_breaker.is_open)
+
+        # The probe renews the token, which still fails
+        self.reactor.advance(self.keycloak_client.CIRCUIT_RESET_TIMEOUT_MS / 1000)
+        self.get_failure(self.keycloak_client.get_users(), ConnectError)
+        self.assertTrue(self.keycloak_client.circuit_breaker.is_open)
+
+        self.reactor.advance(self.keycloak_client.CIRCUIT_RESET_TIMEOUT_MS / 1000)
+        self.keycloak_client.post_urlencoded_get_json = AsyncMock(return_value=TOKEN)
+        self.get_success(self.keycloak_client.get_users())
+        self.assertFalse(self.keycloak_client.circuit_breaker.is_open)
+        self.keycloak_client.get_json.assert_called_once()
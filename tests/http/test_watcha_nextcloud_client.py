@@ -0,0 +1,29 @@
+from unittest.mock import AsyncMock
+
+from synapse.api.errors import NextcloudError
+
+from tests import unittest
+
+
+class NextcloudFanOutTestCase(unittest.HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.nextcloud_client = hs.get_nextcloud_client()
+
+    def test_add_users_to_group_collects_errors(self):
+        error = NextcloudError(code=103, msg="")
+
+        async def add_user_to_group(username, group_id):
+            if username == "unknown":
+                raise error
+
+        self.nextcloud_client.add_user_to_group = AsyncMock(
+            side_effect=add_user_to_group
+        )
+        errors = self.get_success(
+            self.nextcloud_client.add_users_to_group(
+                ["user1", "unknown", "user2"], "group"
+            )
+        )
+
+        self.assertEqual(errors, {"unknown": error})
+        self.assertEqual(self.nextcloud_client.add_user_to_group.call_count, 3)
@@ -0,0 +1,54 @@
+from immutabledict import immutabledict
+
+from synapse.http.server import iterencode_json
+from synapse.util import json_decoder, json_encoder
+
+from tests import unittest
+
+
+class IterencodeJsonTestCase(unittest.TestCase):
+    def setUp(self):
+        self.json_object = {
+            "next_batch": "s1",
+            "rooms": {
+                "join": {
+                    "!a:test": {"timeline": {"events": [{"body": "é"}]}},
+                    "!b:test": immutabledict({"state": {"events": []}}),
+                },
+                "invite": {},
+                "leave": {},
+            },
+            "presence": {"events": []},
+        }
+
+    def test_encode_like_the_encoder(self):
+        for split_depth in range(5):
+            encoded = b"".join(iterencode_json(self.json_object, split_depth))
+            self.assertEqual(
+                encoded, json_encoder.encode(self.json_object).encode("utf-8")
+            )
+            self.assertEqual(json_decoder.decode(encoded.decode()), self.json_object)
+
+    def test_encode_room_by_room(self):
+        chunks = list(iterencode_json(self.json_object, 3))
+
+        self.assertIn(
+            json_encoder.encode(self.json_object["rooms"]["join"]["!a:test"]).encode(),
+            chunks,
+        )
+        self.assertIn(b'{"state":{"events":[]}}', chunks)
+
+    def test_encode_without_split(self):
+        self.assertEqual(len(list(iterencode_json(self.json_object, 0))), 1)
+
+    def test_encode_and_consume_the_rooms(self):
+        expected = json_encoder.encode(self.json_object).encode("utf-8")
+        presence = self.json_object["presence"]
+
+        chunks = iterencode_json(self.json_object, 3, consume=True)
+        encoded = b"".join(chunks)
+
+        self.assertEqual(encoded, expected)
+        self.assertEqual(self.json_object["rooms"]["join"], {})
+        self.assertIs(self.json_object["presence"], presence)
+        self.assertEqual(presence, {"events": []})
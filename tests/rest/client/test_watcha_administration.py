@@ -1,4 +1,5 @@
 import json
+from unittest.mock import patch
 
 from synapse.rest import admin
 from synapse.rest.client import login, room, watcha
@@ -120,12 +121,26 @@ class AdministrationTestCase(unittest.HomeserverTestCase):
             {
                 "active_dm_room_count": 0,
                 "dm_room_count": 0,
-                "active_regular_room_count": 0,
+                "active_regular_room_count": 2,
                 "regular_room_count": 2,
             },
         )
         self.assertEquals(200, channel.code)
 
+    def test_watcha_user_list_with_inconsistent_role(self):
+        self.get_success(
+            self.hs.get_datastores().main.db_pool.simple_update_one(
+                "users", {"name": self.partner}, {"admin": 1}
+            )
+        )
+
+        channel = self.make_request(
+            "GET",
+            self.url + "watcha_user_list",
+            access_token=self.admin_tok,
+        )
+        self.assertEquals(400, channel.code)
+
     def test_get_watcha_admin_stats_room_list(self):
         room_ids = sorted([self.room1_id, self.room2_id])
 
@@ -142,7 +157,7 @@ class AdministrationTestCase(unittest.HomeserverTestCase):
                         "members": ["@admin:test"],
                         "name": None,
                         "room_id": self.room1_id,
-                        "status": "inactive",
+                        "status": "new",
                         "type": "regular_room",
                     },
                     {
@@ -150,9 +165,87 @@ class AdministrationTestCase(unittest.HomeserverTestCase):
                         "members": ["@admin:test"],
                         "name": None,
                         "room_id": self.room2_id,
-                        "status": "inactive",
+                        "status": "new",
                         "type": "regular_room",
                     },
                 ],
             )
         self.assertEquals(200, channel.code)
+
+    def test_watcha_room_stats_are_maintained(self):
+        store = self.hs.get_datastores().main
+
+        def get_room_stats():
+            return self.get_success(
+                store.db_pool.simple_select_one(
+                    table="watcha_room_stats",
+                    keyvalues={"room_id": self.room1_id},
+                    retcols=("creation_ts", "last_message_ts"),
+                )
+            )
+
+        self.assertEqual(get_room_stats(), (self.time, None))
+
+        self.reactor.advance(60)
+        self.helper.send(self.room1_id, "message", tok=self.admin_tok)
+
+        self.assertEqual(get_room_stats(), (self.time, self.time + 60 * 1000))
+
+    def test_get_watcha_room_list_paginated(self):
+        room_ids = sorted([self.room1_id, self.room2_id])
+
+        channel = self.make_request(
+            "GET", self.url + "watcha_room_list?limit=1", access_token=self.admin_tok
+        )
+        self.assertEquals(200, channel.code)
+        body = json.loads(channel.result["body"])
+        self.assertEqual([room["room_id"] for room in body["rooms"]], room_ids[:1])
+
+        channel = self.make_request(
+            "GET",
+            self.url + "watcha_room_list?limit=1&from=" + body["next_batch"],
+            access_token=self.admin_tok,
+        )
+        self.assertEquals(200, channel.code)
+        body = json.loads(channel.result["body"])
+        self.assertEqual([room["room_id"] for room in body["rooms"]], room_ids[1:])
+
+    def test_get_watcha_room_list_read_page_by_page(self):
+        with patch(
+            "synapse.storage.databases.main.watcha_administration.ROOM_LIST_MAX_LIMIT",
+            1,
+        ):
+            channel = self.make_request(
+                "GET",
+                self.url + "watcha_room_list?order_by=creation_ts&dir=b",
+                access_token=self.admin_tok,
+            )
+        self.assertEquals(200, channel.code)
+        self.assertEqual(
+            sorted(room["room_id"] for room in json.loads(channel.result["body"])),
+            sorted([self.room1_id, self.room2_id]),
+        )
+
+    def test_get_watcha_room_list_filtered(self):
+        self.helper.invite(
+            self.room1_id, self.admin, self.collaborator, tok=self.admin_tok
+        )
+
+        channel = self.make_request(
+            "GET",
+            self.url + "watcha_room_list?member=collab&type=regular_room",
+            access_token=self.admin_tok,
+        )
+        self.assertEquals(200, channel.code)
+        self.assertEqual(
+            [room["room_id"] for room in json.loads(channel.result["body"])],
+            [self.room1_id],
+        )
+
+        channel = self.make_request(
+            "GET",
+            self.url + "watcha_room_list?status=inactive",
+            access_token=self.admin_tok,
+        )
+        self.assertEquals(200, channel.code)
+        self.assertEqual(json.loads(channel.result["body"]), [])
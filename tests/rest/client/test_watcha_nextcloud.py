@@ -2,6 +2,10 @@ import json
 from unittest.mock import AsyncMock
 
 from synapse.api.errors import SynapseError
+from synapse.handlers.watcha_nextcloud import (
+    RENAME_QUIET_PERIOD_MS,
+    SYNC_COALESCING_DELAY_MS,
+)
 from synapse.rest import admin
 from synapse.rest.client import login, room
 
@@ -42,6 +46,10 @@ class NextcloudShareTestCase(unittest.HomeserverTestCase):
         self.nextcloud_client.add_user_to_group = AsyncMock()
         self.nextcloud_client.remove_user_from_group = AsyncMock()
 
+    def wait_for_sync(self, delay_ms: int = SYNC_COALESCING_DELAY_MS):
+        self.reactor.advance(delay_ms / 1000)
+        self.pump()
+
     def send_room_nextcloud_mapping_event(self, request_content):
         channel = self.make_request(
             "PUT",
@@ -103,14 +111,33 @@ class NextcloudShareTestCase(unittest.HomeserverTestCase):
             self.room_id, self.creator, self.inviter, tok=self.creator_tok
         )
         self.helper.join(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.nextcloud_client.add_user_to_group.assert_not_called()
+
+        self.wait_for_sync()
         self.nextcloud_client.add_user_to_group.assert_called_once()
 
     def test_update_nextcloud_share_on_join_leave(self):
         self.helper.join(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.wait_for_sync()
         self.helper.leave(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.wait_for_sync()
         self.nextcloud_client.add_user_to_group.assert_called_once()
         self.nextcloud_client.remove_user_from_group.assert_called_once()
 
+    def test_coalesce_nextcloud_share_updates(self):
+        self.helper.join(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.helper.leave(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.wait_for_sync()
+        self.nextcloud_client.add_user_to_group.assert_not_called()
+        self.nextcloud_client.remove_user_from_group.assert_not_called()
+
+        self.helper.join(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.helper.leave(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.helper.join(self.room_id, self.inviter, tok=self.inviter_tok)
+        self.wait_for_sync()
+        self.nextcloud_client.add_user_to_group.assert_called_once()
+        self.nextcloud_client.remove_user_from_group.assert_not_called()
+
     def test_update_nextcloud_share_with_an_unmapped_room(self):
         self.nextcloud_handler.update_existing_nextcloud_share_for_user = AsyncMock()
         room_id = self.helper.create_room_as(self.creator, tok=self.creator_tok)
@@ -118,15 +145,16 @@ class NextcloudShareTestCase(unittest.HomeserverTestCase):
 
         self.nextcloud_handler.update_existing_nextcloud_share_for_user.assert_not_called()
 
-    def test_update_group_displayname_on_event_type_name(self):
-        self.nextcloud_handler.set_group_displayname = AsyncMock()
+    def rename_room(self, name: str):
         self.helper.send_state(
-            self.room_id,
-            "m.room.name",
-            {"name": "default room"},
-            tok=self.creator_tok,
+            self.room_id, "m.room.name", {"name": name}, tok=self.creator_tok
         )
 
+    def test_update_group_displayname_on_event_type_name(self):
+        self.nextcloud_handler.set_group_displayname = AsyncMock()
+        self.rename_room("default room")
+        self.wait_for_sync(RENAME_QUIET_PERIOD_MS)
+
         group_id = self.get_success(self.nextcloud_handler.build_group_id(self.room_id))
         group_displayname = self.get_success(
             self.nextcloud_handler.build_group_displayname(self.room_id)
@@ -134,3 +162,25 @@ class NextcloudShareTestCase(unittest.HomeserverTestCase):
         self.nextcloud_handler.set_group_displayname.assert_called_once_with(
             group_id, group_displayname
         )
+
+    def test_debounce_group_displayname_updates(self):
+        self.nextcloud_handler.set_group_displayname = AsyncMock()
+        for name in ("first name", "second name", "third name"):
+            self.rename_room(name)
+            self.wait_for_sync(RENAME_QUIET_PERIOD_MS / 2)
+        self.nextcloud_handler.set_group_displayname.assert_not_called()
+
+        self.wait_for_sync(RENAME_QUIET_PERIOD_MS / 2)
+        group_id = self.get_success(self.nextcloud_handler.build_group_id(self.room_id))
+        self.nextcloud_handler.set_group_displayname.assert_called_once_with(
+            group_id, "[Watcha] third name"
+        )
+
+    def test_skip_unchanged_group_displayname(self):
+        self.nextcloud_handler.set_group_displayname = AsyncMock()
+        self.rename_room("same name")
+        self.wait_for_sync(RENAME_QUIET_PERIOD_MS)
+        self.rename_room("same name")
+        self.wait_for_sync(RENAME_QUIET_PERIOD_MS)
+
+        self.nextcloud_handler.set_group_displayname.assert_called_once()
@@ -1,6 +1,6 @@
 import json
 import os
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, patch
 
 import pkg_resources
 
@@ -113,6 +113,24 @@ class InvitePartnerInRoomTestCase(unittest.HomeserverTestCase):
         self.assertEqual(channel.code, 200)
         self.assertEqual(channel.result["body"], b"{}")
 
+    @patch("synapse.handlers.watcha_mail.MAIL_DIRECT_MAX_ATTEMPTS", 1)
+    def test_invite_partner_with_failed_registration_mail(self):
+        async def sendmail(*args, **kwargs):
+            raise Exception("SMTP server unavailable")
+
+        self.hs.get_send_email_handler()._sendmail = sendmail
+
+        channel = self.make_request(
+            "POST",
+            self.invite_uri,
+            {"id_server": "test", "medium": "email", "address": "partner@example.com"},
+            self.owner_tok,
+        )
+
+        self.assertEqual(channel.code, 500)
+        user_id = channel.json_body["user_id"]
+        self.assertIsNotNone(self.get_success(self.store.get_user_by_id(user_id)))
+
     def test_invite_existing_partner(self):
         channel = self.make_request(
             "POST",
@@ -1,5 +1,5 @@
 import os
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, patch
 
 import pkg_resources
 
@@ -143,6 +143,145 @@ class RegisterTestCase(unittest.HomeserverTestCase):
         )
         self.assertEqual(channel.code, 200)
 
+    def test_bulk_register_users(self):
+        channel = self.make_request(
+            "POST",
+            self.url + "/bulk",
+            {
+                "invitees": [
+                    {"email": "User1@example.com", "displayname": "user1"},
+                    {"email": "user2@example.com"},
+                ]
+            },
+            self.owner_tok,
+        )
+        self.assertEqual(channel.code, 202)
+
+        self.pump()
+        channel = self.make_request(
+            "GET",
+            self.url + "/bulk/" + channel.json_body["id"],
+            access_token=self.owner_tok,
+        )
+
+        self.assertEqual(channel.code, 200)
+        self.assertEqual(channel.json_body["status"], "complete")
+        rows = channel.json_body["rows"]
+        self.assertEqual(
+            [(row["email"], row["status"]) for row in rows],
+            [("user1@example.com", "registered"), ("user2@example.com", "registered")],
+        )
+        displayname = self.get_success(
+            self.profile.get_displayname(UserID.from_string(rows[0]["user_id"]))
+        )
+        self.assertEqual(displayname, "user1")
+
+    def test_bulk_register_users_from_csv(self):
+        channel = self.make_request(
+            "POST",
+            self.url + "/bulk",
+            b"email,displayname,admin\n"
+            b"user1@example.com,user1,true\n"
+            b"user2@example.com,,\n",
+            self.owner_tok,
+            custom_headers=[("Content-Type", "text/csv")],
+        )
+        self.assertEqual(channel.code, 202)
+
+        self.pump()
+        bulk_registration = self.get_success(
+            self.hs.get_watcha_registration_handler().get_bulk_registration(
+                channel.json_body["id"]
+            )
+        )
+
+        self.assertEqual(
+            [row["status"] for row in bulk_registration["rows"]],
+            ["registered", "registered"],
+        )
+        is_admin = self.get_success(
+            self.hs.get_datastores().main.is_server_admin(
+                UserID.from_string(bulk_registration["rows"][0]["user_id"])
+            )
+        )
+        self.assertTrue(is_admin)
+
+    def test_bulk_register_users_skips_registered_emails(self):
+        # As a row registered by a resumed task, before its progress was saved
+        user_id = self.register_user("user1", "pass")
+        self.get_success(
+            self.auth.add_threepid(user_id, "email", "user1@example.com", self.time)
+        )
+
+        channel = self.make_request(
+            "POST",
+            self.url + "/bulk",
+            {
+                "invitees": [
+                    {"email": "user1@example.com"},
+                    {"email": "user2@example.com"},
+                ]
+            },
+            self.owner_tok,
+        )
+        self.assertEqual(channel.code, 202)
+
+        self.pump()
+        bulk_registration = self.get_success(
+            self.hs.get_watcha_registration_handler().get_bulk_registration(
+                channel.json_body["id"]
+            )
+        )
+
+        rows = bulk_registration["rows"]
+        self.assertEqual([row["status"] for row in rows], ["registered", "registered"])
+        self.assertEqual(rows[0]["user_id"], user_id)
+        self.assertNotEqual(rows[1]["user_id"], user_id)
+
+    def test_bulk_register_users_with_duplicate_email(self):
+        channel = self.make_request(
+            "POST",
+            self.url + "/bulk",
+            {
+                "invitees": [
+                    {"email": "user1@example.com"},
+                    {"email": "USER1@example.com"},
+                ]
+            },
+            self.owner_tok,
+        )
+
+        self.assertEqual(channel.code, 400)
+
+    @patch("synapse.handlers.watcha_registration.BULK_REGISTER_PROGRESS_ROWS", 2)
+    def test_bulk_register_users_saves_progress_by_batch(self):
+        task_scheduler = self.hs.get_task_scheduler()
+        update_task = AsyncMock(wraps=task_scheduler.update_task)
+
+        with patch.object(task_scheduler, "update_task", new=update_task):
+            channel = self.make_request(
+                "POST",
+                self.url + "/bulk",
+                {"invitees": [{"email": f"user{i}@example.com"} for i in range(5)]},
+                self.owner_tok,
+            )
+            self.assertEqual(channel.code, 202)
+            self.pump()
+
+        saved_results = [
+            call.kwargs["result"]["rows"]
+            for call in update_task.call_args_list
+            if "result" in call.kwargs
+        ]
+        self.assertEqual([len(rows) for rows in saved_results], [2, 4])
+        bulk_registration = self.get_success(
+            self.hs.get_watcha_registration_handler().get_bulk_registration(
+                channel.json_body["id"]
+            )
+        )
+        self.assertEqual(bulk_registration["status"], "complete")
+        self.assertEqual(len(bulk_registration["rows"]), 5)
+
     # watcha+
     skip_reason = (
         "[watcha] to be adapted to conditional functionalities "
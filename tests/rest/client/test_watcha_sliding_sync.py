@@ -0,0 +1,237 @@
+from synapse.api.errors import Codes
+from synapse.rest import admin
+from synapse.rest.client import login, receipts, room, sync
+
+from tests import unittest
+
+SLIDING_SYNC_URL = "/_matrix/client/unstable/org.matrix.msc3575/sync"
+
+
+class SlidingSyncTestCase(unittest.HomeserverTestCase):
+
+    servlets = [
+        admin.register_servlets_for_client_rest_resource,
+        login.register_servlets,
+        receipts.register_servlets,
+        room.register_servlets,
+        sync.register_servlets,
+    ]
+
+    def default_config(self):
+        config = super().default_config()
+        config["experimental_features"] = {"msc3575_enabled": True}
+        return config
+
+    def prepare(self, reactor, clock, hs):
+        self.user = self.register_user("user", "pass")
+        self.user_tok = self.login("user", "pass")
+
+        self.room_ids = []
+        for i in range(3):
+            room_id = self.helper.create_room_as(self.user, tok=self.user_tok)
+            self.reactor.advance(1)
+            self.send_message(room_id, f"message {i}")
+            self.room_ids.append(room_id)
+
+    def send_message(self, room_id, body):
+        self.reactor.advance(1)
+        self.helper.send(room_id, body, tok=self.user_tok)
+
+    def sliding_sync(self, body, pos=None, expected_code=200):
+        url = SLIDING_SYNC_URL if pos is None else f"{SLIDING_SYNC_URL}?pos={pos}"
+        channel = self.make_request(
+            "POST", url, content=body, access_token=self.user_tok
+        )
+        self.assertEqual(channel.code, expected_code, channel.json_body)
+        return channel.json_body
+
+    def test_initial_sliding_sync(self):
+        response = self.sliding_sync(
+            {"lists": {"all": {"ranges": [[0, 1]], "timeline_limit": 1}}}
+        )
+
+        self.assertEqual(response["lists"]["all"]["count"], 3)
+        self.assertEqual(
+            response["lists"]["all"]["ops"],
+            [
+                {
+                    "op": "SYNC",
+                    "range": [0, 1],
+                    "room_ids": [self.room_ids[2], self.room_ids[1]],
+                }
+            ],
+        )
+        self.assertEqual(set(response["rooms"]), set(self.room_ids[1:]))
+        room = response["rooms"][self.room_ids[2]]
+        self.assertTrue(room["initial"])
+        self.assertEqual(room["joined_count"], 1)
+        self.assertTrue(room["limited"])
+        self.assertEqual(
+            [event["content"]["body"] for event in room["timeline"]], ["message 2"]
+        )
+
+    def test_required_state(self):
+        response = self.sliding_sync(
+            {
+                "lists": {
+                    "all": {
+                        "ranges": [[0, 0]],
+                        "required_state": [["m.room.member", "$ME"]],
+                    }
+                }
+            }
+        )
+
+        room = response["rooms"][self.room_ids[2]]
+        self.assertNotIn("timeline", room)
+        self.assertEqual(
+            [(event["type"], event["state_key"]) for event in room["required_state"]],
+            [("m.room.member", self.user)],
+        )
+
+    def test_incremental_sliding_sync(self):
+        body = {"lists": {"all": {"ranges": [[0, 1]], "timeline_limit": 5}}}
+        pos = self.sliding_sync(body)["pos"]
+
+        # A message in the room at the top of the list does not change the window
+        self.send_message(self.room_ids[2], "new message")
+        response = self.sliding_sync(body, pos)
+        self.assertNotIn("ops", response["lists"]["all"])
+        self.assertEqual(list(response["rooms"]), [self.room_ids[2]])
+        room = response["rooms"][self.room_ids[2]]
+        self.assertNotIn("initial", room)
+        self.assertFalse(room["limited"])
+        self.assertEqual(
+            [event["content"]["body"] for event in room["timeline"]], ["new message"]
+        )
+
+        # A message in the room out of the window moves it to the top of the list
+        self.send_message(self.room_ids[0], "old room message")
+        response = self.sliding_sync(body, response["pos"])
+        self.assertEqual(
+            response["lists"]["all"]["ops"][0]["room_ids"],
+            [self.room_ids[0], self.room_ids[2]],
+        )
+        self.assertEqual(list(response["rooms"]), [self.room_ids[0]])
+        self.assertTrue(response["rooms"][self.room_ids[0]]["initial"])
+
+    def test_room_back_in_window_is_sent_in_full(self):
+        body = {"lists": {"all": {"ranges": [[0, 0]], "timeline_limit": 5}}}
+        pos = self.sliding_sync(body)["pos"]
+
+        self.send_message(self.room_ids[1], "bump")
+        response = self.sliding_sync(body, pos)
+        self.assertEqual(list(response["rooms"]), [self.room_ids[1]])
+
+        # The topic does not move the room out of the window back into it
+        self.helper.send_state(
+            self.room_ids[2], "m.room.topic", {"topic": "topic"}, tok=self.user_tok
+        )
+        response = self.sliding_sync(body, response["pos"])
+        self.assertEqual(response["rooms"], {})
+
+        self.send_message(self.room_ids[2], "back")
+        response = self.sliding_sync(body, response["pos"])
+        room = response["rooms"][self.room_ids[2]]
+        self.assertTrue(room["initial"])
+        self.assertEqual(
+            [event["type"] for event in room["timeline"][-2:]],
+            ["m.room.topic", "m.room.message"],
+        )
+
+    def test_room_changes_without_timeline(self):
+        body = {
+            "room_subscriptions": {
+                self.room_ids[0]: {"required_state": [["m.room.topic", ""]]}
+            }
+        }
+        pos = self.sliding_sync(body)["pos"]
+
+        self.helper.send_state(
+            self.room_ids[0], "m.room.topic", {"topic": "topic"}, tok=self.user_tok
+        )
+        response = self.sliding_sync(body, pos)
+        room = response["rooms"][self.room_ids[0]]
+        self.assertNotIn("timeline", room)
+        self.assertEqual(
+            [event["content"] for event in room["required_state"]], [{"topic": "topic"}]
+        )
+
+        self.helper.send_state(
+            self.room_ids[0], "m.room.name", {"name": "new name"}, tok=self.user_tok
+        )
+        response = self.sliding_sync(body, response["pos"])
+        self.assertEqual(response["rooms"][self.room_ids[0]], {"name": "new name"})
+
+    def test_notification_counts_cleared_by_receipt(self):
+        other = self.register_user("other", "pass")
+        other_tok = self.login("other", "pass")
+        self.helper.invite(self.room_ids[0], self.user, other, tok=self.user_tok)
+        self.helper.join(self.room_ids[0], other, tok=other_tok)
+        body = {"room_subscriptions": {self.room_ids[0]: {"timeline_limit": 0}}}
+        pos = self.sliding_sync(body)["pos"]
+
+        event = self.helper.send(self.room_ids[0], "hello", tok=other_tok)
+        response = self.sliding_sync(body, pos)
+        self.assertEqual(response["rooms"][self.room_ids[0]]["notification_count"], 1)
+
+        channel = self.make_request(
+            "POST",
+            f"/rooms/{self.room_ids[0]}/receipt/m.read/{event['event_id']}",
+            {},
+            access_token=self.user_tok,
+        )
+        self.assertEqual(channel.code, 200, channel.json_body)
+        response = self.sliding_sync(body, response["pos"])
+        self.assertEqual(
+            response["rooms"][self.room_ids[0]],
+            {"notification_count": 0, "highlight_count": 0},
+        )
+
+    def test_encrypted_message_bumps_room(self):
+        self.helper.send_event(
+            self.room_ids[0],
+            "m.room.encrypted",
+            {"algorithm": "m.megolm.v1.aes-sha2", "ciphertext": "..."},
+            tok=self.user_tok,
+        )
+
+        response = self.sliding_sync({"lists": {"all": {"ranges": [[0, 0]]}}})
+
+        self.assertEqual(list(response["rooms"]), [self.room_ids[0]])
+
+    def test_room_subscription(self):
+        response = self.sliding_sync(
+            {"room_subscriptions": {self.room_ids[0]: {"timeline_limit": 1}}}
+        )
+
+        self.assertEqual(list(response["rooms"]), [self.room_ids[0]])
+        self.assertEqual(
+            response["rooms"][self.room_ids[0]]["timeline"][0]["content"]["body"],
+            "message 0",
+        )
+
+    def test_invite_in_list(self):
+        other = self.register_user("other", "pass")
+        other_tok = self.login("other", "pass")
+        self.reactor.advance(1)
+        room_id = self.helper.create_room_as(other, tok=other_tok)
+        self.helper.invite(room_id, other, self.user, tok=other_tok)
+
+        response = self.sliding_sync({"lists": {"all": {"ranges": [[0, 0]]}}})
+
+        self.assertEqual(response["lists"]["all"]["count"], 4)
+        self.assertEqual(list(response["rooms"]), [room_id])
+        self.assertIn("invite_state", response["rooms"][room_id])
+
+    def test_unknown_position(self):
+        response = self.sliding_sync({"lists": {}}, "unknown", expected_code=400)
+
+        self.assertEqual(response["errcode"], Codes.UNKNOWN_POS)
+
+    def test_invalid_ranges(self):
+        response = self.sliding_sync(
+            {"lists": {"all": {"ranges": [[1, 0]]}}}, expected_code=400
+        )
+
+        self.assertEqual(response["errcode"], Codes.INVALID_PARAM)
@@ -0,0 +1,166 @@
+import json
+from unittest.mock import AsyncMock, patch
+
+from synapse.api.constants import EventTypes
+from synapse.rest import admin
+from synapse.rest.client import login, room, sync
+
+from tests import unittest
+
+
+class SyncTimingsHeaderTestCase(unittest.HomeserverTestCase):
+
+    servlets = [
+        admin.register_servlets_for_client_rest_resource,
+        login.register_servlets,
+        room.register_servlets,
+        sync.register_servlets,
+    ]
+
+    def prepare(self, reactor, clock, hs):
+        self.admin = self.register_user("admin", "pass", admin=True)
+        self.admin_tok = self.login("admin", "pass")
+        self.user = self.register_user("user", "pass")
+        self.user_tok = self.login("user", "pass")
+
+        self.helper.create_room_as(self.admin, tok=self.admin_tok)
+
+    def get_sync_timings(self, tok, since=None):
+        url = "/sync" if since is None else f"/sync?since={since}"
+        channel = self.make_request("GET", url, access_token=tok)
+        self.assertEqual(channel.code, 200, channel.json_body)
+        return channel.headers.getRawHeaders("Server-Timing"), channel.json_body
+
+    @unittest.override_config({"watcha": {"sync_timings_header": True}})
+    def test_sync_timings_header(self):
+        timings, body = self.get_sync_timings(self.admin_tok)
+
+        self.assertEqual(len(timings), 1)
+        phases = dict(timing.split(";", 1) for timing in timings[0].split(", "))
+        self.assertTrue(phases["rooms"].startswith("dur="))
+        self.assertTrue(phases["state_delta"].startswith("dur="))
+        self.assertEqual(phases["sync"], 'desc="initial"')
+
+        self.helper.create_room_as(self.admin, tok=self.admin_tok)
+        timings, _ = self.get_sync_timings(self.admin_tok, body["next_batch"])
+
+        self.assertIn('sync;desc="incremental"', timings[0])
+
+    @unittest.override_config({"watcha": {"sync_timings_header": True}})
+    def test_no_sync_timings_header_for_users(self):
+        timings, _ = self.get_sync_timings(self.user_tok)
+
+        self.assertIsNone(timings)
+
+    def test_no_sync_timings_header_by_default(self):
+        timings, _ = self.get_sync_timings(self.admin_tok)
+
+        self.assertIsNone(timings)
+
+
+class GappySyncStateTestCase(unittest.HomeserverTestCase):
+
+    servlets = [
+        admin.register_servlets_for_client_rest_resource,
+        login.register_servlets,
+        room.register_servlets,
+        sync.register_servlets,
+    ]
+
+    def prepare(self, reactor, clock, hs):
+        self.state_storage_controller = hs.get_storage_controllers().state
+
+        self.user = self.register_user("user", "pass")
+        self.tok = self.login("user", "pass")
+        self.other = self.register_user("other", "pass")
+        self.other_tok = self.login("other", "pass")
+
+        self.room_id = self.helper.create_room_as(
+            self.user, is_public=True, tok=self.tok
+        )
+
+    def initial_sync(self):
+        channel = self.make_request("GET", "/sync", access_token=self.tok)
+        self.assertEqual(channel.code, 200, channel.json_body)
+        return channel.json_body["next_batch"]
+
+    def gappy_sync(self, since, lazy_load_members=False):
+        sync_filter = json.dumps(
+            {
+                "room": {
+                    "timeline": {"limit": 2},
+                    "state": {"lazy_load_members": lazy_load_members},
+                }
+            }
+        )
+        channel = self.make_request(
+            "GET", f"/sync?since={since}&filter={sync_filter}", access_token=self.tok
+        )
+        self.assertEqual(channel.code, 200, channel.json_body)
+        room = channel.json_body["rooms"]["join"][self.room_id]
+        self.assertTrue(room["timeline"]["limited"])
+        return {
+            (event["type"], event["state_key"]): event["event_id"]
+            for event in room["state"]["events"]
+        }
+
+    def assert_state_from_groups(self, since, lazy_load_members=False):
+        """Check that the state of a gappy sync is computed from the deltas of the
+        state groups, and is the same as when computed from the full state.
+        """
+        deltas = []
+        get_state_deltas_from_group = (
+            self.state_storage_controller.get_state_deltas_from_group
+        )
+
+        async def record_state_deltas_from_group(from_group, to_groups):
+            deltas.append(await get_state_deltas_from_group(from_group, to_groups))
+            return deltas[-1]
+
+        with patch.object(
+            self.state_storage_controller,
+            "get_state_deltas_from_group",
+            new=record_state_deltas_from_group,
+        ):
+            state = self.gappy_sync(since, lazy_load_members)
+        self.assertEqual(len(deltas), 1)
+        self.assertIsNotNone(deltas[0])
+
+        with patch.object(
+            self.state_storage_controller,
+            "get_state_deltas_from_group",
+            new=AsyncMock(return_value=None),
+        ):
+            full_state = self.gappy_sync(since, lazy_load_members)
+
+        self.assertEqual(state, full_state)
+        return state
+
+    def test_gappy_sync_state(self):
+        since = self.initial_sync()
+        self.helper.join(self.room_id, self.other, tok=self.other_tok)
+        self.helper.send_state(
+            self.room_id, EventTypes.Topic, {"topic": "topic"}, tok=self.tok
+        )
+        for i in range(3):
+            self.helper.send(self.room_id, f"message {i}", tok=self.tok)
+
+        state = self.assert_state_from_groups(since)
+
+        self.assertEqual(
+            set(state), {(EventTypes.Member, self.other), (EventTypes.Topic, "")}
+        )
+
+    def test_gappy_sync_state_with_lazy_loaded_members(self):
+        since = self.initial_sync()
+        self.helper.join(self.room_id, self.other, tok=self.other_tok)
+        self.helper.send_state(
+            self.room_id, EventTypes.Topic, {"topic": "topic"}, tok=self.tok
+        )
+        for i in range(3):
+            self.helper.send(self.room_id, f"message {i}", tok=self.other_tok)
+
+        state = self.assert_state_from_groups(since, lazy_load_members=True)
+
+        self.assertIn((EventTypes.Member, self.other), state)
+        self.assertIn((EventTypes.Topic, ""), state)
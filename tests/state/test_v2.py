@@ -45,6 +45,7 @@ from synapse.state.v2 import (
     resolve_events_with_store,
 )
 from synapse.types import EventID, StateMap
+from synapse.util.caches.lrucache import LruCache  # watcha+
 
 from tests import unittest
 
@@ -877,6 +878,14 @@ def pairwise(iterable: Iterable[T]) -> Iterable[Tuple[T, T]]:
 @attr.s
 class TestStateResolutionStore:
     event_map: Dict[str, EventBase] = attr.ib()
+    # watcha+
+    power_levels_auth_cache: LruCache[str, Optional[str]] = attr.ib(
+        factory=lambda: LruCache(1000)
+    )
+    mainline_positions_cache: LruCache[str, Mapping[str, int]] = attr.ib(
+        factory=lambda: LruCache(1000)
+    )
+    # +watcha
 
     def get_events(
         self, event_ids: Collection[str], allow_rejected: bool = False
@@ -0,0 +1,170 @@
+from typing import Dict, List
+
+import attr
+
+from twisted.internet import defer
+
+from synapse.api.constants import EventTypes, Membership
+from synapse.events import EventBase, make_event_from_dict
+from synapse.state.v2 import _get_power_level_for_sender, _mainline_sort
+from synapse.types import StrCollection
+
+from tests import unittest
+from tests.state.test_v2 import (
+    ALICE,
+    ROOM_ID,
+    FakeClock,
+    TestStateResolutionStore,
+)
+
+
+@attr.s
+class CountingStateResolutionStore(TestStateResolutionStore):
+    fetched: List[str] = attr.ib(factory=list)
+
+    def get_events(
+        self, event_ids: StrCollection, allow_rejected: bool = False
+    ) -> "defer.Deferred[Dict[str, EventBase]]":
+        self.fetched.extend(event_ids)
+        return super().get_events(event_ids, allow_rejected)
+
+
+def make_event(
+    node_id: str, type: str, auth_events: List[EventBase], **kwargs: object
+) -> EventBase:
+    return make_event_from_dict(
+        {
+            "event_id": f"${node_id}:example.com",
+            "room_id": ROOM_ID,
+            "sender": ALICE,
+            "type": type,
+            "state_key": "",
+            "content": {},
+            "auth_events": [(event.event_id, {}) for event in auth_events],
+            "prev_events": [],
+            "origin_server_ts": len(node_id),
+            **kwargs,
+        }
+    )
+
+
+class MainlineCacheTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        create = make_event("CREATE", EventTypes.Create, [])
+        member = make_event(
+            "IMA",
+            EventTypes.Member,
+            [create],
+            state_key=ALICE,
+            content={"membership": Membership.JOIN},
+        )
+        self.power_levels = []
+        for i in range(3):
+            self.power_levels.append(
+                make_event(
+                    f"PL{i}",
+                    EventTypes.PowerLevels,
+                    [create, member, *self.power_levels[-1:]],
+                    content={"users": {ALICE: 100 - i}},
+                )
+            )
+        self.old_topic = make_event(
+            "OLDTOPIC", EventTypes.Topic, [create, member, self.power_levels[0]]
+        )
+        self.topic = make_event(
+            "T", EventTypes.Topic, [create, member, self.power_levels[2]]
+        )
+
+        self.store = CountingStateResolutionStore(
+            {
+                event.event_id: event
+                for event in [create, member, *self.power_levels]
+                + [self.old_topic, self.topic]
+            }
+        )
+
+    def mainline_sort(self) -> List[str]:
+        self.store.fetched.clear()
+        return self.successResultOf(
+            defer.ensureDeferred(
+                _mainline_sort(
+                    FakeClock(),
+                    ROOM_ID,
+                    [self.topic.event_id, self.old_topic.event_id],
+                    self.power_levels[-1].event_id,
+                    {
+                        self.topic.event_id: self.topic,
+                        self.old_topic.event_id: self.old_topic,
+                    },
+                    self.store,
+                )
+            )
+        )
+
+    def test_mainline_sort(self) -> None:
+        expected = [self.old_topic.event_id, self.topic.event_id]
+
+        self.assertEqual(self.mainline_sort(), expected)
+        self.assertTrue(self.store.fetched)
+
+        # The mainline and the power levels events of the sorted events are cached
+        self.assertEqual(self.mainline_sort(), expected)
+        self.assertEqual(self.store.fetched, [])
+        self.assertEqual(
+            self.store.mainline_positions_cache.get(self.power_levels[-1].event_id),
+            {event.event_id: i + 1 for i, event in enumerate(self.power_levels)},
+        )
+
+    def test_power_level_for_sender(self) -> None:
+        for _ in range(2):
+            self.store.fetched.clear()
+            level = self.successResultOf(
+                defer.ensureDeferred(
+                    _get_power_level_for_sender(
+                        ROOM_ID,
+                        self.topic.event_id,
+                        {self.topic.event_id: self.topic},
+                        self.store,
+                    )
+                )
+            )
+            self.assertEqual(level, 98)
+
+        # Only the power levels event is fetched once its ID is cached
+        self.assertEqual(self.store.fetched, [self.power_levels[2].event_id])
+
+    def test_missing_power_levels_event_not_cached(self) -> None:
+        del self.store.event_map[self.power_levels[0].event_id]
+
+        self.successResultOf(
+            defer.ensureDeferred(
+                _get_power_level_for_sender(
+                    ROOM_ID,
+                    self.old_topic.event_id,
+                    {self.old_topic.event_id: self.old_topic},
+                    self.store,
+                )
+            )
+        )
+
+        self.assertNotIn(self.old_topic.event_id, self.store.power_levels_auth_cache)
+
+    def test_cached_power_levels_event_missing(self) -> None:
+        def get_power_level_for_sender() -> int:
+            return self.successResultOf(
+                defer.ensureDeferred(
+                    _get_power_level_for_sender(
+                        ROOM_ID,
+                        self.old_topic.event_id,
+                        {self.old_topic.event_id: self.old_topic},
+                        self.store,
+                    )
+                )
+            )
+
+        self.assertEqual(get_power_level_for_sender(), 100)
+        del self.store.event_map[self.power_levels[0].event_id]
+
+        # The power levels event is looked up again rather than failing
+        self.assertEqual(get_power_level_for_sender(), 0)
+        self.assertNotIn(self.old_topic.event_id, self.store.power_levels_auth_cache)
@@ -367,7 +367,13 @@ class StateStoreTestCase(HomeserverTestCase):
         # deliberately remove e2 (room name) from the _state_group_cache
 
         cache_entry = self.state_datastore._state_group_cache.get(group)
+        """ watcha!
         state_dict_ids = cache_entry.value
+        !watcha """
+        # watcha+
+        # The cached state is immutable
+        state_dict_ids = dict(cache_entry.value)
+        # +watcha
 
         self.assertEqual(cache_entry.full, True)
         self.assertEqual(cache_entry.known_absent, set())
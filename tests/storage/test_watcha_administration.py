@@ -111,9 +111,107 @@ class AdministrationTestCase(unittest.HomeserverTestCase):
             self.assertEquals(is_partner, element["values"]["is_partner"])
             self.assertEquals(is_admin, element["values"]["is_admin"])
 
+    def test_user_role_flags_follow_role_updates(self):
+        user_id = "@partner:test"
+        self.assertEquals(
+            self.get_success(self.store.get_user_role_flags(user_id)), (False, False)
+        )
+
+        self.get_success(self.store.register_user(user_id, make_partner=True))
+        self.assertEquals(
+            self.get_success(self.store.get_user_role_flags(user_id)), (False, True)
+        )
+
+        self.get_success(self.store.update_user_role(user_id, "administrator"))
+        self.assertEquals(
+            self.get_success(self.store.get_user_role_flags(user_id)), (True, False)
+        )
+
     @patch("builtins.open", new_callable=mock_open, read_data=SETUP_PROPERTIES)
     def test_get_install_information_from_file(self, mock_file):
         install_information = self.store._get_install_information_from_file()
         self.assertEqual("1.0", install_information["watcha_release"])
         self.assertEqual("2020-03-16T18:32:18", install_information["install_date"])
         self.assertEqual("2020-06-16T22:43:29", install_information["upgrade_date"])
+
+    def test_direct_rooms_follow_account_data(self):
+        user_id = "@collaborator:test"
+
+        def get_direct_rooms():
+            return set(
+                self.get_success(
+                    self.store.db_pool.simple_select_onecol(
+                        table="watcha_direct_rooms",
+                        keyvalues={"user_id": user_id},
+                        retcol="room_id",
+                    )
+                )
+            )
+
+        self.get_success(
+            self.store.add_account_data_for_user(
+                user_id, "m.direct", {"@partner:test": ["!room1:test", "!room2:test"]}
+            )
+        )
+        self.assertEqual(get_direct_rooms(), {"!room1:test", "!room2:test"})
+
+        self.get_success(
+            self.store.add_account_data_for_user(
+                user_id, "m.direct", {"@partner:test": ["!room2:test"]}
+            )
+        )
+        self.assertEqual(get_direct_rooms(), {"!room2:test"})
+
+        self.get_success(self.store.remove_account_data_for_user(user_id, "m.direct"))
+        self.assertEqual(get_direct_rooms(), set())
+
+    def test_watcha_user_list_search_and_pagination(self):
+        for localpart in ("alice", "bob", "carol"):
+            self.get_success(
+                self.store.register_user(
+                    f"@{localpart}:test",
+                    create_profile_with_displayname=localpart.capitalize(),
+                )
+            )
+
+        users = self.get_success(self.store.watcha_user_list(search_term="ALI"))
+        self.assertEqual([user["user_id"] for user in users], ["@alice:test"])
+
+        users = self.get_success(self.store.watcha_user_list(limit=2))
+        self.assertEqual(
+            [user["user_id"] for user in users], ["@alice:test", "@bob:test"]
+        )
+
+        users = self.get_success(
+            self.store.watcha_user_list(from_user_id="@bob:test", limit=2)
+        )
+        self.assertEqual([user["user_id"] for user in users], ["@carol:test"])
+
+    def test_watcha_user_list_last_seen(self):
+        user_id = "@collaborator:test"
+        self.get_success(self.store.register_user(user_id))
+
+        self.get_success(
+            self.store.insert_client_ip(
+                user_id, "access_token", "ip", "user_agent", "device_id"
+            )
+        )
+        self.reactor.advance(10)
+
+        users = self.get_success(self.store.watcha_user_list())
+        self.assertEqual(users[0]["last_seen"], self.time)
+
+    def test_get_disk_usage(self):
+        self.assertIsNone(self.get_success(self.store._get_disk_usage()))
+
+        self.get_success(
+            self.store.set_media_usage({"local": 3 * 1024 * 1024, "remote": 0})
+        )
+        self.get_success(self.store.update_media_usage("remote", 512 * 1024))
+        self.get_success(self.store.update_media_usage("thumbnails", 512 * 1024))
+
+        self.assertEqual(
+            self.get_success(self.store.get_media_usage()),
+            {"local": 3 * 1024 * 1024, "remote": 512 * 1024, "thumbnails": 512 * 1024},
+        )
+        self.assertEqual(self.get_success(self.store._get_disk_usage()), "4.0M")
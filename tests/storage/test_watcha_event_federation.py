@@ -0,0 +1,38 @@
+from unittest.mock import AsyncMock, patch
+
+from tests.unittest import HomeserverTestCase
+
+ROOM_ID = "!room:test"
+
+
+class AuthChainDifferenceCacheTestCase(HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastores().main
+
+    def get_auth_chain_difference(self, state_sets):
+        return self.get_success(
+            self.store.get_auth_chain_difference(ROOM_ID, state_sets)
+        )
+
+    def test_auth_chain_difference_cached(self):
+        compute = AsyncMock(side_effect=lambda room_id, state_sets: {"$a", "$b"})
+
+        with patch.object(self.store, "_compute_auth_chain_difference", new=compute):
+            difference = self.get_auth_chain_difference([{"$a"}, {"$b", "$c"}])
+            # The difference does not depend on the order of the state sets
+            difference.add("$resolved")
+            cached = self.get_auth_chain_difference([{"$c", "$b"}, {"$a"}])
+
+        self.assertEqual(compute.call_count, 1)
+        # The cached difference is returned as a copy, which the caller can update
+        self.assertEqual(cached, {"$a", "$b"})
+
+    def test_auth_chain_difference_by_state_sets(self):
+        compute = AsyncMock(side_effect=lambda room_id, state_sets: set())
+
+        with patch.object(self.store, "_compute_auth_chain_difference", new=compute):
+            self.get_auth_chain_difference([{"$a"}, {"$b"}])
+            self.get_auth_chain_difference([{"$a"}, {"$b"}, {"$c"}])
+            self.get_auth_chain_difference([{"$a", "$b"}])
+
+        self.assertEqual(compute.call_count, 3)
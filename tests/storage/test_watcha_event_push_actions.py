@@ -0,0 +1,78 @@
+from synapse.api.constants import ReceiptTypes
+from synapse.rest import admin
+from synapse.rest.client import login, read_marker, room
+
+from tests import unittest
+
+
+class UnreadCountsByRoomsTestCase(unittest.HomeserverTestCase):
+
+    servlets = [
+        admin.register_servlets_for_client_rest_resource,
+        login.register_servlets,
+        read_marker.register_servlets,
+        room.register_servlets,
+    ]
+
+    def prepare(self, reactor, clock, hs):
+        self.store = hs.get_datastores().main
+
+        self.user = self.register_user("user", "pass")
+        self.tok = self.login("user", "pass")
+        self.other = self.register_user("other", "pass")
+        self.other_tok = self.login("other", "pass")
+
+        self.room_ids = []
+        for messages in range(3):
+            room_id = self.helper.create_room_as(self.other, tok=self.other_tok)
+            self.helper.join(room_id, self.user, tok=self.tok)
+            for i in range(messages):
+                self.last_event_id = self.helper.send(
+                    room_id, f"message {i}", tok=self.other_tok
+                )["event_id"]
+            self.room_ids.append(room_id)
+
+    def get_batched_counts(self):
+        # Bypass the cache filled by the previous lookups
+        self.store.get_unread_event_push_actions_by_room_for_user.invalidate_all()
+        return self.get_success(
+            self.store.get_unread_event_push_actions_by_rooms_for_user(
+                self.room_ids, self.user
+            )
+        )
+
+    def get_counts(self, room_id):
+        self.store.get_unread_event_push_actions_by_room_for_user.invalidate_all()
+        return self.get_success(
+            self.store.get_unread_event_push_actions_by_room_for_user(
+                room_id, self.user
+            )
+        )
+
+    def test_batched_unread_counts(self):
+        counts = self.get_batched_counts()
+
+        self.assertEqual(
+            [counts[room_id].main_timeline.notify_count for room_id in self.room_ids],
+            [0, 1, 2],
+        )
+        for room_id in self.room_ids:
+            self.assertEqual(counts[room_id], self.get_counts(room_id))
+
+    def test_batched_unread_counts_after_receipt(self):
+        channel = self.make_request(
+            "POST",
+            f"/rooms/{self.room_ids[2]}/read_markers",
+            {ReceiptTypes.READ: self.last_event_id},
+            access_token=self.tok,
+        )
+        self.assertEqual(channel.code, 200, channel.json_body)
+
+        counts = self.get_batched_counts()
+
+        self.assertEqual(
+            [counts[room_id].main_timeline.notify_count for room_id in self.room_ids],
+            [0, 1, 0],
+        )
+        for room_id in self.room_ids:
+            self.assertEqual(counts[room_id], self.get_counts(room_id))
@@ -26,3 +26,53 @@ class NextcloudStorageTestCase(unittest.HomeserverTestCase):
         share_id = self.get_success(self.store.get_share_id(self.room_id))
 
         self.assertEquals(share_id, new_share_id)
+
+    def test_get_usernames(self):
+        self.get_success(
+            self.store.record_user_external_id("oidc", "1234", "@user1:test", "user1")
+        )
+        usernames = self.get_success(
+            self.store.get_usernames(["@user1:test", "@user2:test"])
+        )
+
+        self.assertEquals(usernames, {"@user1:test": "user1", "@user2:test": None})
+
+    def test_get_username_is_invalidated_on_record(self):
+        self.assertIsNone(self.get_success(self.store.get_username("@user1:test")))
+
+        self.get_success(
+            self.store.record_user_external_id("oidc", "1234", "@user1:test", "user1")
+        )
+
+        self.assertEquals(
+            self.get_success(self.store.get_username("@user1:test")), "user1"
+        )
+
+    def test_get_username_is_invalidated_on_remove(self):
+        self.get_success(
+            self.store.record_user_external_id("oidc", "1234", "@user1:test", "user1")
+        )
+        self.assertEquals(
+            self.get_success(self.store.get_usernames(["@user1:test"])),
+            {"@user1:test": "user1"},
+        )
+
+        self.get_success(
+            self.store.remove_user_external_id("oidc", "1234", "@user1:test")
+        )
+
+        self.assertIsNone(self.get_success(self.store.get_username("@user1:test")))
+        self.assertEquals(
+            self.get_success(self.store.get_usernames(["@user1:test"])),
+            {"@user1:test": None},
+        )
+
+    def test_get_shares_to_reconcile(self):
+        self.get_success(self.store.register_share("room2", 2))
+        self.get_success(self.store.set_share_reconciled(self.room_id, 1000))
+
+        room_ids = self.get_success(self.store.get_shares_to_reconcile(2000, 10))
+        self.assertEquals(room_ids, ["room2", self.room_id])
+
+        room_ids = self.get_success(self.store.get_shares_to_reconcile(1000, 10))
+        self.assertEquals(room_ids, ["room2"])
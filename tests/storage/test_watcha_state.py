@@ -0,0 +1,182 @@
+from synapse.api.constants import EventTypes
+
+from tests.unittest import HomeserverTestCase, override_config
+
+ROOM_ID = "!room:test"
+
+
+class StateDeltasFromGroupTestCase(HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.state_datastore = hs.get_storage_controllers().state.stores.state
+
+    def store_state_group(self, prev_group=None, delta_ids=None, state_ids=None):
+        return self.get_success(
+            self.state_datastore.store_state_group(
+                "$event", ROOM_ID, prev_group, delta_ids, state_ids
+            )
+        )
+
+    def test_state_deltas_from_group(self):
+        group1 = self.store_state_group(
+            state_ids={(EventTypes.Create, ""): "$create", (EventTypes.Name, ""): "$n1"}
+        )
+        group2 = self.store_state_group(group1, {(EventTypes.Name, ""): "$n2"})
+        group3 = self.store_state_group(
+            group2, {(EventTypes.Name, ""): "$n3", (EventTypes.Topic, ""): "$t1"}
+        )
+
+        deltas = self.get_success(
+            self.state_datastore.get_state_deltas_from_group(
+                group1, [group1, group2, group3]
+            )
+        )
+
+        self.assertEqual(
+            deltas,
+            {
+                group1: {},
+                group2: {(EventTypes.Name, ""): "$n2"},
+                group3: {(EventTypes.Name, ""): "$n3", (EventTypes.Topic, ""): "$t1"},
+            },
+        )
+
+    def test_no_state_deltas_from_unrelated_group(self):
+        group1 = self.store_state_group(state_ids={(EventTypes.Create, ""): "$create"})
+        group2 = self.store_state_group(group1, {(EventTypes.Name, ""): "$n1"})
+        group3 = self.store_state_group(state_ids={(EventTypes.Create, ""): "$create"})
+
+        # A group which does not descend from the other
+        self.assertIsNone(
+            self.get_success(
+                self.state_datastore.get_state_deltas_from_group(group1, [group3])
+            )
+        )
+        # An ancestor
+        self.assertIsNone(
+            self.get_success(
+                self.state_datastore.get_state_deltas_from_group(group2, [group1])
+            )
+        )
+
+
+class StateCompressorTestCase(HomeserverTestCase):
+    def prepare(self, reactor, clock, hs):
+        self.state_datastore = hs.get_storage_controllers().state.stores.state
+
+        self.groups = []
+        self.store_chain(20)
+
+    def store_chain(self, length):
+        """Store a chain of groups, each one changing the name of the room."""
+        for i in range(length):
+            if self.groups:
+                prev_group = self.groups[-1]
+                delta_ids = {(EventTypes.Name, ""): f"$name{len(self.groups)}"}
+                state_ids = None
+            else:
+                prev_group = delta_ids = None
+                state_ids = {(EventTypes.Create, ""): "$create"}
+            self.groups.append(
+                self.get_success(
+                    self.state_datastore.store_state_group(
+                        "$event", ROOM_ID, prev_group, delta_ids, state_ids
+                    )
+                )
+            )
+
+    def get_states_and_hops(self):
+        def get_states_and_hops_txn(txn):
+            return (
+                self.state_datastore._get_state_groups_from_groups_txn(
+                    txn, self.groups
+                ),
+                {
+                    group: self.state_datastore._count_state_group_hops_txn(
+                        txn, group
+                    )
+                    for group in self.groups
+                },
+            )
+
+        return self.get_success(
+            self.state_datastore.db_pool.runInteraction(
+                "get_states_and_hops", get_states_and_hops_txn
+            )
+        )
+
+    def compress(self):
+        self.get_success(self.state_datastore.queue_state_compression())
+        self.wait_for_background_updates()
+
+    @override_config({"watcha": {"state_compressor_levels": [3, 3]}})
+    def test_compress_state_groups(self):
+        # A snapshot with less state than the groups before it
+        self.groups.append(
+            self.get_success(
+                self.state_datastore.store_state_group(
+                    "$event", ROOM_ID, None, None, {(EventTypes.Create, ""): "$c2"}
+                )
+            )
+        )
+        states, hops = self.get_states_and_hops()
+        self.assertEqual(max(hops.values()), 19)
+
+        self.compress()
+
+        compressed_states, compressed_hops = self.get_states_and_hops()
+        self.assertEqual(compressed_states, states)
+        self.assertLessEqual(max(compressed_hops.values()), 5)
+        self.assertEqual(compressed_hops[self.groups[-1]], 0)
+
+    @override_config({"watcha": {"state_compressor_levels": [3, 3]}})
+    def test_compress_state_groups_created_later(self):
+        self.compress()
+        self.store_chain(10)
+        states, _ = self.get_states_and_hops()
+
+        self.compress()
+
+        compressed_states, compressed_hops = self.get_states_and_hops()
+        self.assertEqual(compressed_states, states)
+        self.assertLessEqual(max(compressed_hops.values()), 5)
+        self.assertEqual(
+            self.get_success(
+                self.state_datastore.db_pool.simple_select_one_onecol(
+                    "watcha_state_compressor_rooms",
+                    {"room_id": ROOM_ID},
+                    "last_state_group",
+                )
+            ),
+            self.groups[-1],
+        )
+
+    @override_config({"watcha": {"state_compressor_levels": [3, 3]}})
+    def test_purge_compressed_state_groups(self):
+        self.compress()
+        states, _ = self.get_states_and_hops()
+        purged_group = self.groups.pop(2)
+
+        self.get_success(
+            self.state_datastore.purge_unreferenced_state_groups(
+                ROOM_ID, [purged_group]
+            )
+        )
+
+        purged_states, _ = self.get_states_and_hops()
+        del states[purged_group]
+        self.assertEqual(purged_states, states)
+
+    @override_config(
+        {
+            "watcha": {
+                "state_compressor_enabled": True,
+                "state_compressor_levels": [3, 3],
+            }
+        }
+    )
+    def test_queue_state_compression_at_startup(self):
+        self.reactor.advance(1)
+        self.wait_for_background_updates()
+
+        _, hops = self.get_states_and_hops()
+        self.assertLessEqual(max(hops.values()), 5)
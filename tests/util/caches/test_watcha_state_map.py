@@ -0,0 +1,92 @@
+from synapse.util.caches.dictionary_cache import DictionaryCache
+from synapse.util.caches.watcha_state_map import SharedStateMap, SharedStateMapSizer
+
+from tests import unittest
+
+
+def make_state(members):
+    state = {("m.room.create", ""): "$create", ("m.room.name", ""): "$name"}
+    for i in range(members):
+        state[("m.room.member", f"@user{i}:test")] = f"$member{i}"
+    return state
+
+
+class SharedStateMapTestCase(unittest.TestCase):
+    def test_mapping(self) -> None:
+        state = make_state(100)
+        state_map = SharedStateMap(state)
+
+        self.assertEqual(len(state_map), len(state))
+        self.assertEqual(state_map.to_dict(), state)
+        self.assertEqual(dict(state_map), state)
+        self.assertEqual(state_map, state)
+        self.assertEqual(state_map[("m.room.member", "@user5:test")], "$member5")
+        self.assertNotIn(("m.room.member", "@unknown:test"), state_map)
+        self.assertIsNone(state_map.get(("m.room.topic", "")))
+
+    def test_empty(self) -> None:
+        state_map = SharedStateMap({})
+
+        self.assertEqual(len(state_map), 0)
+        self.assertEqual(state_map.to_dict(), {})
+
+    def test_sharing(self) -> None:
+        sizer = SharedStateMapSizer()
+        state = make_state(1000)
+        parent = SharedStateMap(state)
+
+        state[("m.room.member", "@user5:test")] = "$leave5"
+        state[("m.room.topic", "")] = "$topic"
+        child = SharedStateMap(state)
+
+        self.assertEqual(child.to_dict(), state)
+        self.assertEqual(dict(child.items()), state)
+        self.assertEqual(parent[("m.room.member", "@user5:test")], "$member5")
+        # The child is only charged for the buckets holding the changed entries
+        self.assertGreater(sizer(parent), len(make_state(1000)))
+        self.assertLess(sizer(child), 100)
+        # The buckets the parent shares with the child stay charged while the
+        # child is cached
+        self.assertLess(sizer(parent), 100)
+        self.assertGreater(sizer(child), len(make_state(1000)))
+
+    def test_sizer_of_collected_maps(self) -> None:
+        sizer = SharedStateMapSizer()
+        state = make_state(100)
+        state_map = SharedStateMap(state)
+        sizer(state_map)
+
+        # A map dropped without being discharged, as when the cache is cleared, is
+        # discharged once collected
+        del state_map
+        self.assertGreater(sizer(SharedStateMap(state)), len(state))
+
+    def test_dictionary_cache_size(self) -> None:
+        cache: DictionaryCache[int, tuple, str] = DictionaryCache(
+            "test_watcha_state_map",
+            max_entries=2000,
+            size_callback=SharedStateMapSizer(),
+        )
+
+        state = make_state(1000)
+        for group in range(10):
+            state[("m.room.member", f"@user{group}:test")] = f"$leave{group}"
+            cache.update(cache.sequence, group, SharedStateMap(state))
+
+        # All the groups fit, as they share most of their state
+        for group in range(10):
+            entry = cache.get(group)
+            self.assertTrue(entry.full)
+            self.assertEqual(
+                entry.value[("m.room.member", f"@user{group}:test")], f"$leave{group}"
+            )
+        self.assertEqual(
+            cache.get(9, [("m.room.member", "@user0:test")]).value,
+            {("m.room.member", "@user0:test"): "$leave0"},
+        )
+        self.assertLess(len(cache.cache), 1500)
+
+        # The entries the first group shares with the others are still counted once
+        # it is evicted
+        cache.invalidate(0)
+        self.assertGreater(len(cache.cache), len(state))